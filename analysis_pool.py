@@ -0,0 +1,72 @@
+# analysis_pool.py
+"""
+Bounded thread pool for a job's independent analysis work.
+
+A style-transfer job analyzes its target and its reference and finds the
+target's loop. None of them needs another's result, so they run side by
+side here. Threads rather than processes: the decoded input is shared
+instead of pickled to a child, spans still reach the job's collector, and
+the heavy parts (libsndfile decoding, numpy's FFTs, BLAS) release the GIL.
+
+Each Celery worker process has its own pool. ANALYSIS_POOL_SIZE sets its
+size; by default the machine's cores are split evenly between the worker's
+processes (see configure), so concurrent jobs don't oversubscribe the CPU.
+A pool of one runs the calls in turn, in the caller's thread.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_lock = threading.Lock()
+_executor = None
+_executor_size = None
+_worker_processes = 1
+
+def configure(worker_processes):
+    """Sets how many processes of this worker share the machine's cores."""
+    global _worker_processes
+    _worker_processes = max(1, int(worker_processes or 1))
+
+def pool_size():
+    size = int(os.environ.get('ANALYSIS_POOL_SIZE', 0))
+    if size > 0:
+        return size
+    return max(1, (os.cpu_count() or 1) // _worker_processes)
+
+def _get_executor(size):
+    global _executor, _executor_size
+    with _lock:
+        if _executor_size != size:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='analysis')
+            _executor_size = size
+        return _executor
+
+def _reset_after_fork():
+    # Threads don't survive fork(); each Celery worker process starts its own pool.
+    global _executor, _executor_size, _lock
+    _executor = None
+    _executor_size = None
+    _lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def run(calls):
+    """
+    Runs each of calls (functions without arguments) and returns their
+    results in order, concurrently if the pool has more than one thread.
+    Each runs in a copy of the caller's context. The first exception raised
+    is re-raised once all have finished.
+    """
+    size = pool_size()
+    if size == 1 or len(calls) < 2:
+        return [call() for call in calls]
+    executor = _get_executor(size)
+    futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# analysis_store.py
+"""
+Persistent store of audio analysis results, keyed by the SHA-256 of the file
+contents. Rows written by an older version of the feature code are ignored,
+so bumping audio_processor.ANALYSIS_VERSION invalidates them.
+
+Loop windows found by loop detection are kept here too, so a preview and the
+full render of the same upload scan the file only once.
+
+Also usable as a command to pre-analyze a directory of reference tracks:
+
+    python analysis_store.py path/to/references --recursive
+"""
+import argparse
+import json
+import os
+import time
+
+import sqlite_store
+from result_cache import hash_file
+
+DEFAULT_DB_PATH = 'slushwave-vaporizer/backend/analysis.sqlite3'
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.m4a', '.aiff', '.aif')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS analysis ('
+    ' content_hash TEXT PRIMARY KEY,'
+    ' version INTEGER NOT NULL,'
+    ' features TEXT NOT NULL,'
+    ' summaries TEXT NOT NULL,'
+    ' created_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS loops ('
+    ' content_hash TEXT NOT NULL,'
+    ' duration_seconds REAL NOT NULL,'
+    ' start_sample INTEGER NOT NULL,'
+    ' end_sample INTEGER NOT NULL,'
+    ' samplerate INTEGER NOT NULL,'
+    ' created_at REAL NOT NULL,'
+    ' PRIMARY KEY (content_hash, duration_seconds))',
+)
+
+def _execute(sql, params=(), fetch=False, db_path=None):
+    db_path = db_path or os.environ.get('ANALYSIS_DB_PATH', DEFAULT_DB_PATH)
+    return sqlite_store.execute(db_path, SCHEMA, sql, params, fetch, name='Analysis store')
+
+def get(content_hash, version, db_path=None):
+    """
+    Returns {'features': ..., 'summaries': ...} for content_hash if it was
+    stored by the given analysis version, otherwise None.
+    """
+    rows = _execute(
+        'SELECT features, summaries FROM analysis WHERE content_hash = ? AND version = ?',
+        (content_hash, version), fetch=True, db_path=db_path
+    )
+    if not rows:
+        return None
+    return {'features': json.loads(rows[0][0]), 'summaries': json.loads(rows[0][1])}
+
+def put(content_hash, version, features, summaries, db_path=None):
+    """Stores (or replaces) the analysis for content_hash. Failures are logged, never raised."""
+    return _execute(
+        'INSERT OR REPLACE INTO analysis (content_hash, version, features, summaries, created_at)'
+        ' VALUES (?, ?, ?, ?, ?)',
+        (content_hash, version, json.dumps(features), json.dumps(summaries), time.time()), db_path=db_path
+    )
+
+def get_loop(content_hash, duration_seconds, db_path=None):
+    """Returns the stored (start_sample, end_sample, samplerate) loop window of content_hash, or None."""
+    rows = _execute(
+        'SELECT start_sample, end_sample, samplerate FROM loops WHERE content_hash = ? AND duration_seconds = ?',
+        (content_hash, duration_seconds), fetch=True, db_path=db_path
+    )
+    return tuple(rows[0]) if rows else None
+
+def put_loop(content_hash, duration_seconds, start_sample, end_sample, samplerate, db_path=None):
+    """Stores the loop window found for content_hash. Failures are logged, never raised."""
+    return _execute(
+        'INSERT OR REPLACE INTO loops'
+        ' (content_hash, duration_seconds, start_sample, end_sample, samplerate, created_at)'
+        ' VALUES (?, ?, ?, ?, ?, ?)',
+        (content_hash, duration_seconds, int(start_sample), int(end_sample), int(samplerate), time.time()),
+        db_path=db_path
+    )
+
+def find_audio_files(directory, recursive=False):
+    """Lists audio files in directory, optionally descending into subdirectories."""
+    if recursive:
+        paths = (os.path.join(root, name) for root, _dirs, names in os.walk(directory) for name in names)
+    else:
+        paths = (os.path.join(directory, name) for name in os.listdir(directory))
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(AUDIO_EXTENSIONS))
+
+def preanalyze_directory(directory, recursive=False):
+    """
+    Analyzes every audio file in directory that isn't already in the store.
+    Returns (analyzed, already_stored, failed) counts.
+    """
+    from audio_processor import analyze_audio, ANALYSIS_VERSION
+    analyzed = already_stored = failed = 0
+    for path in find_audio_files(directory, recursive):
+        content_hash = hash_file(path)
+        if get(content_hash, ANALYSIS_VERSION) is not None:
+            already_stored += 1
+        elif analyze_audio(path, use_store=True, content_hash=content_hash) is None:
+            failed += 1
+            print(f"Failed: {path}")
+        else:
+            analyzed += 1
+            print(f"Analyzed: {path}")
+    return analyzed, already_stored, failed
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Pre-analyzes a directory of reference tracks into the persistent analysis store.",
+    )
+    parser.add_argument("directory", help="Directory containing audio files.", type=str)
+    parser.add_argument(
+        "-r", "--recursive", dest="recursive", help="Include subdirectories.", action="store_true"
+    )
+    parser.add_argument(
+        "--db",
+        dest="db_path",
+        help="Path of the SQLite analysis store.",
+        type=str,
+        default=os.environ.get('ANALYSIS_DB_PATH', DEFAULT_DB_PATH),
+    )
+    args = parser.parse_args()
+
+    os.environ['ANALYSIS_DB_PATH'] = args.db_path
+    analyzed, already_stored, failed = preanalyze_directory(args.directory, args.recursive)
+    print(f"Pre-analysis finished. Analyzed {analyzed}, already stored {already_stored}, failed {failed}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,50 @@
 # app.py
-from flask import Flask, request, jsonify, url_for, send_from_directory
+from flask import Flask, Response, request, jsonify, redirect, url_for, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
 from werkzeug.utils import secure_filename
+import json
+import mimetypes
 import os
 import uuid
-from tasks import celery_app, slushify_task, adjust_task
+from celery import group
+from tasks import celery_app, slushify_task, adjust_task, slushify_queue, QUEUE_CONCURRENCY
+import result_cache
+import progress
+import cost_model
+import uploads
+import output_index
+import storage
+import output_formats
+import preset_registry
+import spans
 
 # Serve the built React app
 app = Flask(__name__, static_folder='build', static_url_path='/')
+app.request_class = uploads.UploadRequest
 CORS(app, resources={r"/api/*": {"origins": "*"}}) # Be more specific about CORS
 
 app.config['UPLOAD_FOLDER'] = 'slushwave-vaporizer/backend/uploads'
-app.config['OUTPUT_FOLDER'] = 'slushwave-vaporizer/backend/outputs'
+app.config['OUTPUT_FOLDER'] = storage.OUTPUT_DIR
+# Hand output downloads to the front-end server instead of streaming them from
+# a Flask worker: X-Sendfile (Apache, lighttpd) or nginx's X-Accel-Redirect,
+# with an `internal` location aliased to the outputs folder at this prefix.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+app.config['SSE_KEEPALIVE_SECONDS'] = 15
+app.config['STREAM_POLL_SECONDS'] = 1
+app.config['STREAM_CHUNK_SIZE'] = 64 * 1024
+app.config['BATCH_MAX_FILES'] = 1000
+# Per uploaded file; larger uploads are cut off with a 413 while streaming.
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_BYTES', 500 * 1024 ** 2))
+# Admission control: jobs estimated above the budget (worker seconds) are
+# rejected, deferred behind all other work, or downsampled (then deferred if
+# still over budget).
+app.config['JOB_BUDGET_SECONDS'] = float(os.environ.get('JOB_BUDGET_SECONDS', 600))
+app.config['ADMISSION_POLICY'] = os.environ.get('ADMISSION_POLICY', 'defer')
+app.config['DOWNSAMPLE_RATE'] = int(os.environ.get('DOWNSAMPLE_RATE', 22050))
+# Longest excerpt a preview (preview=true on /api/slushify) may ask for.
+app.config['PREVIEW_MAX_SECONDS'] = float(os.environ.get('PREVIEW_MAX_SECONDS', 30))
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 # Ensure the static folder exists
@@ -19,6 +52,11 @@ if not os.path.exists(app.static_folder):
     os.makedirs(app.static_folder)
 
 
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_rejected(e):
+    return jsonify(error=e.description), e.code
+
 # --- API Routes ---
 @app.route('/api/hello', methods=['GET'])
 def hello():
@@ -26,13 +64,31 @@ def hello():
 
 @app.route('/api/presets', methods=['GET'])
 def get_presets():
-    from audio_processor import PRESETS
-    preset_data = {name: details['description'] for name, details in PRESETS.items()}
+    preset_data = {name: details['description'] for name, details in preset_registry.get_presets().items()}
     return jsonify(preset_data)
 
+def _serve_output(location):
+    """
+    Response for a stored output: a redirect to remote storage, an internal
+    redirect for the front-end server, or the file itself with Range support.
+    """
+    output_storage = storage.get_storage()
+    url = output_storage.url(location)
+    if url:
+        return redirect(url)
+    if not output_storage.exists(location):
+        return jsonify(error="Output file not found."), 404
+    prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+    if prefix:
+        response = Response(mimetype=mimetypes.guess_type(location)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{output_storage.relative_path(location)}"
+        return response
+    # Honours USE_X_SENDFILE; otherwise werkzeug answers Range requests itself.
+    return send_file(os.path.abspath(location), conditional=True)
+
 @app.route('/api/outputs/<path:filename>')
 def serve_output_file(filename):
-    return send_from_directory(os.path.abspath(app.config['OUTPUT_FOLDER']), filename)
+    return _serve_output(storage.get_storage().location(secure_filename(filename)))
 
 @app.route('/api/slushify', methods=['POST'])
 def slushify():
@@ -43,48 +99,483 @@ def slushify():
     preset = request.form.get('preset', 'slushwave')
     if file.filename == '':
         return jsonify(error="No selected file"), 400
+    backend = request.form.get('backend')
+    if backend:
+        from audio_processor import EFFECT_BACKENDS
+        if backend not in EFFECT_BACKENDS:
+            return jsonify(error=f"Unknown backend: {backend}"), 400
     if file:
         filename = secure_filename(file.filename)
         temp_input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{filename}")
-        file.save(temp_input_path)
-        reference_path = None
+        input_hash = uploads.save(file, temp_input_path)
+        reference_path = reference_hash = None
         if 'reference_file' in request.files:
             reference_file = request.files['reference_file']
             if reference_file.filename != '':
                 ref_filename = secure_filename(reference_file.filename)
                 reference_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{ref_filename}")
-                reference_file.save(reference_path)
+                try:
+                    reference_hash = uploads.save(reference_file, reference_path)
+                except UnsupportedMediaType:
+                    os.remove(temp_input_path)
+                    raise
         options = {'preset': preset}
-        task = slushify_task.delay(temp_input_path, filename, options, reference_path)
+        if backend:
+            options['backend'] = backend
+        error = _parse_streaming(options) or _parse_formats(options) or _parse_preview(options)
+        if error:
+            for path in (temp_input_path, reference_path):
+                if path:
+                    os.remove(path)
+            return jsonify(error=error), 400
+
+        # Serve repeat uploads of the same audio and settings from the result cache.
+        cache_key, result_id, output_path = _lookup_result_cache(
+            temp_input_path, input_hash, filename, options, reference_path, reference_hash
+        )
+        if result_id:
+            return jsonify(
+                task_id=result_id,
+                status_url=url_for('taskstatus', task_id=result_id, _external=True),
+                state='SUCCESS',
+                result=output_path,
+                cached=True
+            ), 200
+
+        # Pre-flight from the file headers: estimate the job and apply the budget.
+        decision, estimate = _admit(temp_input_path, options, reference_path)
+        if decision == 'reject':
+            for path in (temp_input_path, reference_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            return jsonify(
+                error="This job is too large to process right now.",
+                estimated_seconds=round(estimate, 1),
+                budget_seconds=app.config['JOB_BUDGET_SECONDS']
+            ), 413
+        if 'max_sample_rate' in options and cache_key:
+            # The downsampled render is a different result from the full one,
+            # and may be cached from an earlier upload of the same file.
+            cache_key, result_id, output_path = _lookup_result_cache(
+                temp_input_path, input_hash, filename, options, reference_path, reference_hash
+            )
+            if result_id:
+                return jsonify(
+                    task_id=result_id,
+                    status_url=url_for('taskstatus', task_id=result_id, _external=True),
+                    state='SUCCESS',
+                    result=output_path,
+                    cached=True,
+                    admission=decision
+                ), 200
+
+        queue = slushify_queue(reference_path, options)
+        backlog = cost_model.pending_seconds(queue)
+        if decision == 'defer':
+            task = slushify_task.apply_async(
+                (temp_input_path, filename, options, reference_path),
+                {'cache_key': cache_key, 'content_hash': input_hash},
+                priority=cost_model.PRIORITY_STEPS - 1
+            )
+        else:
+            task = slushify_task.delay(
+                temp_input_path, filename, options, reference_path, cache_key=cache_key, content_hash=input_hash
+            )
+        cost_model.add_pending(task.id, queue, estimate)
         return jsonify(
             task_id=task.id,
-            status_url=url_for('taskstatus', task_id=task.id, _external=True)
+            status_url=url_for('taskstatus', task_id=task.id, _external=True),
+            admission=decision,
+            estimated_seconds=round(estimate, 1),
+            eta_seconds=round(backlog / QUEUE_CONCURRENCY[queue] + estimate, 1)
         ), 202
 
-@app.route('/api/status/<task_id>')
-def taskstatus(task_id):
-    # ... (logic is unchanged)
-    task = celery_app.AsyncResult(task_id)
+def _admit(temp_input_path, options, reference_path=None):
+    """
+    Admission control for a slushify job. Returns (decision, estimated
+    seconds), where decision is 'accept', 'defer', 'downsample' or 'reject';
+    a downsample sets options['max_sample_rate'].
+    """
+    try:
+        estimate = cost_model.estimate_job(temp_input_path, options, reference_path)
+    except Exception as e:
+        print(f"Could not estimate job cost: {e}")
+        return 'accept', 0.0
+    budget = app.config['JOB_BUDGET_SECONDS']
+    policy = app.config['ADMISSION_POLICY']
+    if estimate <= budget:
+        return 'accept', estimate
+    if policy == 'reject':
+        return 'reject', estimate
+    if policy == 'downsample':
+        options['max_sample_rate'] = app.config['DOWNSAMPLE_RATE']
+        estimate = cost_model.estimate_job(temp_input_path, options, reference_path)
+        if estimate <= budget:
+            return 'downsample', estimate
+    return 'defer', estimate
+
+def _parse_formats(options):
+    """Adds the requested output formats to options. Returns an error message if they're invalid."""
+    formats = request.form.get('formats')
+    if not formats:
+        return None
+    try:
+        options['formats'] = output_formats.normalize(formats)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def _parse_streaming(options):
+    """
+    Sets options['streaming'] from the form. Streaming renders with the numpy
+    backend, which it selects unless another backend was asked for.
+    Returns an error message, or None.
+    """
+    if request.form.get('streaming', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    if options.setdefault('backend', 'numpy') != 'numpy':
+        return "Streaming mode only runs on the numpy backend."
+    options['streaming'] = True
+    return None
+
+def _parse_preview(options):
+    """
+    Marks a preview job in options. A preview renders a short excerpt and is
+    encoded in the preview format unless formats were given. Returns an error
+    message if preview_seconds is invalid.
+    """
+    if request.form.get('preview', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    options['preview'] = True
+    preview_seconds = request.form.get('preview_seconds')
+    if preview_seconds:
+        try:
+            seconds = float(preview_seconds)
+        except ValueError:
+            seconds = 0
+        if not 0 < seconds <= app.config['PREVIEW_MAX_SECONDS']:
+            return f"preview_seconds must be between 0 and {app.config['PREVIEW_MAX_SECONDS']:g}."
+        options['preview_seconds'] = seconds
+    options.setdefault('formats', [output_formats.PREVIEW_FORMAT])
+    return None
+
+def _output_ext(filename, options):
+    """Extension of a job's (first) output: the first requested format, else the upload's own."""
+    if options.get('formats'):
+        return output_formats.extension(options['formats'][0])
+    return os.path.splitext(filename)[1]
+
+def _cache_key(input_hash, filename, options, reference_hash=None):
+    from audio_processor import resolve_options, get_backend_version
+    resolved_options = resolve_options(options)
+    return result_cache.make_key(
+        input_hash,
+        resolved_options,
+        get_backend_version(resolved_options),
+        reference_hash=reference_hash,
+        output_ext=_output_ext(filename, options),
+    )
+
+def _lookup_result_cache(temp_input_path, input_hash, filename, options, reference_path=None, reference_hash=None):
+    """
+    Computes the result cache key of a slushify job from the hashes taken
+    while the uploads streamed in. On a hit the uploads are removed and the
+    cached output is recorded like a finished task, so status polling and
+    adjust work as usual. Returns (cache_key, task_id, output_path); task_id
+    and output_path are None on a miss. Jobs encoding several formats aren't
+    cached (an entry is one file), so their cache_key is None too.
+    """
+    if len(options.get('formats') or ()) > 1:
+        return None, None, None
+    file_ext = _output_ext(filename, options)
+    cache_key = _cache_key(input_hash, filename, options, reference_hash)
+    result_id = str(uuid.uuid4())
+    output_storage = storage.get_storage()
+    output_filename = f"{result_id}{file_ext}"
+    output_path = output_storage.writable_path(output_filename)
+    if not result_cache.lookup(cache_key, file_ext, output_path):
+        return cache_key, None, None
+    for path in (temp_input_path, reference_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+    from audio_processor import resolve_options
+    output_path = output_index.store(output_storage, result_id, output_filename, output_path, resolve_options(dict(options)))
+    celery_app.backend.store_result(result_id, {'status': 'SUCCESS', 'result': output_path}, 'SUCCESS')
+    return cache_key, result_id, output_path
+
+def _batch_manifest_path(batch_id):
+    return os.path.join(app.config['OUTPUT_FOLDER'], f"batch_{batch_id}.json")
+
+@app.route('/api/batch', methods=['POST'])
+def slushify_batch():
+    """
+    Processes many uploads ('files') with one preset as a single batch. Cached
+    results are served straight away; the rest pass admission control one by
+    one, as on /api/slushify, and are dispatched together as one Celery group.
+    Poll /api/batch/<batch_id> for aggregate progress and the manifest of
+    outputs.
+    """
+    files = [f for f in request.files.getlist('files') if f.filename != '']
+    if not files:
+        return jsonify(error="No files provided"), 400
+    if len(files) > app.config['BATCH_MAX_FILES']:
+        return jsonify(error=f"At most {app.config['BATCH_MAX_FILES']} files per batch"), 400
+    options = {'preset': request.form.get('preset', 'slushwave')}
+    backend = request.form.get('backend')
+    if backend:
+        from audio_processor import EFFECT_BACKENDS
+        if backend not in EFFECT_BACKENDS:
+            return jsonify(error=f"Unknown backend: {backend}"), 400
+        options['backend'] = backend
+    error = _parse_formats(options)
+    if error:
+        return jsonify(error=error), 400
+
+    # Every file is validated before anything is dispatched; one bad file rejects the batch.
+    saved = []
+    try:
+        for file in files:
+            filename = secure_filename(file.filename)
+            temp_input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{filename}")
+            saved.append((filename, temp_input_path, uploads.save(file, temp_input_path)))
+    except UnsupportedMediaType:
+        for _filename, temp_input_path, _input_hash in saved:
+            os.remove(temp_input_path)
+        raise
+
+    entries = []
+    misses = []
+    for filename, temp_input_path, input_hash in saved:
+        cache_key, result_id, _output_path = _lookup_result_cache(temp_input_path, input_hash, filename, options)
+        entries.append({'filename': filename, 'task_id': result_id})
+        if not result_id:
+            misses.append((entries[-1], temp_input_path, input_hash, cache_key))
+
+    # Each miss goes through the same admission control as /api/slushify.
+    signatures = []
+    admitted = []
+    for entry, temp_input_path, input_hash, cache_key in misses:
+        file_options = dict(options)
+        decision, estimate = _admit(temp_input_path, file_options)
+        if decision == 'reject':
+            for _entry, path, _input_hash, _key in misses:
+                if os.path.exists(path):
+                    os.remove(path)
+            return jsonify(
+                error=f"{entry['filename']} is too large to process right now.",
+                estimated_seconds=round(estimate, 1),
+                budget_seconds=app.config['JOB_BUDGET_SECONDS']
+            ), 413
+        if 'max_sample_rate' in file_options and cache_key:
+            # The downsampled render is a different result from the full one,
+            # and may be cached from an earlier upload of the same file.
+            cache_key, result_id, _output_path = _lookup_result_cache(
+                temp_input_path, input_hash, entry['filename'], file_options
+            )
+            if result_id:
+                entry['task_id'], entry['admission'] = result_id, decision
+                continue
+        signature = slushify_task.s(
+            temp_input_path, entry['filename'], file_options, None, cache_key=cache_key, content_hash=input_hash
+        )
+        if decision == 'defer':
+            signature.set(priority=cost_model.PRIORITY_STEPS - 1)
+        entry['admission'] = decision
+        signatures.append(signature)
+        admitted.append((entry, slushify_queue(None, file_options), estimate))
+
+    # One group publishes every task over a single broker connection.
+    if signatures:
+        group_result = group(signatures).apply_async()
+        for (entry, queue, estimate), result in zip(admitted, group_result.results):
+            entry['task_id'] = result.id
+            cost_model.add_pending(result.id, queue, estimate)
+
+    batch_id = str(uuid.uuid4())
+    with open(_batch_manifest_path(batch_id), 'w') as f:
+        json.dump({'options': options, 'entries': entries}, f)
+    return jsonify(
+        batch_id=batch_id,
+        status_url=url_for('batch_status', batch_id=batch_id, _external=True),
+        total=len(entries),
+        cached=len(entries) - len(signatures)
+    ), 202
+
+@app.route('/api/batch/<batch_id>')
+def batch_status(batch_id):
+    """Aggregate progress of a batch, with the manifest of per-file states and outputs."""
+    try:
+        with open(_batch_manifest_path(secure_filename(batch_id))) as f:
+            batch = json.load(f)
+    except FileNotFoundError:
+        return jsonify(error="Batch not found."), 404
+
+    manifest = []
+    done = failed = 0
+    fraction_sum = 0.0
+    for entry in batch['entries']:
+        task = celery_app.AsyncResult(entry['task_id'])
+        item = {'filename': entry['filename'], 'task_id': entry['task_id'], 'state': task.state}
+        if task.state == 'SUCCESS':
+            item['result'] = task.info.get('result')
+            done += 1
+        elif task.state in progress.TERMINAL_STATES:
+            item['error'] = str(task.info)
+            failed += 1
+        elif task.state == 'PROGRESS':
+            fraction_sum += task.info.get('progress') or 0.0
+        manifest.append(item)
+
+    total = len(manifest)
+    finished = done + failed
+    return jsonify(
+        batch_id=batch_id,
+        state='SUCCESS' if finished == total else 'PROGRESS',
+        total=total,
+        completed=done,
+        failed=failed,
+        progress=(finished + fraction_sum) / total if total else 1.0,
+        manifest=manifest
+    )
+
+def _status_payload(task, include_stages=False):
+    """
+    The JSON body /api/status returns for a task, also used for SSE events.
+    With include_stages, a finished task's per-stage spans are included.
+    """
     if task.state == 'PENDING':
         response = { 'state': task.state, 'status': 'Pending...' }
     elif task.state == 'PROGRESS':
         response = { 'state': task.state, 'status': task.info.get('status', '') }
+        for key in ('stage', 'progress'):
+            if key in task.info:
+                response[key] = task.info[key]
+        if task.info.get('preview'):
+            response['preview'] = task.info['preview']
     elif task.state == 'SUCCESS':
         response = { 'state': task.state, 'status': 'Task completed!', 'result': task.info.get('result') }
+        for key in ('outputs', 'preview'):
+            if key in task.info:
+                response[key] = task.info[key]
+        if include_stages and 'stages' in task.info:
+            response['stages'] = task.info['stages']
     else:
         response = { 'state': task.state, 'status': str(task.info) }
-    return jsonify(response)
+    return response
+
+@app.route('/api/status/<task_id>')
+def taskstatus(task_id):
+    """Task state; add ?stages=1 for a finished task's per-stage timings and resource use."""
+    task = celery_app.AsyncResult(task_id)
+    include_stages = request.args.get('stages', '').lower() in ('1', 'true', 'yes')
+    return jsonify(_status_payload(task, include_stages))
+
+@app.route('/metrics')
+def metrics():
+    """Per-stage pipeline metrics in the Prometheus text format."""
+    exposition = spans.exposition()
+    if exposition is None:
+        return jsonify(error="Metrics need prometheus_client installed."), 404
+    body, content_type = exposition
+    return Response(body, content_type=content_type)
+
+def _sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+@app.route('/api/events/<task_id>')
+def task_events(task_id):
+    """
+    Server-Sent Events stream of a task's progress. Events are pushed by the
+    worker over Redis pub/sub; the stream ends once the task has finished.
+    """
+    def generate():
+        # Subscribe before reading the current state, so no event falls in between.
+        subscription = progress.subscribe(task_id)
+        try:
+            event = _status_payload(celery_app.AsyncResult(task_id))
+            yield _sse(event)
+            while event['state'] not in progress.TERMINAL_STATES:
+                message = subscription.get(timeout=app.config['SSE_KEEPALIVE_SECONDS'])
+                if message is None:
+                    # Nothing pushed for a while: make sure the final event wasn't
+                    # missed, and keep the connection alive.
+                    latest = _status_payload(celery_app.AsyncResult(task_id))
+                    if latest['state'] in progress.TERMINAL_STATES:
+                        event = latest
+                        yield _sse(event)
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                event = message
+                yield _sse(event)
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/stream/<task_id>')
+def stream_output(task_id):
+    """
+    Streams a task's output. A finished file is served like /api/outputs, with
+    HTTP Range support or offloaded to the front-end server or remote storage;
+    a file that is still being written is sent chunked as it grows, starting
+    at the optional ?offset= byte position.
+    """
+    task = celery_app.AsyncResult(task_id)
+    if task.state == 'SUCCESS':
+        result_path = task.info.get('result')
+        if not result_path:
+            return jsonify(error="Output file not found."), 404
+        return _serve_output(result_path)
+    if task.state != 'PROGRESS' or not task.info.get('output'):
+        return jsonify(error="Output is not available yet.", state=task.state), 409
+
+    output_path = task.info['output']
+    offset = request.args.get('offset', 0, type=int)
+    chunk_size = app.config['STREAM_CHUNK_SIZE']
+
+    def generate():
+        subscription = progress.subscribe(task_id)
+        position = offset
+        finished = False
+        try:
+            while True:
+                chunk = b''
+                if os.path.exists(output_path):
+                    with open(output_path, 'rb') as f:
+                        f.seek(position)
+                        chunk = f.read(chunk_size)
+                if chunk:
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                if finished:
+                    break
+                # Wait for the worker to write more; a terminal event means one last drain.
+                event = subscription.get(timeout=app.config['STREAM_POLL_SECONDS'])
+                if event is not None:
+                    finished = event.get('state') in progress.TERMINAL_STATES
+                elif celery_app.AsyncResult(task_id).state in progress.TERMINAL_STATES:
+                    finished = True
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetypes.guess_type(output_path)[0] or 'application/octet-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/adjust/<original_task_id>', methods=['POST'])
 def adjust(original_task_id):
     # ... (logic is unchanged)
-    original_file_path = None
-    if os.path.isdir(app.config['OUTPUT_FOLDER']):
-        for f in os.listdir(app.config['OUTPUT_FOLDER']):
-            if f.startswith(original_task_id):
-                original_file_path = os.path.join(app.config['OUTPUT_FOLDER'], f)
-                break
-    if not original_file_path or not os.path.exists(original_file_path):
+    entry = output_index.get(original_task_id)
+    original_file_path = entry['path'] if entry else None
+    if not original_file_path or not storage.get_storage().exists(original_file_path):
         return jsonify(error="Original processed file not found."), 404
     adj_data = request.get_json()
     if not adj_data or 'effect_name' not in adj_data or 'effect_params' not in adj_data:
@@ -1,84 +1,517 @@
 # audio_processor.py
 
-import librosa
-import numpy as np
-import json
+import importlib
 import os
 import uuid
 import effects
-import soundfile as sf
+import analysis_store
+import analysis_pool
+import preset_registry
+import stage_cache
+import spans
 
-def load_presets():
-    """Loads presets from presets.json"""
-    preset_path = os.path.join(os.path.dirname(__file__), 'presets.json')
+# Bump when analyze_signal's output changes, so stored analyses are recomputed.
+ANALYSIS_VERSION = 1
+
+# 'sox' runs the chain through SoX; 'numpy' runs it in memory (see numpy_effects.py).
+EFFECT_BACKENDS = ('sox', 'numpy')
+
+# numpy_effects pulls in scipy and numba, so it is only imported by the code
+# paths that run the numpy backend; the web process never needs it. The
+# decoding and DSP libraries are imported by the functions that use them too,
+# so importing this module (and tasks, and the app) stays cheap. They remain
+# reachable as module attributes under their usual names.
+_LAZY_MODULES = {
+    'numpy_effects': 'numpy_effects',
+    'librosa': 'librosa',
+    'np': 'numpy',
+    'sf': 'soundfile',
+    'soxr': 'soxr',
+}
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(_LAZY_MODULES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Previews render a short mono excerpt at a reduced rate (see extract_preview).
+PREVIEW_SECONDS = 10
+PREVIEW_SAMPLE_RATE = 22050
+
+def decode_audio(input_path, mono=True):
+    """
+    Decodes a file once at its native sample rate. Analysis and loop detection
+    only need mono; pass mono=False to keep all channels for the in-memory backend.
+    Returns (y, sr), or None if the file can't be decoded.
+    """
+    import librosa
     try:
-        with open(preset_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(f"ERROR: presets.json not found at {preset_path}")
-        return {}
-PRESETS = load_presets()
+        return librosa.load(input_path, sr=None, mono=mono)
+    except Exception as e:
+        print(f"Error decoding {input_path}: {e}")
+        return None
+
+def fingerprint_signal(y, sr, n_fft=2048, hop_length=512):
+    """
+    Extracts the musical fingerprint from a decoded signal. One STFT is shared
+    by every spectral feature instead of each feature computing its own.
+    Returns (features, summaries), where summaries holds the raw chroma and RMS
+    statistics the features were derived from.
+    """
+    import librosa
+    import numpy as np
+    y = librosa.to_mono(y)
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+    spec_centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    spec_bandwidth = librosa.feature.spectral_bandwidth(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)
+
+    # The remaining features use the power spectrogram; square in place to keep peak memory down.
+    power = np.square(S, out=S)
+    chromagram = librosa.feature.chroma_stft(S=power, sr=sr, n_fft=n_fft)
+    chroma_mean = np.mean(chromagram, axis=1)
+    key_idx = np.argmax(chroma_mean)
+    notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+    key = notes[key_idx]
+    onset_env = librosa.onset.onset_strength(
+        S=librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr)), sr=sr
+    )
+    tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=hop_length)[0]
+    # RMS is framed in the time domain (no FFT needed) so loudness keeps its unwindowed scale.
+    rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)[0]
 
-def analyze_audio(input_path):
+    features = {
+        'tempo': round(float(tempo)),
+        'key': key,
+        'brightness': round(float(np.mean(spec_centroid))),
+        'spectral_width': round(float(np.mean(spec_bandwidth))),
+        'avg_loudness': float(np.mean(rms))
+    }
+    summaries = {
+        'chroma_mean': [float(v) for v in chroma_mean],
+        'rms': {
+            'mean': float(np.mean(rms)),
+            'std': float(np.std(rms)),
+            'p10': float(np.percentile(rms, 10)),
+            'p50': float(np.percentile(rms, 50)),
+            'p90': float(np.percentile(rms, 90)),
+            'max': float(np.max(rms)),
+        },
+    }
+    return features, summaries
+
+def analyze_signal(y, sr, n_fft=2048, hop_length=512):
+    """Returns only the feature dict of fingerprint_signal."""
+    return fingerprint_signal(y, sr, n_fft, hop_length)[0]
+
+def analyze_audio(input_path, audio=None, use_store=False, content_hash=None):
     """
     Analyzes an audio file to extract a fingerprint of musical features.
+    Pass audio=(y, sr) to reuse an already decoded buffer. With use_store, the
+    result is looked up in (and saved to) the persistent analysis store.
     """
+    import librosa
     try:
-        y, sr = librosa.load(input_path, sr=None)
-        tempo = librosa.feature.tempo(y=y, sr=sr)[0]
-        chromagram = librosa.feature.chroma_stft(y=y, sr=sr)
-        chroma_mean = np.mean(chromagram, axis=1)
-        key_idx = np.argmax(chroma_mean)
-        notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        key = notes[key_idx]
-        spec_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-        spec_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-        rms = librosa.feature.rms(y=y)[0]
-
-        return {
-            'tempo': round(float(tempo)),
-            'key': key,
-            'brightness': round(float(np.mean(spec_centroid))),
-            'spectral_width': round(float(np.mean(spec_bandwidth))),
-            'avg_loudness': float(np.mean(rms))
-        }
+        if use_store:
+            content_hash = content_hash or analysis_store.hash_file(input_path)
+            stored = analysis_store.get(content_hash, ANALYSIS_VERSION)
+            if stored is not None:
+                return stored['features']
+        y, sr = audio if audio is not None else librosa.load(input_path, sr=None)
+        features, summaries = fingerprint_signal(y, sr)
+        if use_store:
+            analysis_store.put(content_hash, ANALYSIS_VERSION, features, summaries)
+        return features
     except Exception as e:
         print(f"Error during audio analysis: {e}")
         return None
 
-def find_and_extract_loop(input_path, output_dir, duration_seconds=10):
-    # ... (code is unchanged)
+def find_loop_bounds(y, sr, duration_seconds=10):
+    """
+    Returns (start_sample, end_sample) of the loudest window of duration_seconds,
+    searching from 30 seconds in when the track is long enough.
+    """
+    import librosa
+    import numpy as np
+    frame_length = int(duration_seconds * sr)
+    rmse = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=frame_length//2)[0]
+    start_frame_search = librosa.time_to_frames(30, sr=sr, hop_length=frame_length//2)
+    if len(rmse) > start_frame_search:
+        best_frame_index = np.argmax(rmse[start_frame_search:]) + start_frame_search
+    else:
+        best_frame_index = np.argmax(rmse)
+    start_sample = librosa.frames_to_samples(best_frame_index, hop_length=frame_length//2)
+    end_sample = min(start_sample + frame_length, len(y))
+    return start_sample, end_sample
+
+def find_loop_bounds_streaming(input_path, duration_seconds=10, blocksize=65536):
+    """
+    Same selection as find_loop_bounds, but reads the file block by block and
+    keeps only per-hop energy sums, so memory stays bounded no matter how long
+    the input is. Returns (start_sample, end_sample, sr).
+    """
+    import librosa
+    import numpy as np
+    import soundfile as sf
+    sr = sf.info(input_path).samplerate
+    frame_length = int(duration_seconds * sr)
+    hop_length = frame_length // 2
+
+    # Sum of squares over each hop-sized chunk, plus the energy of each chunk's
+    # first sample (needed when frame_length is odd, i.e. 2 * hop + 1).
+    chunk_energy = []
+    chunk_head = []
+    n = 0
+    for block in sf.blocks(input_path, blocksize=blocksize, dtype='float32', always_2d=True):
+        energy = block.mean(axis=1).astype(np.float64) ** 2
+        chunk_ids = np.arange(n, n + len(energy)) // hop_length
+        sums = np.bincount(chunk_ids - chunk_ids[0], weights=energy)
+        for offset, value in enumerate(sums):
+            if chunk_ids[0] + offset < len(chunk_energy):
+                chunk_energy[chunk_ids[0] + offset] += value
+            else:
+                chunk_energy.append(value)
+        first_head = -(-n // hop_length) * hop_length
+        chunk_head.extend(energy[first_head - n::hop_length])
+        n += len(energy)
+
+    def chunk(values, k):
+        return values[k] if 0 <= k < len(values) else 0.0
+
+    # librosa.feature.rms (center=True) pads by frame_length // 2 == hop_length,
+    # so frame i covers samples [(i - 1) * hop, (i - 1) * hop + frame_length).
+    n_frames = 1 + (n + 2 * hop_length - frame_length) // hop_length
+    rmse = np.empty(n_frames)
+    for i in range(n_frames):
+        frame_energy = chunk(chunk_energy, i - 1) + chunk(chunk_energy, i)
+        if frame_length > 2 * hop_length:
+            frame_energy += chunk(chunk_head, i + 1)
+        rmse[i] = np.sqrt(frame_energy / frame_length)
+
+    start_frame_search = librosa.time_to_frames(30, sr=sr, hop_length=hop_length)
+    if len(rmse) > start_frame_search:
+        best_frame_index = np.argmax(rmse[start_frame_search:]) + start_frame_search
+    else:
+        best_frame_index = np.argmax(rmse)
+    start_sample = int(best_frame_index * hop_length)
+    end_sample = min(start_sample + frame_length, n)
+    return start_sample, end_sample, sr
+
+def extract_loop(input_path, duration_seconds=10, audio=None, content_hash=None):
+    """
+    Returns the loudest duration_seconds of the input as a mono (y, sr) buffer,
+    or None if loop detection fails. Pass audio=(y, sr) to reuse an already
+    decoded buffer; otherwise the file is scanned in blocks and only the
+    winning window is read. With content_hash, the window is kept in the
+    analysis store, and a later call for the same content reads only the window.
+    """
+    import librosa
+    import soundfile as sf
     try:
-        y, sr = librosa.load(input_path, sr=None)
-        frame_length = int(duration_seconds * sr)
-        rmse = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=frame_length//2)[0]
-        start_frame_search = librosa.time_to_frames(30, sr=sr, hop_length=frame_length//2)
-        if len(rmse) > start_frame_search:
-            best_frame_index = np.argmax(rmse[start_frame_search:]) + start_frame_search
-        else:
-            best_frame_index = np.argmax(rmse)
-        start_sample = librosa.frames_to_samples(best_frame_index, hop_length=frame_length//2)
-        end_sample = min(start_sample + frame_length, len(y))
-        loop_data = y[start_sample:end_sample]
-        loop_path = os.path.join(output_dir, f"loop_{uuid.uuid4()}.wav")
-        sf.write(loop_path, loop_data, sr)
-        return loop_path
+        bounds = analysis_store.get_loop(content_hash, duration_seconds) if content_hash else None
+        if audio is not None:
+            y, sr = librosa.to_mono(audio[0]), audio[1]
+            if bounds is None or bounds[2] != sr:
+                bounds = (*find_loop_bounds(y, sr, duration_seconds), sr)
+                _store_loop(content_hash, duration_seconds, bounds)
+            return y[bounds[0]:bounds[1]], sr
+        try:
+            if bounds is None:
+                bounds = find_loop_bounds_streaming(input_path, duration_seconds)
+                _store_loop(content_hash, duration_seconds, bounds)
+            start_sample, end_sample, sr = bounds
+            block = sf.read(input_path, start=start_sample, stop=end_sample, dtype='float32', always_2d=True)[0]
+            return block.mean(axis=1), sr
+        except sf.LibsndfileError:
+            # Formats soundfile can't stream (e.g. m4a) go through librosa's decode.
+            if bounds is not None:
+                start_sample, end_sample, sr = bounds
+                return librosa.load(
+                    input_path, sr=None, offset=start_sample / sr, duration=(end_sample - start_sample) / sr
+                )
+            y, sr = librosa.load(input_path, sr=None)
+            bounds = (*find_loop_bounds(y, sr, duration_seconds), sr)
+            _store_loop(content_hash, duration_seconds, bounds)
+            return y[bounds[0]:bounds[1]], sr
     except Exception as e:
         print(f"Error during loop detection: {e}")
+        return None
+
+def _store_loop(content_hash, duration_seconds, bounds):
+    if content_hash:
+        analysis_store.put_loop(content_hash, duration_seconds, *bounds)
+
+def find_and_extract_loop(input_path, output_dir, duration_seconds=10, audio=None):
+    """
+    Writes the loudest duration_seconds of the input to a temporary WAV and
+    returns its path, or input_path if loop detection fails. See extract_loop.
+    """
+    import soundfile as sf
+    loop = extract_loop(input_path, duration_seconds, audio=audio)
+    if loop is None:
         return input_path
+    loop_path = os.path.join(output_dir, f"loop_{uuid.uuid4()}.wav")
+    sf.write(loop_path, loop[0], loop[1])
+    return loop_path
+
+def extract_preview(input_path, options, audio=None, content_hash=None):
+    """
+    Returns the excerpt a preview renders, as a mono (y, sr) buffer at no more
+    than the preview sample rate: the loop window when the preset detects
+    loops, otherwise the first preview_seconds. Only the excerpt is decoded.
+    """
+    import librosa
+    import soundfile as sf
+    import soxr
+    loop_config = options.get('loop_detection', {})
+    excerpt = None
+    if loop_config.get('enabled', False):
+        excerpt = extract_loop(input_path, loop_config.get('duration_seconds', 10), audio=audio, content_hash=content_hash)
+    if excerpt is None:
+        seconds = options.get('preview_seconds', PREVIEW_SECONDS)
+        if audio is not None:
+            y, sr = librosa.to_mono(audio[0]), audio[1]
+            excerpt = y[:int(seconds * sr)], sr
+        else:
+            try:
+                sr = sf.info(input_path).samplerate
+                block = sf.read(input_path, frames=int(seconds * sr), dtype='float32', always_2d=True)[0]
+                excerpt = block.mean(axis=1), sr
+            except sf.LibsndfileError:
+                excerpt = librosa.load(input_path, sr=None, duration=seconds)
+    y, sr = excerpt
+    target_sr = options.get('preview_sample_rate', PREVIEW_SAMPLE_RATE)
+    if sr > target_sr:
+        # soxr (librosa's resampler) directly; a short excerpt isn't worth librosa's overhead.
+        y, sr = soxr.resample(y, sr, target_sr), target_sr
+    return y, sr
+
+def _process_preview(input_path, output_path, options, effect_chain, audio=None, content_hash=None):
+    """Renders the preview excerpt through the effect chain, at the excerpt's reduced rate."""
+    import numpy as np
+    import soundfile as sf
+    y, sr = extract_preview(input_path, options, audio=audio, content_hash=content_hash)
+    # Both backends write at the preview rate, not resampled up like a full render.
+    if options.get('backend', 'sox') == 'numpy':
+        import numpy_effects
+        y = numpy_effects.apply_chain(y, sr, effect_chain)
+        sf.write(output_path, np.clip(y, -1.0, 1.0).T, sr)
+    else:
+        effects.apply_chain((y, sr), output_path, effect_chain, output_rate=sr)
+    return output_path
 
-def process_audio(input_path, output_path, options=None, reference_path=None):
+def resolve_options(options):
+    """Merges the named preset (if any) with the given overrides."""
+    return preset_registry.compile_plan(options).resolved()
+
+def get_backend_version(options):
+    """Version string of the effects backend the options select."""
+    if options.get('backend', 'sox') == 'numpy':
+        import numpy_effects
+        return numpy_effects.BACKEND_VERSION
+    return effects.BACKEND_VERSION
+
+def build_effect_chain(options):
+    """
+    Turns fully resolved options into an ordered list of (effect_name, params) tuples.
+    The chain is compiled once per distinct options (see preset_registry.py).
+    """
+    return preset_registry.compile_plan(options).effect_chain()
+
+def render_chain(input_path, output_path, effect_chain, backend='sox', stage=False):
+    """
+    Runs effect_chain over input_path into output_path with the given backend.
+    A stage output is written as 32-bit float WAV at the working sample rate,
+    unclipped, so later stages start from exactly what this one produced.
+    """
+    import librosa
+    if backend == 'numpy':
+        import numpy_effects
+        y, sr = librosa.load(input_path, sr=None, mono=False)
+        y = numpy_effects.apply_chain(y, sr, effect_chain)
+        if stage:
+            import soundfile as sf
+            sf.write(output_path, y.T, sr, subtype='FLOAT')
+            return output_path
+        return numpy_effects.write_audio(output_path, y, sr)
+    effects.apply_chain(input_path, output_path, effect_chain, lossless=stage)
+    return output_path
+
+def _record_session(session_id, source, effect_chain, options):
+    """
+    Keeps the render source (a path or a (y, sr) buffer) and chain, so the
+    output can be adjusted incrementally later. No stage output is rendered
+    here; render_incremental builds them on the first adjustment.
+    """
+    import numpy as np
+    import soundfile as sf
+    if isinstance(source, str):
+        source = stage_cache.store_source(source)
+    else:
+        y, sr = source
+        source_path = stage_cache.temp_path()
+        try:
+            sf.write(source_path, np.asarray(y).T, sr, subtype='FLOAT')
+            source = stage_cache.store_source(source_path)
+        finally:
+            os.remove(source_path)
+    if source is None:
+        return None
+    return stage_cache.save_session(
+        session_id, source, effect_chain, options.get('backend', 'sox'), get_backend_version(options)
+    )
+
+def render_incremental(session, effect_chain, output_path, checkpoint=None):
+    """
+    Renders a session's source through effect_chain into output_path, starting
+    from the longest chain prefix whose output is already cached. The lossless
+    output after the first `checkpoint` effects and after the whole chain are
+    cached on the way, so the next change at or after checkpoint starts there.
+    """
+    backend = session['backend']
+    def stage_key(n):
+        return stage_cache.prefix_key(session['source'], effect_chain[:n], session['backend_version'])
+
+    source_key, source_ext = os.path.splitext(session['source'])
+    done, current = 0, stage_cache.get(source_key, source_ext)
+    if current is None:
+        raise FileNotFoundError(f"Render source {session['source']} is no longer cached.")
+    for n in range(len(effect_chain), 0, -1):
+        cached = stage_cache.get(stage_key(n))
+        if cached:
+            done, current = n, cached
+            break
+
+    temp_files = []
+    try:
+        for n in sorted({checkpoint, len(effect_chain)} - {None}):
+            if n <= done:
+                continue
+            stage_path = stage_cache.temp_path()
+            temp_files.append(stage_path)
+            render_chain(current, stage_path, effect_chain[done:n], backend, stage=True)
+            stage_cache.store(stage_key(n), stage_path)
+            done, current = n, stage_path
+        # Only the output is clipped, resampled and encoded.
+        render_chain(current, output_path, [], backend)
+    finally:
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+    return output_path
+
+def adjust_effect_chain(effect_chain, effect_name, effect_params):
+    """
+    Changes one effect's parameters, or appends the effect if the chain doesn't
+    have it. Returns (new_chain, index of the first changed stage).
+    """
+    effect_chain = stage_cache.normalize_chain(effect_chain)
+    for i, (name, params) in enumerate(effect_chain):
+        if name == effect_name:
+            new_params = {**params, **effect_params}
+            if new_params == params:
+                return effect_chain, len(effect_chain)
+            effect_chain[i] = [name, new_params]
+            return effect_chain, i
+    return effect_chain + [[effect_name, dict(effect_params)]], len(effect_chain)
+
+def adjust_audio(file_id, output_path, effect_name, effect_params, new_file_id=None):
+    """
+    Re-renders the output named file_id with one effect changed, from its
+    original source rather than the processed file, re-running only the stages
+    from the changed effect onwards. The new render is recorded as new_file_id,
+    so it can be adjusted in turn. Returns None if file_id has no render session.
+    """
+    session = stage_cache.load_session(file_id)
+    if session is None:
+        return None
+    if session['backend'] == 'numpy':
+        import numpy_effects
+        known_effects = numpy_effects.EFFECTS
+    else:
+        known_effects = effects.CHAIN_BUILDERS
+    if effect_name not in known_effects:
+        raise ValueError(f"Unknown effect: {effect_name}")
+
+    effect_chain, changed = adjust_effect_chain(session['chain'], effect_name, effect_params)
+    render_incremental(session, effect_chain, output_path, checkpoint=changed)
+    if new_file_id:
+        stage_cache.save_session(
+            new_file_id, session['source'], effect_chain, session['backend'], session['backend_version']
+        )
+    return output_path
+
+def process_audio(input_path, output_path, options=None, reference_path=None, progress=None, session_id=None,
+                  content_hash=None):
     """
     Applies a chain of audio effects to the input file.
     If reference_path is provided, it will be used for style transfer.
+    If progress is provided, it is called as progress(stage, status, fraction)
+    as each processing stage starts.
+    If session_id is provided, the render source, chain and lossless output are
+    kept in the stage cache so adjust_audio can re-render it incrementally.
+    content_hash is the input's SHA-256, if already known. The loop window and
+    style analysis are stored under it, so a preview and the full render of the
+    same upload share them. The target and reference analyses, and loop
+    detection, run side by side on the analysis pool (see analysis_pool.py).
+    With options['preview'], only a short mono excerpt is rendered, at a
+    reduced sample rate (see extract_preview).
+    options['streaming'] renders long tracks block by block with the numpy
+    backend; it is ignored for the SoX backend, which streams on its own, and
+    for inputs libsndfile can't read.
+    Each stage is recorded as a span (see spans.py).
     """
     if options is None: options = {}
+    def report(stage, status, fraction=None):
+        if progress is not None:
+            progress(stage, status, fraction)
+
+    # Decode the input once and share it between analysis, loop detection and
+    # the in-memory backend, instead of each stage loading the file again.
+    # Loop detection on its own streams the file and doesn't need a full decode,
+    # and neither does a stored analysis.
+    decoded_input = None
+    preview = options.get('preview', False)
+    numpy_backend = options.get('backend', 'sox') == 'numpy'
+    streaming = options.get('streaming', False) and not preview
+    if streaming and not numpy_backend:
+        # SoX already streams from file to file; the block-wise chain is numpy DSP.
+        print("Streaming mode ignored: it only applies to the numpy backend.")
+        streaming = False
+    elif streaming and not _sample_rate(input_path):
+        # Blocks are read with libsndfile; other containers (m4a, webm) are
+        # decoded whole through audioread instead.
+        print("Streaming mode ignored: the input format can't be read block by block.")
+        streaming = False
+    in_memory = numpy_backend and not streaming and not preview
+    needs_analysis = reference_path and (
+        content_hash is None or analysis_store.get(content_hash, ANALYSIS_VERSION) is None
+    )
+    if needs_analysis or in_memory:
+        report('decode', 'Decoding audio...')
+        with spans.span('decode'):
+            decoded_input = decode_audio(input_path, mono=not in_memory)
 
     # --- Style Transfer Logic ---
+    prefetched_loop = []
     if reference_path:
         print("Reference track provided. Performing style transfer analysis...")
-        target_analysis = analyze_audio(input_path)
-        ref_analysis = analyze_audio(reference_path)
+        report('analysis', 'Analyzing style...')
+        def analyze(track, path, **kwargs):
+            with spans.span('analysis', track=track):
+                return analyze_audio(path, use_store=True, **kwargs)
+        # The two analyses, and the SoX path's loop detection, don't depend on
+        # each other (style transfer never changes loop_detection), so they
+        # run side by side on the analysis pool.
+        calls = [
+            lambda: analyze('target', input_path, audio=decoded_input, content_hash=content_hash),
+            lambda: analyze('reference', reference_path),
+        ]
+        preset_options = preset_registry.compile_plan(options).options
+        loop_config = preset_options.get('loop_detection', {})
+        if loop_config.get('enabled', False) and not preview and preset_options.get('backend', 'sox') != 'numpy':
+            calls.append(lambda: _detect_loop(input_path, loop_config, audio=decoded_input, content_hash=content_hash))
+        with spans.span('style_analysis', workers=min(len(calls), analysis_pool.pool_size())):
+            target_analysis, ref_analysis, *prefetched_loop = analysis_pool.run(calls)
 
         if target_analysis and ref_analysis:
             # Create new options based on the analysis
@@ -95,6 +528,7 @@ def process_audio(input_path, output_path, options=None, reference_path=None):
 
             # Match loudness
             if target_analysis['avg_loudness'] > 0:
+                import numpy as np
                 gain_ratio = ref_analysis['avg_loudness'] / target_analysis['avg_loudness']
                 style_options['gain_db'] = 20 * np.log10(gain_ratio)
 
@@ -104,56 +538,161 @@ def process_audio(input_path, output_path, options=None, reference_path=None):
             print("Style transfer analysis failed. Proceeding with default preset.")
 
     # --- Preset Logic ---
-    preset_name = options.get('preset')
-    if preset_name and preset_name in PRESETS:
-        base_options = PRESETS[preset_name].copy()
-        base_options.update(options)
-        options = base_options
+    plan = preset_registry.compile_plan(options)
+    options = plan.resolved()
+
+    if preview:
+        report('effects', 'Rendering preview...')
+        with spans.span('preview'):
+            return _process_preview(
+                input_path, output_path, options, plan.effect_chain(), audio=decoded_input, content_hash=content_hash
+            )
+
+    if streaming:
+        if not options.get('loop_detection', {}).get('enabled', False):
+            report('effects', 'Applying effects...', 0.0)
+            with spans.span('effects', mode='streaming'):
+                return _process_audio_streaming(
+                    input_path, output_path, plan.effect_chain(),
+                    progress=lambda fraction: report('effects', 'Applying effects...', fraction),
+                    max_sample_rate=options.get('max_sample_rate')
+                )
+        # A short extracted loop gains nothing from streaming.
+        print("Streaming mode ignored: the preset renders a short loop.")
+        with spans.span('effects', mode='numpy'):
+            return _process_audio_in_memory(
+                input_path, output_path, options, plan.effect_chain(), session_id=session_id
+            )
+
+    if in_memory:
+        report('effects', 'Applying effects...')
+        with spans.span('effects', mode='numpy'):
+            return _process_audio_in_memory(
+                input_path, output_path, options, plan.effect_chain(), audio=decoded_input, session_id=session_id
+            )
 
-    temp_files = []
     current_input = input_path
+    loop_config = options.get('loop_detection', {})
+    if loop_config.get('enabled', False):
+        # The loop stays in memory and is piped straight into SoX.
+        if prefetched_loop:
+            loop = prefetched_loop[0]
+        else:
+            report('loop', 'Detecting loop...')
+            loop = _detect_loop(input_path, loop_config, audio=decoded_input, content_hash=content_hash)
+        if loop is not None:
+            current_input = loop
 
-    def get_temp_file():
-        temp_path = os.path.join(os.path.dirname(output_path), f"temp_{uuid.uuid4()}.wav")
-        temp_files.append(temp_path)
-        return temp_path
+    effect_chain = plan.effect_chain()
+    # Admission control may ask for a downsample, so the effects run on fewer
+    # samples and the output stays at the reduced rate.
+    output = {}
+    max_sample_rate = options.get('max_sample_rate')
+    if effect_chain and max_sample_rate and _sample_rate(current_input) > max_sample_rate:
+        effect_chain = [('rate', {'sample_rate': max_sample_rate})] + effect_chain
+        output['output_rate'] = max_sample_rate
+    report('effects', 'Applying effects...')
 
-    try:
-        loop_config = options.get('loop_detection', {})
-        if loop_config.get('enabled', False):
-            loop_duration = loop_config.get('duration_seconds', 10)
-            output_dir_for_loop = os.path.dirname(output_path)
-            looped_file_path = find_and_extract_loop(current_input, output_dir_for_loop, loop_duration)
-            if looped_file_path != current_input:
-                current_input = looped_file_path
-                temp_files.append(looped_file_path)
-
-        effect_chain = []
-        if options.get('bass_boost'): effect_chain.append(('bass_boost', {'gain': options['bass_boost']}))
-        # ... (rest of the effect chain logic is the same)
-        if options.get('pitch_shift'): effect_chain.append(('pitch_shift', {'shift': options['pitch_shift']}))
-        if options.get('oops'): effect_chain.append(('oops', {}))
-        if options.get('tremolo'): effect_chain.append(('tremolo', {'freq': 500, 'depth': 50}))
-        if options.get('phaser'): effect_chain.append(('phaser', {}))
-        if options.get('gain_db'): effect_chain.append(('gain', {'db': options['gain_db']}))
-        if options.get('compand'): effect_chain.append(('compand', {}))
-        if options.get('speed_ratio'): effect_chain.append(('speed', {'ratio': options['speed_ratio']}))
-        if options.get('lowpass_cutoff'): effect_chain.append(('lowpass', {'cutoff': options['lowpass_cutoff']}))
-        if not options.get('no_reverb', False): effect_chain.append(('reverb', {}))
-
-        if not effect_chain:
+    if not effect_chain:
+        if isinstance(current_input, str):
             import shutil
             shutil.copy(current_input, output_path)
+        else:
+            effects.apply_chain(current_input, output_path, [])
+        return output_path
+
+    # Only the source and chain are recorded; stage outputs are rendered the
+    # first time the output is adjusted, so unadjusted jobs pay nothing extra.
+    if session_id:
+        with spans.span('session'):
+            _record_session(session_id, current_input, effect_chain, options)
+
+    # Run the whole chain in a single SoX pass. The per-effect path below is
+    # only used as a fallback, or when 'fuse_effects' is explicitly disabled.
+    if options.get('fuse_effects', True):
+        try:
+            with spans.span('effects', mode='fused'):
+                effects.apply_chain(current_input, output_path, effect_chain, **output)
             return output_path
+        except Exception as e:
+            print(f"Fused effect chain failed, falling back to per-effect processing: {e}")
 
-        for i, (effect_name, params) in enumerate(effect_chain):
-            is_last_effect = (i == len(effect_chain) - 1)
-            current_output = output_path if is_last_effect else get_temp_file()
-            effect_func = getattr(effects, f"apply_{effect_name}")
-            effect_func(current_input, current_output, **params)
-            current_input = current_output
-    finally:
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+    # Intermediate results are passed between SoX processes as in-memory buffers.
+    for i, (effect_name, params) in enumerate(effect_chain):
+        is_last_effect = (i == len(effect_chain) - 1)
+        effect_func = getattr(effects, f"apply_{effect_name}")
+        with spans.span(f"effects.{effect_name}"):
+            current_input = effect_func(current_input, output_path if is_last_effect else None, **params, **output)
     return output_path
+
+def _detect_loop(input_path, loop_config, audio=None, content_hash=None):
+    with spans.span('loop'):
+        return extract_loop(input_path, loop_config.get('duration_seconds', 10), audio=audio, content_hash=content_hash)
+
+def _sample_rate(source):
+    """Sample rate of a path or (y, sr) buffer; 0 if the header can't be read."""
+    import soundfile as sf
+    if not isinstance(source, str):
+        return source[1]
+    try:
+        return sf.info(source).samplerate
+    except RuntimeError:
+        return 0
+
+def _process_audio_in_memory(input_path, output_path, options, effect_chain, audio=None, session_id=None):
+    """
+    NumPy backend for process_audio: decodes once, runs loop detection and the
+    whole effect chain on the in-memory buffer and encodes once at the end.
+    """
+    import librosa
+    import numpy_effects
+    y, sr = audio if audio is not None else librosa.load(input_path, sr=None, mono=False)
+    y = numpy_effects._as_channels(y)
+    max_sample_rate = options.get('max_sample_rate')
+    if max_sample_rate and sr > max_sample_rate:
+        y, sr = librosa.resample(y, orig_sr=sr, target_sr=max_sample_rate), max_sample_rate
+
+    loop_config = options.get('loop_detection', {})
+    if loop_config.get('enabled', False):
+        try:
+            start_sample, end_sample = find_loop_bounds(
+                librosa.to_mono(y), sr, loop_config.get('duration_seconds', 10)
+            )
+            y = y[:, start_sample:end_sample]
+        except Exception as e:
+            print(f"Error during loop detection: {e}")
+
+    if session_id:
+        _record_session(session_id, (y, sr), effect_chain, options)
+
+    y = numpy_effects.apply_chain(y, sr, effect_chain)
+    return numpy_effects.write_audio(output_path, y, sr)
+
+def _process_audio_streaming(input_path, output_path, effect_chain, block_seconds=10, progress=None,
+                             max_sample_rate=None):
+    """
+    Streaming mode for long tracks on the numpy backend: runs the chain through
+    the in-memory effects in blocks, with flat memory use, writing the output
+    as it goes.
+    """
+    import numpy_effects
+    return numpy_effects.process_file_streaming(
+        input_path, output_path, effect_chain, block_seconds=block_seconds, progress=progress,
+        max_sample_rate=max_sample_rate
+    )
+
+def warm_up():
+    """
+    Runs analysis, loop detection and every numpy-backend effect on a short
+    synthetic signal. librosa's lazy imports and numba's JIT compilation (or
+    loading its on-disk cache) then happen before a worker's first job
+    instead of during it.
+    """
+    import numpy as np
+    import numpy_effects
+    sr = 22050
+    y = (0.1 * np.sin(2 * np.pi * 440 * np.arange(2 * sr) / sr)).astype(np.float32)
+    fingerprint_signal(y, sr)
+    find_loop_bounds(y, sr, duration_seconds=1)
+    numpy_effects.apply_chain(y, sr, [(effect_name, {}) for effect_name in numpy_effects.EFFECTS])
+    numpy_effects.StreamingChain([(effect_name, {}) for effect_name in numpy_effects.STREAM_STAGES], sr, 1).process(y)
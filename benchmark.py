@@ -0,0 +1,745 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the audio processing pipeline.
+
+Each benchmark generates its own synthetic audio fixture, so results are
+reproducible on any machine with SoX installed. Example:
+
+    python benchmark.py chain --duration 60
+
+The suite benchmark covers every preset, backend and fixture size, and can
+check the results against a saved baseline:
+
+    python benchmark.py --output baseline.json suite
+    python benchmark.py --output results.json suite --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+import audio_processor
+import effects
+import numpy_effects
+import preset_registry
+import sox_pool
+import spans
+
+
+def make_fixture(path, duration_seconds, sr=44100, channels=2, seed=0):
+    """
+    Writes a synthetic test track (chord + noise with a loud section) to path.
+    The track is generated one second at a time, so hour-long fixtures are cheap.
+    """
+    rng = np.random.default_rng(seed)
+    loud_start = min(int(duration_seconds) // 2, 35)
+    with sf.SoundFile(path, 'w', sr, channels) as f:
+        for second in range(int(np.ceil(duration_seconds))):
+            n = min(sr, int(duration_seconds * sr) - second * sr)
+            t = (second * sr + np.arange(n)) / sr
+            y = sum(0.2 * np.sin(2 * np.pi * freq * t) for freq in (220.0, 277.18, 329.63))
+            y = y + 0.05 * rng.standard_normal(n)
+            # A louder section, so loop detection has something to find.
+            if loud_start <= second < loud_start + 5:
+                y *= 2.0
+            y = np.clip(y, -1.0, 1.0).astype(np.float32)
+            f.write(np.stack([y] * channels, axis=1) if channels > 1 else y)
+    return path
+
+
+class SoxCallRecorder:
+    """Wraps effects._apply_fx to count SoX invocations and bytes written by each one."""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes_written = 0
+        self._original = None
+
+    def _record(self, infile, outfile, fx_chain):
+        result = self._original(infile, outfile, fx_chain)
+        self.calls += 1
+        if outfile is not None and os.path.exists(outfile):
+            self.bytes_written += os.path.getsize(outfile)
+        return result
+
+    def __enter__(self):
+        self._original = effects._apply_fx
+        effects._apply_fx = self._record
+        return self
+
+    def __exit__(self, *exc):
+        effects._apply_fx = self._original
+
+
+def bench_chain(args):
+    """Compares the fused single-pass chain with the per-effect chain for each preset."""
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    results = []
+    try:
+        fixture = make_fixture(os.path.join(work_dir, "fixture.wav"), args.duration)
+        for preset_name in preset_registry.get_presets():
+            row = {'preset': preset_name}
+            for mode, fuse in (('fused', True), ('per_effect', False)):
+                timings = []
+                for _ in range(args.repeat):
+                    output_path = os.path.join(work_dir, f"{preset_name}_{mode}.wav")
+                    with SoxCallRecorder() as recorder:
+                        start = time.perf_counter()
+                        audio_processor.process_audio(
+                            fixture, output_path, {'preset': preset_name, 'fuse_effects': fuse}
+                        )
+                        timings.append(time.perf_counter() - start)
+                row[mode] = {
+                    'seconds': min(timings),
+                    'sox_calls': recorder.calls,
+                    'bytes_written': recorder.bytes_written,
+                }
+            row['speedup'] = row['per_effect']['seconds'] / row['fused']['seconds']
+            results.append(row)
+            print(
+                f"{preset_name:<22} fused {row['fused']['seconds']:7.2f}s "
+                f"({row['fused']['sox_calls']} sox, {row['fused']['bytes_written'] / 1e6:7.1f} MB)  "
+                f"per-effect {row['per_effect']['seconds']:7.2f}s "
+                f"({row['per_effect']['sox_calls']} sox, {row['per_effect']['bytes_written'] / 1e6:7.1f} MB)  "
+                f"x{row['speedup']:.2f}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+class ForkCounter:
+    """Counts the processes started through pysndfx and through the SoX pool."""
+
+    def __init__(self):
+        self.forks = 0
+
+    def __enter__(self):
+        import pysndfx.dsp
+        self._targets = [(pysndfx.dsp, 'Popen'), (sox_pool.subprocess, 'Popen')]
+        self._originals = [getattr(module, name) for module, name in self._targets]
+        original_popen = subprocess.Popen
+
+        def counting_popen(*args, **kwargs):
+            self.forks += 1
+            return original_popen(*args, **kwargs)
+
+        for module, name in self._targets:
+            setattr(module, name, counting_popen)
+        return self
+
+    def __exit__(self, *exc):
+        for (module, name), original in zip(self._targets, self._originals):
+            setattr(module, name, original)
+
+
+def _legacy_sox_job(input_path, output_path, options):
+    """process_audio's SoX path as it was: pysndfx with file I/O, the loop written to a temp WAV."""
+    current_input = input_path
+    loop_path = None
+    loop_config = options.get('loop_detection', {})
+    if loop_config.get('enabled', False):
+        loop_path = audio_processor.find_and_extract_loop(
+            input_path, os.path.dirname(output_path), loop_config.get('duration_seconds', 10)
+        )
+        current_input = loop_path
+    try:
+        effects.build_chain(audio_processor.build_effect_chain(options))(current_input, output_path)
+    finally:
+        if loop_path and loop_path != input_path:
+            os.remove(loop_path)
+
+
+def bench_sox(args):
+    """SoX processes started and latency per job, pysndfx file I/O vs. the pooled pipe runner."""
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    results = []
+    try:
+        fixture = make_fixture(os.path.join(work_dir, "fixture.wav"), args.duration)
+        for preset_name in preset_registry.get_presets():
+            options = audio_processor.resolve_options({'preset': preset_name})
+            output_path = os.path.join(work_dir, f"{preset_name}.mp3")
+            row = {'preset': preset_name}
+            for mode in ('pysndfx', 'pool'):
+                timings = []
+                for _ in range(args.repeat):
+                    with ForkCounter() as counter:
+                        start = time.perf_counter()
+                        if mode == 'pysndfx':
+                            _legacy_sox_job(fixture, output_path, options)
+                        else:
+                            audio_processor.process_audio(fixture, output_path, dict(options))
+                        timings.append(time.perf_counter() - start)
+                row[mode] = {'seconds': min(timings), 'forks': counter.forks}
+            results.append(row)
+            print(
+                f"{preset_name:<22} pysndfx {row['pysndfx']['seconds']:7.2f}s ({row['pysndfx']['forks']} forks)  "
+                f"pool {row['pool']['seconds']:7.2f}s ({row['pool']['forks']} forks)"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def _legacy_analyze(path):
+    """analyze_audio as it was before the shared-STFT pass: one decode and one STFT per feature."""
+    y, sr = librosa.load(path, sr=None)
+    librosa.feature.tempo(y=y, sr=sr)
+    librosa.feature.chroma_stft(y=y, sr=sr)
+    librosa.feature.spectral_centroid(y=y, sr=sr)
+    librosa.feature.spectral_bandwidth(y=y, sr=sr)
+    librosa.feature.rms(y=y)
+
+
+def _legacy_analysis_pass(target, reference, loop_dir):
+    _legacy_analyze(target)
+    _legacy_analyze(reference)
+    loop_path = audio_processor.find_and_extract_loop(target, loop_dir)
+    os.remove(loop_path)
+
+
+def _shared_analysis_pass(target, reference, loop_dir):
+    decoded = audio_processor.decode_audio(target)
+    audio_processor.analyze_audio(target, audio=decoded)
+    audio_processor.analyze_audio(reference)
+    loop_path = audio_processor.find_and_extract_loop(target, loop_dir, audio=decoded)
+    os.remove(loop_path)
+
+
+def _profile(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mb': peak / 1e6}
+
+
+def bench_analysis(args):
+    """Profiles the style-transfer analysis and loop detection, per-feature vs. shared STFT."""
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    try:
+        target = make_fixture(os.path.join(work_dir, "target.wav"), args.duration, seed=1)
+        reference = make_fixture(os.path.join(work_dir, "reference.wav"), args.duration, seed=2)
+        results = {
+            'duration_seconds': args.duration,
+            'legacy': _profile(_legacy_analysis_pass, target, reference, work_dir),
+            'shared': _profile(_shared_analysis_pass, target, reference, work_dir),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for mode in ('legacy', 'shared'):
+        print(f"{mode:<8} {results[mode]['seconds']:8.2f}s  peak {results[mode]['peak_mb']:8.1f} MB")
+    print(f"speedup x{results['legacy']['seconds'] / results['shared']['seconds']:.2f}")
+    return results
+
+
+
+def bench_parallel(args):
+    """
+    A style-transfer job with the target and reference analyses and loop
+    detection run one after another (a pool of one) and on the analysis pool.
+    Reports the analysis phase and the whole job, and the speedup of each.
+    """
+    backend = args.backend or ('sox' if shutil.which('sox') else 'numpy')
+    workers = args.workers or os.cpu_count()
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    previous_size = os.environ.get('ANALYSIS_POOL_SIZE')
+    results = {'duration_seconds': args.duration, 'backend': backend, 'cpu_count': os.cpu_count()}
+    try:
+        target = make_fixture(os.path.join(work_dir, "target.wav"), args.duration, seed=1)
+        reference = make_fixture(os.path.join(work_dir, "reference.wav"), args.duration, seed=2)
+        output_path = os.path.join(work_dir, "out.wav")
+        for mode, size in (('sequential', 1), ('parallel', workers)):
+            os.environ['ANALYSIS_POOL_SIZE'] = str(size)
+            case = _time_case(
+                lambda: audio_processor.process_audio(
+                    target, output_path, {'preset': args.preset, 'backend': backend}, reference
+                ),
+                args.repeat, work_dir,
+            )
+            results[mode] = {
+                'workers': size,
+                'seconds': case['seconds'],
+                'analysis_seconds': case['stages'].get('style_analysis', 0.0),
+                'cpu_seconds': case['cpu_seconds'],
+            }
+    finally:
+        if previous_size is None:
+            os.environ.pop('ANALYSIS_POOL_SIZE', None)
+        else:
+            os.environ['ANALYSIS_POOL_SIZE'] = previous_size
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for mode in ('sequential', 'parallel'):
+        row = results[mode]
+        print(f"{mode:<11} {row['workers']:>2} workers  analysis {row['analysis_seconds']:7.2f}s  job {row['seconds']:7.2f}s")
+    results['analysis_speedup'] = results['sequential']['analysis_seconds'] / results['parallel']['analysis_seconds']
+    results['speedup'] = results['sequential']['seconds'] / results['parallel']['seconds']
+    print(f"speedup x{results['analysis_speedup']:.2f} (analysis), x{results['speedup']:.2f} (job) on {os.cpu_count()} CPUs")
+    return results
+
+def bench_streaming(args):
+    """Peak memory and wall time of the streaming mode across input lengths."""
+    chain = audio_processor.build_effect_chain(audio_processor.resolve_options({'preset': args.preset}))
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    results = []
+    try:
+        for minutes in args.minutes:
+            fixture = make_fixture(os.path.join(work_dir, "fixture.wav"), minutes * 60)
+            output_path = os.path.join(work_dir, "out.wav")
+            row = {'minutes': minutes}
+            row['streaming'] = _profile(numpy_effects.process_file_streaming, fixture, output_path, chain)
+            if args.compare_in_memory:
+                row['in_memory'] = _profile(
+                    audio_processor.process_audio, fixture, output_path, {'preset': args.preset, 'backend': 'numpy'}
+                )
+            results.append(row)
+            line = f"{minutes:>5} min  streaming {row['streaming']['seconds']:8.2f}s peak {row['streaming']['peak_mb']:8.1f} MB"
+            if args.compare_in_memory:
+                line += f"  in-memory {row['in_memory']['seconds']:8.2f}s peak {row['in_memory']['peak_mb']:8.1f} MB"
+            print(line)
+            os.remove(fixture)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+VAPORISER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vaporiser.py")
+
+
+def bench_batch(args):
+    """
+    Throughput of vaporiser.py in files/minute: one invocation per file (the
+    single-file path, paying interpreter start-up and imports every time)
+    against one batch-mode invocation over the whole directory.
+    """
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    try:
+        input_dir = os.path.join(work_dir, "inputs")
+        os.makedirs(input_dir)
+        inputs = [
+            make_fixture(os.path.join(input_dir, f"track_{i:03d}.wav"), args.duration, seed=i)
+            for i in range(args.files)
+        ]
+
+        start = time.perf_counter()
+        for path in inputs:
+            output = os.path.join(work_dir, "single", os.path.splitext(os.path.basename(path))[0])
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            subprocess.run([sys.executable, VAPORISER, "-a", path, "-o", output], check=True, capture_output=True)
+        single_seconds = time.perf_counter() - start
+
+        command = [sys.executable, VAPORISER, "-d", input_dir, "-o", os.path.join(work_dir, "batch")]
+        if args.jobs:
+            command += ["-j", str(args.jobs)]
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        batch_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'files': args.files,
+        'duration_seconds': args.duration,
+        'jobs': args.jobs or os.cpu_count(),
+        'single': {'seconds': single_seconds, 'files_per_minute': args.files / single_seconds * 60},
+        'batch': {'seconds': batch_seconds, 'files_per_minute': args.files / batch_seconds * 60},
+    }
+    for mode in ('single', 'batch'):
+        print(f"{mode:<8} {results[mode]['seconds']:8.2f}s  {results[mode]['files_per_minute']:8.1f} files/min")
+    print(f"speedup x{single_seconds / batch_seconds:.2f}")
+    return results
+
+
+def make_gif(path, frames=24, size=(160, 120), fps=12, seed=0):
+    """Writes a synthetic animated GIF of moving noise blobs to path."""
+    import imageio
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    images = [np.roll(base, shift=4 * i, axis=1) for i in range(frames)]
+    imageio.mimsave(path, images, duration=1 / fps)
+    return path
+
+
+def _legacy_sobel_video(audio_path, gif_path, video_path):
+    """vaporiser's --sobel video path as it was: the filter runs on every frame of the loop."""
+    import moviepy.editor as movedit
+    from skimage.filters import sobel
+    audio = movedit.AudioFileClip(audio_path)
+    gif = movedit.VideoFileClip(gif_path)
+    looped = gif.loop(float(audio.duration / gif.duration)).fl_image(lambda image: sobel(image.astype(float)))
+    looped.set_audio(audio).write_videofile(video_path, logger=None)
+
+
+def bench_video(args):
+    """
+    Render time of the vaporiser --sobel video path against track length:
+    per-frame filtering, cached frames, and cached frames with --fast-video.
+    """
+    import vaporiser
+    modes = {
+        'per_frame': _legacy_sobel_video,
+        'cached': lambda audio, gif, video: vaporiser.render_video(
+            audio, gif, video, sobel_filter=True, jobs=args.jobs, preset=args.preset
+        ),
+        'fast': lambda audio, gif, video: vaporiser.render_video(
+            audio, gif, video, sobel_filter=True, jobs=args.jobs, fast=True, preset=args.preset
+        ),
+    }
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+    results = []
+    try:
+        gif_path = make_gif(os.path.join(work_dir, "loop.gif"), frames=args.gif_frames)
+        for seconds in args.seconds:
+            audio_path = make_fixture(os.path.join(work_dir, "audio.wav"), seconds)
+            row = {'seconds': seconds}
+            for mode, render in modes.items():
+                start = time.perf_counter()
+                render(audio_path, gif_path, os.path.join(work_dir, f"{mode}.mp4"))
+                row[mode] = time.perf_counter() - start
+            results.append(row)
+            print(
+                f"{seconds:>6.0f}s track  per-frame {row['per_frame']:8.2f}s  cached {row['cached']:8.2f}s"
+                f"  fast {row['fast']:8.2f}s  x{row['per_frame'] / row['fast']:.1f}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def _fixture_id(duration, sr, channels):
+    return f"{duration:g}s_{sr}hz_{channels}ch"
+
+
+def _time_case(func, repeat, work_dir, warmup=1):
+    """
+    Runs func warmup times untimed (imports, JIT compilation, the SoX pool),
+    then repeat times. Each run is a span and starts with an empty analysis
+    store, so none is served from the previous run's results. Returns the
+    fastest timed run's figures, with its stages' wall times.
+    """
+    runs = []
+    previous_db = os.environ.get('ANALYSIS_DB_PATH')
+    try:
+        for i in range(warmup + repeat):
+            os.environ['ANALYSIS_DB_PATH'] = os.path.join(work_dir, f"analysis_{uuid.uuid4()}.sqlite3")
+            with spans.collect() as stages:
+                with spans.span('case'):
+                    func()
+            if i >= warmup:
+                runs.append(stages)
+    finally:
+        if previous_db is None:
+            os.environ.pop('ANALYSIS_DB_PATH', None)
+        else:
+            os.environ['ANALYSIS_DB_PATH'] = previous_db
+    fastest = min(runs, key=lambda stages: stages[-1]['wall_seconds'])
+    case = fastest[-1]
+    breakdown = {}
+    for stage in fastest[:-1]:
+        if stage['parent'] == 'case':
+            breakdown[stage['stage']] = breakdown.get(stage['stage'], 0.0) + stage['wall_seconds']
+    return {
+        'seconds': case['wall_seconds'],
+        'median_seconds': float(np.median([stages[-1]['wall_seconds'] for stages in runs])),
+        'cpu_seconds': case['cpu_seconds'],
+        'peak_rss_mb': case['peak_rss_bytes'] / 1e6,
+        'stages': breakdown,
+    }
+
+
+def _environment():
+    sox_version = None
+    if shutil.which('sox'):
+        sox_version = subprocess.run(['sox', '--version'], capture_output=True, text=True).stdout.strip()
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'librosa': librosa.__version__,
+        'soundfile': sf.__version__,
+        'sox': sox_version,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Returns the cases that are slower than in the baseline by more than
+    tolerance (a fraction of the baseline time) and more than min_seconds,
+    so timer noise on very short cases isn't reported. Cases missing from
+    either side are skipped.
+    """
+    regressions = []
+    for case, current in results['cases'].items():
+        previous = baseline['cases'].get(case)
+        if previous is None:
+            continue
+        if current['seconds'] - previous['seconds'] > min_seconds and \
+                current['seconds'] > previous['seconds'] * (1 + tolerance):
+            regressions.append({
+                'case': case,
+                'baseline_seconds': previous['seconds'],
+                'seconds': current['seconds'],
+                'ratio': current['seconds'] / previous['seconds'],
+            })
+    return regressions
+
+
+def bench_suite(args):
+    """
+    Times process_audio for every preset and backend, with and without a
+    reference track, plus analyze_audio, find_and_extract_loop and
+    (with --video) the vaporiser video path, on synthetic fixtures of each
+    requested length, sample rate and channel count.
+    """
+    presets = args.presets or list(preset_registry.get_presets())
+    backends = args.backends or list(audio_processor.EFFECT_BACKENDS)
+    if 'sox' in backends and not shutil.which('sox'):
+        print("SoX is not installed; skipping the sox backend.")
+        backends = [backend for backend in backends if backend != 'sox']
+    cases = {}
+    work_dir = tempfile.mkdtemp(prefix="slushwave_bench_")
+
+    def run(case, func):
+        cases[case] = _time_case(func, args.repeat, work_dir, args.warmup)
+        print(f"{case:<72} {cases[case]['seconds']:8.3f}s  peak {cases[case]['peak_rss_mb']:8.1f} MB")
+
+    try:
+        gif_path = make_gif(os.path.join(work_dir, "loop.gif")) if args.video else None
+        for duration in args.durations:
+            for sr in args.sample_rates:
+                for channels in args.channels:
+                    fixture_id = _fixture_id(duration, sr, channels)
+                    target = make_fixture(os.path.join(work_dir, f"{fixture_id}.wav"), duration, sr, channels, seed=1)
+                    reference = make_fixture(
+                        os.path.join(work_dir, f"{fixture_id}_reference.wav"), duration, sr, channels, seed=2
+                    )
+                    output_path = os.path.join(work_dir, "out.wav")
+                    for preset_name in presets:
+                        for backend in backends:
+                            for reference_path in (None, reference):
+                                label = 'reference' if reference_path else 'no_reference'
+                                run(
+                                    f"process_audio/{preset_name}/{backend}/{label}/{fixture_id}",
+                                    lambda: audio_processor.process_audio(
+                                        target, output_path, {'preset': preset_name, 'backend': backend}, reference_path
+                                    ),
+                                )
+                    run(f"analyze_audio/{fixture_id}", lambda: audio_processor.analyze_audio(target))
+                    run(
+                        f"find_and_extract_loop/{fixture_id}",
+                        lambda: os.remove(audio_processor.find_and_extract_loop(target, work_dir)),
+                    )
+                    if args.video:
+                        import vaporiser
+                        run(
+                            f"video/{fixture_id}",
+                            lambda: vaporiser.render_video(
+                                target, gif_path, os.path.join(work_dir, "out.mp4"), sobel_filter=True, fast=True
+                            ),
+                        )
+                    os.remove(target)
+                    os.remove(reference)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'environment': _environment(),
+        'config': {
+            'durations': args.durations,
+            'sample_rates': args.sample_rates,
+            'channels': args.channels,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+        },
+        'cases': cases,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results['regressions'] = compare(results, baseline.get('results', baseline), args.tolerance, args.min_seconds)
+        for regression in results['regressions']:
+            print(
+                f"REGRESSION {regression['case']}: {regression['baseline_seconds']:.3f}s -> "
+                f"{regression['seconds']:.3f}s (x{regression['ratio']:.2f})"
+            )
+        if not results['regressions']:
+            print(f"No regressions against {args.baseline}.")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmarks for the slushwave audio processing pipeline.",
+    )
+    parser.add_argument(
+        "--output", dest="output", help="Write results as JSON to this file.", type=str
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    chain_parser = subparsers.add_parser(
+        "chain", help="Fused single-pass SoX chain vs. one SoX call per effect, per preset."
+    )
+    chain_parser.add_argument(
+        "--duration", help="Length of the synthetic input (seconds).", type=float, default=60
+    )
+    chain_parser.add_argument(
+        "--repeat", help="Runs per measurement; the fastest is reported.", type=int, default=3
+    )
+    chain_parser.set_defaults(func=bench_chain)
+
+    sox_parser = subparsers.add_parser(
+        "sox", help="SoX processes and latency per job, pysndfx file I/O vs. the pooled pipe runner."
+    )
+    sox_parser.add_argument(
+        "--duration", help="Length of the synthetic input (seconds).", type=float, default=60
+    )
+    sox_parser.add_argument(
+        "--repeat", help="Runs per measurement; the fastest is reported.", type=int, default=3
+    )
+    sox_parser.set_defaults(func=bench_sox)
+
+    analysis_parser = subparsers.add_parser(
+        "analysis", help="Style-transfer analysis and loop detection, per-feature vs. shared STFT."
+    )
+    analysis_parser.add_argument(
+        "--duration", help="Length of the synthetic tracks (seconds).", type=float, default=600
+    )
+    analysis_parser.set_defaults(func=bench_analysis)
+
+    parallel_parser = subparsers.add_parser(
+        "parallel", help="Style-transfer analysis and loop detection, one after another vs. on the analysis pool."
+    )
+    parallel_parser.add_argument(
+        "--duration", help="Length of the synthetic tracks (seconds).", type=float, default=300
+    )
+    parallel_parser.add_argument(
+        "--preset", help="Preset to render (loop detection is part of the parallel phase).", type=str,
+        default="slushwave"
+    )
+    parallel_parser.add_argument(
+        "--backend", help="Effect backend (default: sox if installed, else numpy).", type=str,
+        choices=audio_processor.EFFECT_BACKENDS, default=None
+    )
+    parallel_parser.add_argument(
+        "--workers", help="Analysis pool size for the parallel run (default: number of CPUs).", type=int, default=None
+    )
+    parallel_parser.add_argument(
+        "--repeat", help="Runs per measurement; the fastest is reported.", type=int, default=3
+    )
+    parallel_parser.set_defaults(func=bench_parallel)
+
+    streaming_parser = subparsers.add_parser(
+        "streaming", help="Peak memory and time of the streaming mode across input lengths."
+    )
+    streaming_parser.add_argument(
+        "--minutes", help="Input lengths to test (minutes).", type=float, nargs="+", default=[1, 5, 15, 30, 60]
+    )
+    streaming_parser.add_argument(
+        "--preset", help="Preset to render (must not use loop detection).", type=str, default="chopped_and_screwed"
+    )
+    streaming_parser.add_argument(
+        "--compare-in-memory",
+        dest="compare_in_memory",
+        help="Also run the whole-file NumPy backend (needs memory proportional to length).",
+        action="store_true",
+    )
+    streaming_parser.set_defaults(func=bench_streaming)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="vaporiser.py throughput in files/minute, one run per file vs. batch mode."
+    )
+    batch_parser.add_argument(
+        "--files", help="Number of synthetic tracks.", type=int, default=20
+    )
+    batch_parser.add_argument(
+        "--duration", help="Length of each track (seconds).", type=float, default=30
+    )
+    batch_parser.add_argument(
+        "--jobs", help="Batch-mode worker processes (default: number of CPUs).", type=int, default=None
+    )
+    batch_parser.set_defaults(func=bench_batch)
+
+    video_parser = subparsers.add_parser(
+        "video", help="vaporiser --sobel video render time vs. track length: per-frame, cached frames, fast video."
+    )
+    video_parser.add_argument(
+        "--seconds", help="Track lengths to render (seconds).", type=float, nargs="+", default=[30, 60, 120, 240]
+    )
+    video_parser.add_argument(
+        "--gif-frames", dest="gif_frames", help="Unique frames in the synthetic GIF.", type=int, default=24
+    )
+    video_parser.add_argument(
+        "--jobs", help="Worker processes for the Sobel frames (default: number of CPUs).", type=int, default=None
+    )
+    video_parser.add_argument(
+        "--preset", help="x264 encoder preset for the cached and fast modes.", type=str, default="medium"
+    )
+    video_parser.set_defaults(func=bench_video)
+
+    suite_parser = subparsers.add_parser(
+        "suite", help="Every preset, backend and fixture size, with an optional regression check."
+    )
+    suite_parser.add_argument(
+        "--durations", help="Fixture lengths (seconds).", type=float, nargs="+", default=[30]
+    )
+    suite_parser.add_argument(
+        "--sample-rates", dest="sample_rates", help="Fixture sample rates.", type=int, nargs="+", default=[44100]
+    )
+    suite_parser.add_argument(
+        "--channels", help="Fixture channel counts.", type=int, nargs="+", default=[2]
+    )
+    suite_parser.add_argument(
+        "--presets", help="Presets to run (default: all in presets.json).", type=str, nargs="+", default=None
+    )
+    suite_parser.add_argument(
+        "--backends", help="Effect backends to run (default: all).", type=str, nargs="+",
+        choices=audio_processor.EFFECT_BACKENDS, default=None
+    )
+    suite_parser.add_argument(
+        "--repeat", help="Runs per case; the fastest is compared.", type=int, default=3
+    )
+    suite_parser.add_argument(
+        "--warmup", help="Untimed runs per case before the timed ones.", type=int, default=1
+    )
+    suite_parser.add_argument(
+        "--video", help="Also time the vaporiser --sobel --fast-video path (needs moviepy).", action="store_true"
+    )
+    suite_parser.add_argument(
+        "--baseline", help="JSON results of an earlier suite run to check against.", type=str, default=None
+    )
+    suite_parser.add_argument(
+        "--tolerance", help="Allowed slowdown against the baseline, as a fraction.", type=float, default=0.25
+    )
+    suite_parser.add_argument(
+        "--min-seconds", dest="min_seconds", help="Slowdowns smaller than this are never reported.",
+        type=float, default=0.05
+    )
+    suite_parser.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    results = args.func(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'benchmark': args.benchmark, 'results': results}, f, indent=2)
+    if isinstance(results, dict) and results.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
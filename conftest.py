@@ -14,3 +14,32 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+@pytest.fixture(autouse=True)
+def cost_db(tmp_path, monkeypatch):
+    """Keeps recorded job timings and backlog out of the real cost store."""
+    path = str(tmp_path / 'costs.sqlite3')
+    monkeypatch.setenv('COST_DB_PATH', path)
+    return path
+
+@pytest.fixture(autouse=True)
+def output_index_db(tmp_path, monkeypatch):
+    """Keeps recorded outputs out of the real output index."""
+    path = str(tmp_path / 'outputs.sqlite3')
+    monkeypatch.setenv('OUTPUT_INDEX_DB_PATH', path)
+    return path
+
+@pytest.fixture(autouse=True)
+def upload_folder(app, tmp_path, monkeypatch):
+    """Keeps uploads out of the real upload folder."""
+    path = str(tmp_path / 'uploads')
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', path)
+    return path
+
+@pytest.fixture(autouse=True)
+def output_storage(tmp_path, monkeypatch):
+    """Outputs go to a sharded folder under tmp_path."""
+    import storage
+    output_storage = storage.LocalStorage(str(tmp_path / 'outputs'))
+    monkeypatch.setattr(storage, '_storage', output_storage)
+    return output_storage
@@ -0,0 +1,183 @@
+# cost_model.py
+"""
+Processing-cost estimates for slushify jobs, from the input's header alone.
+
+Costs are in seconds of worker time. A static per-effect model is scaled by a
+per-preset calibration factor learned from recorded task timings; the same
+SQLite file tracks the estimated work still queued, for ETAs.
+"""
+import math
+import os
+import time
+
+import preset_registry
+import sqlite_store
+
+DEFAULT_DB_PATH = 'slushwave-vaporizer/backend/costs.sqlite3'
+
+# How many recent timings per preset the calibration factor is averaged over.
+CALIBRATION_WINDOW = 50
+# Pending entries of jobs that never reported back (e.g. a killed worker) expire.
+PENDING_TTL_SECONDS = 6 * 3600
+
+# Worker seconds per second of audio. BASE covers decode and encode.
+BASE_COST = 0.02
+EFFECT_COSTS = {
+    'pitch_shift': 0.05,
+    'reverb': 0.03,
+    'speed': 0.02,
+    'compand': 0.01,
+    'phaser': 0.01,
+}
+DEFAULT_EFFECT_COST = 0.005
+# Encoding each requested output format (plus the preview), per second of rendered audio.
+ENCODE_COSTS = {'wav': 0.001, 'flac': 0.005, 'mp3': 0.03, 'opus': 0.04}
+# Style-transfer analysis, per second of target and reference audio.
+ANALYSIS_COST = 0.1
+# Loop detection scans the whole input, then only the loop is rendered.
+LOOP_SCAN_COST = 0.005
+
+# Used to guess the duration when libsndfile can't read the header (e.g. m4a).
+ASSUMED_BITRATE = 128000
+
+PRIORITY_STEPS = 10
+
+def probe(path):
+    """Returns the duration, sample rate and channels from the file header, or None."""
+    import soundfile as sf
+    try:
+        info = sf.info(path)
+    except RuntimeError:
+        return None
+    return {'duration': info.duration, 'samplerate': info.samplerate, 'channels': info.channels}
+
+def estimate_duration(path):
+    """Duration in seconds from the header, or guessed from the file size."""
+    info = probe(path)
+    if info is not None:
+        return info['duration']
+    return os.path.getsize(path) * 8 / ASSUMED_BITRATE
+
+def estimate_seconds(duration, options, reference_duration=None, sample_rate=None):
+    """
+    Uncalibrated worker seconds to render duration seconds of audio with the
+    given options. sample_rate is the input's rate, used to credit a
+    'max_sample_rate' downsample.
+    """
+    from audio_processor import PREVIEW_SECONDS, PREVIEW_SAMPLE_RATE
+    plan = preset_registry.compile_plan(options or {})
+    options = plan.options
+    preview = options.get('preview', False)
+    rendered = duration
+    cost = 0.0
+    loop_config = options.get('loop_detection', {})
+    if loop_config.get('enabled', False):
+        rendered = min(duration, loop_config.get('duration_seconds', 10))
+        cost += LOOP_SCAN_COST * duration
+    elif preview:
+        rendered = min(duration, options.get('preview_seconds', PREVIEW_SECONDS))
+    effects_cost = sum(
+        EFFECT_COSTS.get(effect_name, DEFAULT_EFFECT_COST) for effect_name, _params in plan.chain
+    )
+    if options.get('max_sample_rate') and sample_rate:
+        effects_cost *= min(1.0, options['max_sample_rate'] / sample_rate)
+    if preview and sample_rate:
+        # Previews run mono at a reduced rate.
+        effects_cost *= min(1.0, PREVIEW_SAMPLE_RATE / sample_rate)
+    cost += (BASE_COST + effects_cost) * rendered
+    if options.get('formats'):
+        from output_formats import PREVIEW_FORMAT, parse
+        specs = options['formats'] if preview else options['formats'] + [PREVIEW_FORMAT]
+        codecs = [parse(spec)[0] for spec in specs]
+        cost += sum(ENCODE_COSTS[codec] for codec in codecs) * rendered
+    if reference_duration is not None:
+        cost += ANALYSIS_COST * (duration + reference_duration)
+    return cost
+
+def calibration_key(options, reference_path=None):
+    """Jobs are calibrated per preset, with style transfer counted separately."""
+    key = (options or {}).get('preset') or 'custom'
+    return f"{key}+reference" if reference_path else key
+
+def estimate_job(input_path, options, reference_path=None, calibrated=True):
+    """Estimated worker seconds for a slushify job on local files."""
+    info = probe(input_path)
+    duration = info['duration'] if info else estimate_duration(input_path)
+    reference_duration = estimate_duration(reference_path) if reference_path else None
+    seconds = estimate_seconds(duration, options, reference_duration, info['samplerate'] if info else None)
+    if calibrated:
+        seconds *= calibration_factor(calibration_key(options, reference_path))
+    return seconds
+
+def priority_for(cost_seconds):
+    """
+    Maps a cost to a broker priority. With the Redis transport 0 is served
+    first, so cheap jobs get low numbers; each step doubles the cost.
+    """
+    return min(PRIORITY_STEPS - 1, int(math.log2(1 + max(cost_seconds, 0.0))))
+
+# --- Timings and pending work ---
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS timings ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' calibration_key TEXT NOT NULL,'
+    ' estimated REAL NOT NULL,'
+    ' actual REAL NOT NULL,'
+    ' created_at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS timings_key ON timings (calibration_key, id)',
+    'CREATE TABLE IF NOT EXISTS pending ('
+    ' task_id TEXT PRIMARY KEY,'
+    ' queue TEXT NOT NULL,'
+    ' seconds REAL NOT NULL,'
+    ' created_at REAL NOT NULL)',
+)
+
+def _execute(sql, params=(), fetch=False, db_path=None):
+    db_path = db_path or os.environ.get('COST_DB_PATH', DEFAULT_DB_PATH)
+    return sqlite_store.execute(db_path, SCHEMA, sql, params, fetch, name='Cost model store')
+
+def record_timing(key, estimated, actual, db_path=None):
+    """Records a finished job's uncalibrated estimate and actual wall time."""
+    if estimated <= 0:
+        return False
+    return _execute(
+        'INSERT INTO timings (calibration_key, estimated, actual, created_at) VALUES (?, ?, ?, ?)',
+        (key, estimated, actual, time.time()), db_path=db_path
+    )
+
+def calibration_factor(key, db_path=None):
+    """Ratio of actual to estimated time over the preset's recent jobs; 1.0 without history."""
+    rows = _execute(
+        'SELECT SUM(estimated), SUM(actual) FROM ('
+        ' SELECT estimated, actual FROM timings WHERE calibration_key = ? ORDER BY id DESC LIMIT ?)',
+        (key, CALIBRATION_WINDOW), fetch=True, db_path=db_path
+    )
+    if not rows or not rows[0][0]:
+        return 1.0
+    return rows[0][1] / rows[0][0]
+
+def add_pending(task_id, queue, seconds, db_path=None):
+    """Counts a dispatched job's estimate towards its queue's backlog, unless the job already finished."""
+    return _execute(
+        'INSERT OR IGNORE INTO pending (task_id, queue, seconds, created_at) VALUES (?, ?, ?, ?)',
+        (task_id, queue, seconds, time.time()), db_path=db_path
+    )
+
+def mark_done(task_id, db_path=None):
+    """
+    Takes a finished job out of the backlog. Its row is zeroed rather than
+    deleted until it expires, so a late add_pending for a fast job is ignored.
+    """
+    return _execute(
+        'INSERT OR REPLACE INTO pending (task_id, queue, seconds, created_at) VALUES (?, ?, 0, ?)',
+        (task_id, '', time.time()), db_path=db_path
+    )
+
+def pending_seconds(queue, now=None, db_path=None):
+    """Estimated worker seconds of the jobs queued or running on a queue."""
+    if now is None:
+        now = time.time()
+    _execute('DELETE FROM pending WHERE created_at < ?', (now - PENDING_TTL_SECONDS,), db_path=db_path)
+    rows = _execute('SELECT SUM(seconds) FROM pending WHERE queue = ?', (queue,), fetch=True, db_path=db_path)
+    return (rows[0][0] or 0.0) if rows else 0.0
@@ -1,51 +1,133 @@
 # effects.py
-from pysndfx import AudioEffectsChain
-
-def _apply_fx(infile, outfile, fx_chain):
-    """Helper to apply an effects chain and handle errors."""
-    try:
-        fx_chain(infile, outfile)
-    except Exception as e:
-        if "sox: not found" in str(e) or "SoX" in str(e):
-             raise RuntimeError("SoX command not found. Please ensure SoX is installed and in your system's PATH.") from e
-        raise e
-
-def apply_bass_boost(infile, outfile, gain=5):
-    fx = AudioEffectsChain().custom(f'bass {gain}')
-    _apply_fx(infile, outfile, fx)
-
-def apply_pitch_shift(infile, outfile, shift=-75):
-    fx = AudioEffectsChain().pitch(shift)
-    _apply_fx(infile, outfile, fx)
-
-def apply_oops(infile, outfile):
-    fx = AudioEffectsChain().custom("oops")
-    _apply_fx(infile, outfile, fx)
-
-def apply_tremolo(infile, outfile, freq=500, depth=50):
-    fx = AudioEffectsChain().tremolo(freq, depth)
-    _apply_fx(infile, outfile, fx)
-
-def apply_phaser(infile, outfile):
-    fx = AudioEffectsChain().phaser(0.9, 0.8, 2, 0.2, 0.5)
-    _apply_fx(infile, outfile, fx)
-
-def apply_gain(infile, outfile, db=0):
-    fx = AudioEffectsChain().gain(db)
-    _apply_fx(infile, outfile, fx)
-
-def apply_compand(infile, outfile):
-    fx = AudioEffectsChain().compand()
-    _apply_fx(infile, outfile, fx)
-
-def apply_speed(infile, outfile, ratio=0.75):
-    fx = AudioEffectsChain().speed(ratio)
-    _apply_fx(infile, outfile, fx)
-
-def apply_lowpass(infile, outfile, cutoff=3500):
-    fx = AudioEffectsChain().lowpass(cutoff)
-    _apply_fx(infile, outfile, fx)
-
-def apply_reverb(infile, outfile):
-    fx = AudioEffectsChain().reverb()
-    _apply_fx(infile, outfile, fx)
+import sox_pool
+
+# Bump when an effect's output changes, so cached results are invalidated.
+BACKEND_VERSION = 'sox-1'
+
+def _apply_fx(infile, outfile, fx_chain, **output):
+    """
+    Runs an effects chain in one SoX process from the worker's pool. infile is
+    a path or a (y, sr) buffer; with outfile=None the result is returned as a
+    (y, sr) buffer instead of being written. output is passed on to
+    sox_pool.run (output_rate, lossless).
+    """
+    return sox_pool.run(fx_chain.command, infile, outfile, **output)
+
+def _new_chain():
+    # pysndfx imports numpy, so it is loaded with the first chain rather than with this module.
+    from pysndfx import AudioEffectsChain
+    return AudioEffectsChain()
+
+# --- Chain builders ---
+# Each builder appends one effect to an existing AudioEffectsChain, so the same
+# definition serves both the single-effect apply_* functions and the fused chain.
+
+def _add_bass_boost(fx, gain=5):
+    return fx.custom(f'bass {gain}')
+
+def _add_pitch_shift(fx, shift=-75):
+    return fx.pitch(shift)
+
+def _add_oops(fx):
+    return fx.custom("oops")
+
+def _add_tremolo(fx, freq=500, depth=50):
+    return fx.tremolo(freq, depth)
+
+def _add_phaser(fx):
+    return fx.phaser(0.9, 0.8, 2, 0.2, 0.5)
+
+def _add_gain(fx, db=0):
+    return fx.gain(db)
+
+def _add_compand(fx):
+    return fx.compand()
+
+def _add_speed(fx, ratio=0.75):
+    return fx.speed(ratio)
+
+def _add_lowpass(fx, cutoff=3500):
+    return fx.lowpass(cutoff)
+
+def _add_reverb(fx):
+    return fx.reverb()
+
+def _add_rate(fx, sample_rate=22050):
+    return fx.custom(f'rate {sample_rate}')
+
+CHAIN_BUILDERS = {
+    'bass_boost': _add_bass_boost,
+    'pitch_shift': _add_pitch_shift,
+    'oops': _add_oops,
+    'tremolo': _add_tremolo,
+    'phaser': _add_phaser,
+    'gain': _add_gain,
+    'compand': _add_compand,
+    'speed': _add_speed,
+    'lowpass': _add_lowpass,
+    'reverb': _add_reverb,
+    'rate': _add_rate,
+}
+
+def build_chain(effect_chain):
+    """
+    Compiles a list of (effect_name, params) tuples into a single AudioEffectsChain,
+    so the whole chain runs in one SoX invocation.
+    """
+    fx = _new_chain()
+    for effect_name, params in effect_chain:
+        if effect_name not in CHAIN_BUILDERS:
+            raise ValueError(f"Unknown effect: {effect_name}")
+        fx = CHAIN_BUILDERS[effect_name](fx, **params)
+    return fx
+
+def apply_chain(infile, outfile, effect_chain, **output):
+    """Applies a whole effect chain in one pass, without intermediate files."""
+    return _apply_fx(infile, outfile, build_chain(effect_chain), **output)
+
+# --- Single-effect functions ---
+# Each takes the same output keywords as apply_chain.
+
+def apply_bass_boost(infile, outfile, gain=5, **output):
+    fx = _add_bass_boost(_new_chain(), gain)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_pitch_shift(infile, outfile, shift=-75, **output):
+    fx = _add_pitch_shift(_new_chain(), shift)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_oops(infile, outfile, **output):
+    fx = _add_oops(_new_chain())
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_tremolo(infile, outfile, freq=500, depth=50, **output):
+    fx = _add_tremolo(_new_chain(), freq, depth)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_phaser(infile, outfile, **output):
+    fx = _add_phaser(_new_chain())
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_gain(infile, outfile, db=0, **output):
+    fx = _add_gain(_new_chain(), db)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_compand(infile, outfile, **output):
+    fx = _add_compand(_new_chain())
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_speed(infile, outfile, ratio=0.75, **output):
+    fx = _add_speed(_new_chain(), ratio)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_lowpass(infile, outfile, cutoff=3500, **output):
+    fx = _add_lowpass(_new_chain(), cutoff)
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_reverb(infile, outfile, **output):
+    fx = _add_reverb(_new_chain())
+    return _apply_fx(infile, outfile, fx, **output)
+
+def apply_rate(infile, outfile, sample_rate=22050, **output):
+    fx = _add_rate(_new_chain(), sample_rate)
+    return _apply_fx(infile, outfile, fx, **output)
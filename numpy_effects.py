@@ -0,0 +1,439 @@
+# numpy_effects.py
+"""
+In-memory effects backend.
+
+Mirrors effects.py, but every effect takes and returns a float32 array of shape
+(channels, samples) instead of reading and writing files through SoX. The
+algorithms follow the corresponding SoX effects closely enough that outputs
+match the SoX backend within the tolerances in test_numpy_effects.py.
+"""
+import librosa
+import numpy as np
+from numba import njit
+from scipy.signal import lfilter
+import soundfile as sf
+import soxr
+
+# Bump when an effect's output changes, so cached results are invalidated.
+BACKEND_VERSION = 'numpy-1'
+
+# pysndfx writes every output at this rate; matching it keeps both backends interchangeable.
+OUTPUT_SAMPLE_RATE = 44100
+
+def _as_channels(y):
+    """Returns y as a float32 (channels, samples) array."""
+    return np.atleast_2d(np.asarray(y, dtype=np.float32))
+
+# --- Biquads (RBJ audio EQ cookbook, as used by SoX) ---
+
+def lowpass_coefficients(sr, cutoff, q=0.707):
+    w0 = 2 * np.pi * cutoff / sr
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+    a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+    return b / a[0], a / a[0]
+
+def low_shelf_coefficients(sr, gain, frequency=100, slope=0.5):
+    A = 10 ** (gain / 40)
+    w0 = 2 * np.pi * frequency / sr
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / 2 * np.sqrt((A + 1 / A) * (1 / slope - 1) + 2)
+    sqrt_a_alpha = 2 * np.sqrt(A) * alpha
+    b = np.array([
+        A * ((A + 1) - (A - 1) * cos_w0 + sqrt_a_alpha),
+        2 * A * ((A - 1) - (A + 1) * cos_w0),
+        A * ((A + 1) - (A - 1) * cos_w0 - sqrt_a_alpha),
+    ])
+    a = np.array([
+        (A + 1) + (A - 1) * cos_w0 + sqrt_a_alpha,
+        -2 * ((A - 1) + (A + 1) * cos_w0),
+        (A + 1) + (A - 1) * cos_w0 - sqrt_a_alpha,
+    ])
+    return b / a[0], a / a[0]
+
+# --- Recursive kernels that cannot be expressed as array operations ---
+# Each kernel updates its state arrays in place, so a signal can be processed
+# in consecutive blocks with the same result as in one pass.
+
+@njit(cache=True)
+def _phaser_kernel(x, in_gain, out_gain, decay, delay_buf, mod_buf, positions):
+    out = np.empty_like(x)
+    delay_len = len(delay_buf)
+    mod_len = len(mod_buf)
+    delay_pos = positions[0]
+    mod_pos = positions[1]
+    for i in range(len(x)):
+        d = x[i] * in_gain + delay_buf[(delay_pos + mod_buf[mod_pos]) % delay_len] * decay
+        mod_pos = (mod_pos + 1) % mod_len
+        delay_pos = (delay_pos + 1) % delay_len
+        delay_buf[delay_pos] = d
+        out[i] = d * out_gain
+    positions[0] = delay_pos
+    positions[1] = mod_pos
+    return out
+
+@njit(cache=True)
+def _envelope_kernel(level, attack_coef, decay_coef, state):
+    envelope = np.empty_like(level)
+    volume = state[0]
+    for i in range(len(level)):
+        delta = level[i] - volume
+        if delta > 0:
+            volume += delta * attack_coef
+        else:
+            volume += delta * decay_coef
+        envelope[i] = volume
+    state[0] = volume
+    return envelope
+
+@njit(cache=True)
+def _freeverb_kernel(x, comb_sizes, allpass_sizes, feedback, hf_damping, gain,
+                     comb_buf, comb_pos, comb_store, allpass_buf, allpass_pos):
+    n_comb = len(comb_sizes)
+    n_allpass = len(allpass_sizes)
+    out = np.empty_like(x)
+    for i in range(len(x)):
+        acc = 0.0
+        for c in range(n_comb - 1, -1, -1):
+            output = comb_buf[c, comb_pos[c]]
+            comb_store[c] = output + (comb_store[c] - output) * hf_damping
+            comb_buf[c, comb_pos[c]] = x[i] + comb_store[c] * feedback
+            comb_pos[c] = (comb_pos[c] + 1) % comb_sizes[c]
+            acc += output
+        for a in range(n_allpass - 1, -1, -1):
+            output = allpass_buf[a, allpass_pos[a]]
+            allpass_buf[a, allpass_pos[a]] = acc + output * 0.5
+            allpass_pos[a] = (allpass_pos[a] + 1) % allpass_sizes[a]
+            acc = output - acc
+        out[i] = acc * gain
+    return out
+
+# --- Effects ---
+
+def bass_boost(y, sr, gain=5):
+    b, a = low_shelf_coefficients(sr, gain)
+    return lfilter(b, a, y, axis=-1).astype(np.float32)
+
+def pitch_shift(y, sr, shift=-75):
+    # SoX takes the shift in cents, librosa in semitones.
+    return librosa.effects.pitch_shift(y, sr=sr, n_steps=shift / 100)
+
+def oops(y, sr):
+    # SoX 'oops' is 'remix 1,2i 1,2i': both outputs carry left minus right.
+    if y.shape[0] < 2:
+        return y
+    side = y[0] - y[1]
+    return np.stack([side, side]).astype(np.float32)
+
+def tremolo(y, sr, freq=500, depth=50):
+    # SoX tremolo is a sine amplitude modulation between (1 - depth) and 1, starting at the peak.
+    return _TremoloStage(sr, y.shape[0], freq, depth).process(y)
+
+def phaser(y, sr, gain_in=0.9, gain_out=0.8, delay=2, decay=0.2, speed=0.5):
+    return _PhaserStage(sr, y.shape[0], gain_in, gain_out, delay, decay, speed).process(y)
+
+def gain(y, sr, db=0):
+    return (y * 10 ** (db / 20)).astype(np.float32)
+
+def compand(y, sr, attack=0.2, decay=1, points=((-20.0, -20.0),)):
+    """
+    Dynamic range compander. The volume of all channels is tracked together and
+    mapped through a piecewise-linear dB transfer function, as SoX does.
+    """
+    return _CompandStage(sr, y.shape[0], attack, decay, points).process(y)
+
+def speed(y, sr, ratio=0.75):
+    # Changing speed changes pitch and tempo together: play back as if recorded at sr * ratio.
+    return librosa.resample(y, orig_sr=sr * ratio, target_sr=sr)
+
+def lowpass(y, sr, cutoff=3500):
+    b, a = lowpass_coefficients(sr, cutoff)
+    return lfilter(b, a, y, axis=-1).astype(np.float32)
+
+_COMB_LENGTHS = np.array([1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617])
+_ALLPASS_LENGTHS = np.array([225, 341, 441, 556])
+_STEREO_ADJUST = 12
+
+def _reverb_parameters(sr, reverberance, hf_damping, room_scale, wet_gain):
+    a = -1 / np.log(1 - .3)
+    b = 100 / (np.log(1 - .98) * a + 1)
+    feedback = 1 - np.exp((reverberance - b) / (a * b))
+    damping = hf_damping / 100 * .3 + .2
+    wet = 10 ** (wet_gain / 20) * .015
+    scale = room_scale / 100 * .9 + .1
+    return feedback, damping, wet, scale
+
+def reverb(y, sr, reverberance=50, hf_damping=50, room_scale=100, stereo_depth=100, pre_delay=20, wet_gain=0):
+    """Freeverb-style reverb with the same parameters and tunings as SoX's 'reverb'."""
+    return _ReverbStage(
+        sr, y.shape[0], reverberance, hf_damping, room_scale, stereo_depth, pre_delay, wet_gain
+    ).process(y)
+
+# --- Streaming stages ---
+# Stateful versions of the effects for block-by-block processing. process()
+# takes and returns (channels, samples) blocks; flush() returns whatever a stage
+# still holds back once the input has ended.
+
+class _Stage:
+    def __init__(self, channels):
+        self.channels = channels
+
+    def process(self, y):
+        raise NotImplementedError
+
+    def flush(self):
+        return np.zeros((self.channels, 0), dtype=np.float32)
+
+class _StatelessStage(_Stage):
+    def __init__(self, sr, channels, func, **params):
+        super().__init__(channels)
+        self.sr, self.func, self.params = sr, func, params
+
+    def process(self, y):
+        return _as_channels(self.func(y, self.sr, **self.params))
+
+class _FilterStage(_Stage):
+    def __init__(self, channels, b, a):
+        super().__init__(channels)
+        self.b, self.a = b, a
+        self.zi = np.zeros((channels, 2))
+
+    def process(self, y):
+        out, self.zi = lfilter(self.b, self.a, y, axis=-1, zi=self.zi)
+        return out.astype(np.float32)
+
+class _TremoloStage(_Stage):
+    def __init__(self, sr, channels, freq=500, depth=50):
+        super().__init__(channels)
+        self.sr, self.freq, self.depth = sr, freq, depth
+        self.offset = 0
+
+    def process(self, y):
+        t = (self.offset + np.arange(y.shape[-1])) / self.sr
+        self.offset += y.shape[-1]
+        d = self.depth / 100
+        return (y * (1 - d / 2 + d / 2 * np.cos(2 * np.pi * self.freq * t))).astype(np.float32)
+
+class _PhaserStage(_Stage):
+    def __init__(self, sr, channels, gain_in=0.9, gain_out=0.8, delay=2, decay=0.2, speed=0.5):
+        super().__init__(channels)
+        self.gain_in, self.gain_out, self.decay = gain_in, gain_out, decay
+        delay_len = max(int(delay * .001 * sr + .5), 1)
+        mod_len = int(sr / speed + .5)
+        phase = np.arange(mod_len) / mod_len * 2 * np.pi + np.pi / 2
+        self.mod_buf = (1 + (np.sin(phase) + 1) / 2 * (delay_len - 1) + .5).astype(np.int64)
+        self.delay_bufs = np.zeros((channels, delay_len), dtype=np.float32)
+        self.positions = np.zeros((channels, 2), dtype=np.int64)
+
+    def process(self, y):
+        return np.stack([
+            _phaser_kernel(np.ascontiguousarray(channel), self.gain_in, self.gain_out, self.decay,
+                           self.delay_bufs[c], self.mod_buf, self.positions[c])
+            for c, channel in enumerate(y)
+        ])
+
+class _CompandStage(_Stage):
+    def __init__(self, sr, channels, attack=0.2, decay=1, points=((-20.0, -20.0),)):
+        super().__init__(channels)
+        self.attack_coef = 1 - np.exp(-1 / (sr * attack))
+        self.decay_coef = 1 - np.exp(-1 / (sr * decay))
+        # Slope 1 below the first point and an implicit 0 dB -> 0 dB point, like SoX.
+        self.xs = [-200.0] + [p[0] for p in points] + [0.0]
+        self.ys = [-200.0 + points[0][1] - points[0][0]] + [p[1] for p in points] + [0.0]
+        self.state = np.zeros(1)
+
+    def process(self, y):
+        level = np.max(np.abs(y), axis=0).astype(np.float64)
+        envelope = _envelope_kernel(level, self.attack_coef, self.decay_coef, self.state)
+        in_db = 20 * np.log10(np.maximum(envelope, 1e-9))
+        out_db = np.interp(in_db, self.xs, self.ys)
+        above = in_db > 0
+        out_db[above] = in_db[above]
+        return (y * 10 ** ((out_db - in_db) / 20)).astype(np.float32)
+
+class _ResampleStage(_Stage):
+    def __init__(self, channels, in_rate, out_rate):
+        super().__init__(channels)
+        self.stream = soxr.ResampleStream(in_rate, out_rate, channels, dtype='float32')
+
+    def process(self, y):
+        out = self.stream.resample_chunk(np.ascontiguousarray(y.T, dtype=np.float32))
+        return _as_channels(out.reshape(-1, self.channels).T)
+
+    def flush(self):
+        out = self.stream.resample_chunk(np.zeros((0, self.channels), dtype=np.float32), last=True)
+        return _as_channels(out.reshape(-1, self.channels).T)
+
+class _ReverbStage(_Stage):
+    def __init__(self, sr, channels, reverberance=50, hf_damping=50, room_scale=100,
+                 stereo_depth=100, pre_delay=20, wet_gain=0):
+        super().__init__(channels)
+        self.feedback, self.damping, self.wet, scale = _reverb_parameters(
+            sr, reverberance, hf_damping, room_scale, wet_gain
+        )
+        rate_scale = sr / 44100
+        depth = stereo_depth / 100
+        self.delay_line = np.zeros((channels, int(pre_delay / 1000 * sr + .5)), dtype=np.float32)
+        self.filters = []
+        for c in range(channels):
+            offset = c * depth if channels == 2 else 0
+            comb_sizes = ((_COMB_LENGTHS + _STEREO_ADJUST * offset) * rate_scale * scale + .5).astype(np.int64)
+            allpass_sizes = ((_ALLPASS_LENGTHS + _STEREO_ADJUST * offset) * rate_scale + .5).astype(np.int64)
+            self.filters.append((
+                comb_sizes, allpass_sizes,
+                np.zeros((len(comb_sizes), comb_sizes.max()), dtype=np.float32),
+                np.zeros(len(comb_sizes), dtype=np.int64),
+                np.zeros(len(comb_sizes), dtype=np.float32),
+                np.zeros((len(allpass_sizes), allpass_sizes.max()), dtype=np.float32),
+                np.zeros(len(allpass_sizes), dtype=np.int64),
+            ))
+
+    def process(self, y):
+        n = y.shape[-1]
+        delayed = np.concatenate([self.delay_line, y], axis=-1)
+        self.delay_line = delayed[:, n:]
+        out = np.empty_like(y)
+        for c, (comb_sizes, allpass_sizes, *state) in enumerate(self.filters):
+            wet_signal = _freeverb_kernel(
+                np.ascontiguousarray(delayed[c, :n]), comb_sizes, allpass_sizes,
+                self.feedback, self.damping, self.wet, *state
+            )
+            out[c] = y[c] + wet_signal
+        return out
+
+class _OverlapStage(_Stage):
+    """
+    Runs a whole-signal effect (pitch shift) over overlapping blocks and
+    crossfades the overlapping outputs, so block edges don't click.
+    """
+    def __init__(self, sr, channels, func, overlap_seconds=0.25, **params):
+        super().__init__(channels)
+        self.sr, self.func, self.params = sr, func, params
+        self.overlap = int(overlap_seconds * sr)
+        self.history = np.zeros((channels, 0), dtype=np.float32)
+        self.tail = None
+
+    def process(self, y):
+        if y.shape[-1] == 0:
+            return y
+        h = self.history.shape[-1]
+        out = _as_channels(self.func(np.concatenate([self.history, y], axis=-1), self.sr, **self.params))
+        emitted = []
+        if self.tail is not None and h:
+            fade = np.linspace(0, 1, h, dtype=np.float32)
+            emitted.append(self.tail * (1 - fade) + out[:, :h] * fade)
+        body = out[:, h:]
+        keep = min(self.overlap, y.shape[-1])
+        emitted.append(body[:, :body.shape[-1] - keep])
+        self.tail = body[:, body.shape[-1] - keep:]
+        self.history = y[:, y.shape[-1] - keep:]
+        return np.concatenate(emitted, axis=-1)
+
+    def flush(self):
+        tail = self.tail if self.tail is not None else super().flush()
+        self.tail = None
+        return tail
+
+STREAM_STAGES = {
+    'bass_boost': lambda sr, channels, gain=5: _FilterStage(channels, *low_shelf_coefficients(sr, gain)),
+    'pitch_shift': lambda sr, channels, **params: _OverlapStage(sr, channels, pitch_shift, **params),
+    'oops': lambda sr, channels: _StatelessStage(sr, channels, oops),
+    'tremolo': _TremoloStage,
+    'phaser': _PhaserStage,
+    'gain': lambda sr, channels, **params: _StatelessStage(sr, channels, gain, **params),
+    'compand': _CompandStage,
+    'speed': lambda sr, channels, ratio=0.75: _ResampleStage(channels, sr * ratio, sr),
+    'lowpass': lambda sr, channels, cutoff=3500: _FilterStage(channels, *lowpass_coefficients(sr, cutoff)),
+    'reverb': _ReverbStage,
+}
+
+class StreamingChain:
+    """Runs an effect chain block by block, carrying every effect's state across blocks."""
+
+    def __init__(self, effect_chain, sr, channels, input_rate=None):
+        for effect_name, _params in effect_chain:
+            if effect_name not in STREAM_STAGES:
+                raise ValueError(f"Unknown effect: {effect_name}")
+        self.stages = [STREAM_STAGES[name](sr, channels, **params) for name, params in effect_chain]
+        # Blocks read at input_rate are brought to sr before the first effect.
+        if input_rate is not None and input_rate != sr:
+            self.stages.insert(0, _ResampleStage(channels, input_rate, sr))
+        if sr != OUTPUT_SAMPLE_RATE:
+            self.stages.append(_ResampleStage(channels, sr, OUTPUT_SAMPLE_RATE))
+
+    def process(self, y):
+        y = _as_channels(y)
+        for stage in self.stages:
+            y = stage.process(y)
+        return y
+
+    def flush(self):
+        y = None
+        for stage in self.stages:
+            if y is not None and y.shape[-1]:
+                y = stage.process(y)
+            tail = stage.flush()
+            y = tail if y is None else np.concatenate([y, tail], axis=-1)
+        return y
+
+def process_file_streaming(input_path, output_path, effect_chain, block_seconds=10, progress=None,
+                           max_sample_rate=None):
+    """
+    Streams input_path through the effect chain in blocks and appends each
+    processed block to output_path as soon as it's ready, so memory stays flat
+    and a partially written file is already playable. If given, progress is
+    called with the fraction of the input done after each block, and an input
+    above max_sample_rate is resampled down to it before the effects.
+    """
+    info = sf.info(input_path)
+    sr = info.samplerate
+    if max_sample_rate and sr > max_sample_rate:
+        sr = max_sample_rate
+    chain = StreamingChain(effect_chain, sr, info.channels, input_rate=info.samplerate)
+    blocksize = int(block_seconds * info.samplerate)
+    done = 0
+    with sf.SoundFile(output_path, 'w', OUTPUT_SAMPLE_RATE, info.channels) as out:
+        for block in sf.blocks(input_path, blocksize=blocksize, dtype='float32', always_2d=True):
+            out.write(np.clip(chain.process(block.T), -1.0, 1.0).T)
+            out.flush()
+            done += len(block)
+            if progress is not None and info.frames:
+                progress(min(done / info.frames, 1.0))
+        tail = chain.flush()
+        if tail is not None and tail.shape[-1]:
+            out.write(np.clip(tail, -1.0, 1.0).T)
+    return output_path
+
+EFFECTS = {
+    'bass_boost': bass_boost,
+    'pitch_shift': pitch_shift,
+    'oops': oops,
+    'tremolo': tremolo,
+    'phaser': phaser,
+    'gain': gain,
+    'compand': compand,
+    'speed': speed,
+    'lowpass': lowpass,
+    'reverb': reverb,
+}
+
+def apply_chain(y, sr, effect_chain):
+    """
+    Runs a list of (effect_name, params) tuples over an in-memory signal.
+    Returns a float32 (channels, samples) array at the same sample rate.
+    """
+    y = _as_channels(y)
+    for effect_name, params in effect_chain:
+        if effect_name not in EFFECTS:
+            raise ValueError(f"Unknown effect: {effect_name}")
+        y = _as_channels(EFFECTS[effect_name](y, sr, **params))
+    return y
+
+def write_audio(output_path, y, sr):
+    """Resamples to the SoX backend's output rate, clips and encodes once."""
+    y = _as_channels(y)
+    if sr != OUTPUT_SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=sr, target_sr=OUTPUT_SAMPLE_RATE)
+    sf.write(output_path, np.clip(y, -1.0, 1.0).T, OUTPUT_SAMPLE_RATE)
+    return output_path
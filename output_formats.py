@@ -0,0 +1,124 @@
+# output_formats.py
+"""
+Output encodings for slushify jobs.
+
+A job's 'formats' option lists the encodings it wants, e.g.
+['flac', 'mp3:192', 'opus:96'] (codec, then an optional bitrate in kbps).
+The render is decoded once. Each format is then encoded from that one
+buffer by libsndfile, concurrently; cffi releases the GIL while the encoders
+run. Every encode's time and size are reported.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+FORMATS = {
+    'wav': {'ext': '.wav', 'format': 'WAV', 'subtype': 'PCM_16'},
+    'flac': {'ext': '.flac', 'format': 'FLAC', 'subtype': 'PCM_16'},
+    'mp3': {'ext': '.mp3', 'format': 'MP3', 'subtype': 'MPEG_LAYER_III', 'bitrate': 192},
+    # Opus only runs at 48 kHz (or fractions of it); the render is resampled for it.
+    'opus': {'ext': '.opus', 'format': 'OGG', 'subtype': 'OPUS', 'bitrate': 96, 'samplerate': 48000},
+}
+
+# Small and quick to encode, so the UI has something to play before the full formats are done.
+PREVIEW_FORMAT = os.environ.get('PREVIEW_FORMAT', 'opus:48')
+
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', 4))
+
+def parse(spec):
+    """Returns (codec, bitrate in kbps or None) for a spec like 'mp3:192'. Raises ValueError if invalid."""
+    codec, _, bitrate = str(spec).strip().lower().partition(':')
+    if codec not in FORMATS:
+        raise ValueError(f"Unknown output format: {codec}. Choose from {', '.join(sorted(FORMATS))}.")
+    if not bitrate:
+        return codec, FORMATS[codec].get('bitrate')
+    if 'bitrate' not in FORMATS[codec]:
+        raise ValueError(f"{codec} is lossless and takes no bitrate.")
+    if not bitrate.isdigit() or not 8 <= int(bitrate) <= 512:
+        raise ValueError(f"Invalid bitrate for {codec}: {bitrate}")
+    return codec, int(bitrate)
+
+def normalize(specs):
+    """
+    Validates a list (or comma-separated string) of specs and returns them in
+    canonical 'codec[:bitrate]' form. Each codec may appear once, as the
+    outputs are named by extension.
+    """
+    if isinstance(specs, str):
+        specs = [spec for spec in specs.split(',') if spec.strip()]
+    normalized = []
+    codecs = set()
+    for spec in specs:
+        codec, bitrate = parse(spec)
+        if codec in codecs:
+            raise ValueError(f"{codec} is requested more than once.")
+        codecs.add(codec)
+        normalized.append(f"{codec}:{bitrate}" if bitrate else codec)
+    if not normalized:
+        raise ValueError("No output formats given.")
+    return normalized
+
+def extension(spec):
+    return FORMATS[parse(spec)[0]]['ext']
+
+def _compression_level(codec, bitrate, samplerate, channels):
+    # libsndfile maps compression_level linearly onto each encoder's bitrate
+    # range: MPEG-1 layer III 32-320 kbps (MPEG-2, below 32 kHz: 8-160), and
+    # Opus 6-256 kbps per channel. It rejects a level of exactly 1.0.
+    if codec == 'mp3':
+        low, high = (32, 320) if samplerate >= 32000 else (8, 160)
+        kbps = bitrate
+    else:
+        low, high = 6, 256
+        kbps = bitrate / channels
+    return min(max((high - kbps) / (high - low), 0.0), 0.999)
+
+def encode(y, sr, path, spec):
+    """
+    Encodes y, shaped (frames, channels), into path. Returns
+    {'format', 'path', 'seconds', 'bytes'}.
+    """
+    import soundfile as sf
+    import soxr
+    codec, bitrate = parse(spec)
+    fmt = FORMATS[codec]
+    start = time.perf_counter()
+    target_sr = fmt.get('samplerate', sr)
+    if target_sr != sr:
+        # soxr (librosa's resampler) directly, without librosa's import cost.
+        y = soxr.resample(y, sr, target_sr)
+    kwargs = {}
+    if bitrate:
+        kwargs['compression_level'] = _compression_level(codec, bitrate, target_sr, y.shape[1])
+    if codec == 'mp3':
+        kwargs['bitrate_mode'] = 'CONSTANT'
+    sf.write(path, y, target_sr, format=fmt['format'], subtype=fmt['subtype'], **kwargs)
+    return {
+        'format': f"{codec}:{bitrate}" if bitrate else codec,
+        'path': path,
+        'seconds': time.perf_counter() - start,
+        'bytes': os.path.getsize(path),
+    }
+
+def encode_all(source, targets, on_done=None, max_workers=None):
+    """
+    Encodes the audio at source (a path, or a (y, sr) buffer) once per
+    (spec, path) target, concurrently. on_done(result) is called as each
+    encode finishes, so a quick preview can be published early. Returns the
+    results in target order.
+    """
+    import numpy as np
+    import soundfile as sf
+    if isinstance(source, str):
+        y, sr = sf.read(source, dtype='float32', always_2d=True)
+    else:
+        y, sr = source
+        y = np.asarray(y, dtype=np.float32)
+        y = y[:, np.newaxis] if y.ndim == 1 else y.T
+    with ThreadPoolExecutor(max_workers=max_workers or ENCODE_WORKERS, thread_name_prefix='encode') as executor:
+        futures = [executor.submit(encode, y, sr, path, spec) for spec, path in targets]
+        for future in as_completed(futures):
+            result = future.result()
+            if on_done:
+                on_done(result)
+        return [future.result() for future in futures]
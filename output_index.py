@@ -0,0 +1,102 @@
+# output_index.py
+"""
+Index of finished outputs: task id -> output path, size, creation time and
+the resolved options that produced it.
+
+Tasks record their output when they finish. /api/adjust then finds the file
+to adjust with one primary-key lookup instead of listing the outputs folder.
+The hourly cleanup deletes whatever the created_at index says has expired,
+without statting every file.
+"""
+import json
+import os
+import time
+
+import sqlite_store
+
+DEFAULT_DB_PATH = 'slushwave-vaporizer/backend/outputs.sqlite3'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS outputs ('
+    ' task_id TEXT PRIMARY KEY,'
+    ' path TEXT NOT NULL,'
+    ' size INTEGER,'
+    ' created_at REAL NOT NULL,'
+    ' options TEXT)',
+    'CREATE INDEX IF NOT EXISTS outputs_created_at ON outputs (created_at)',
+)
+
+def _execute(sql, params=(), fetch=False, db_path=None):
+    db_path = db_path or os.environ.get('OUTPUT_INDEX_DB_PATH', DEFAULT_DB_PATH)
+    return sqlite_store.execute(db_path, SCHEMA, sql, params, fetch, name='Output index')
+
+def record(task_id, path, options=None, created_at=None, size=None, db_path=None):
+    """
+    Records a finished output. The size is read from path unless given (for
+    outputs in remote storage). Failures are logged, never raised.
+    """
+    if size is None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            pass
+    return _execute(
+        'INSERT OR REPLACE INTO outputs (task_id, path, size, created_at, options) VALUES (?, ?, ?, ?, ?)',
+        (task_id, path, size, created_at if created_at is not None else time.time(),
+         json.dumps(options, sort_keys=True, default=str) if options is not None else None),
+        db_path=db_path
+    )
+
+def store(output_storage, task_id, name, local_path, options=None, db_path=None):
+    """Saves a rendered file to output storage and records it. Returns its storage location."""
+    # Sized first: remote storage takes the local file away.
+    try:
+        size = os.path.getsize(local_path)
+    except OSError:
+        size = None
+    location = output_storage.save(name, local_path)
+    record(task_id, location, options, size=size, db_path=db_path)
+    return location
+
+def get(task_id, db_path=None):
+    """Returns the output recorded for task_id as a dict, or None."""
+    rows = _execute(
+        'SELECT path, size, created_at, options FROM outputs WHERE task_id = ?', (task_id,), fetch=True, db_path=db_path
+    )
+    if not rows:
+        return None
+    path, size, created_at, options = rows[0]
+    return {
+        'task_id': task_id,
+        'path': path,
+        'size': size,
+        'created_at': created_at,
+        'options': json.loads(options) if options else None,
+    }
+
+def sweep(before, delete=os.remove, db_path=None):
+    """
+    Deletes the outputs recorded before the given time, and their rows.
+    delete removes one output by its recorded path or storage location.
+    Returns how many were removed.
+    """
+    rows = _execute('SELECT task_id, path FROM outputs WHERE created_at < ?', (before,), fetch=True, db_path=db_path)
+    removed = []
+    for task_id, path in rows:
+        try:
+            delete(path)
+            print(f"Deleted old file: {path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Kept for the next sweep, whether the disk or the object store failed.
+            print(f"Error deleting file {path}: {e}")
+            continue
+        removed.append(task_id)
+    # Chunked to stay under SQLite's bound-parameter limit.
+    for i in range(0, len(removed), 500):
+        chunk = removed[i:i + 500]
+        _execute(
+            f"DELETE FROM outputs WHERE task_id IN ({', '.join('?' * len(chunk))})", chunk, db_path=db_path
+        )
+    return len(removed)
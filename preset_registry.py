@@ -0,0 +1,220 @@
+# preset_registry.py
+"""
+Presets from presets.json, validated and compiled into chain plans.
+
+A ChainPlan is a preset merged with a job's overrides: the resolved options
+and the effect chain they select, both read-only and hashable. Plans are
+memoized by (preset, overrides), so repeated jobs skip the merge and the
+chain building.
+
+presets.json (or PRESETS_PATH) is re-read when its modification time or
+size changes, checked at most every PRESETS_RELOAD_SECONDS. The app and
+each worker process watch it on their own, so an edit reaches all of them
+without a restart. A preset that fails validation is logged and keeps its
+previous definition, or is left out if it had none.
+"""
+import json
+import os
+import threading
+import time
+from numbers import Real
+from types import MappingProxyType
+
+DEFAULT_PRESETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'presets.json')
+
+# How many compiled plans are kept; style transfer makes a new set of overrides per track.
+PLAN_CACHE_SIZE = 1024
+
+def _number(value, positive=False):
+    return isinstance(value, Real) and not isinstance(value, bool) and (value > 0 or not positive)
+
+def _loop_detection(value):
+    return (
+        isinstance(value, dict)
+        and set(value) <= {'enabled', 'duration_seconds'}
+        and isinstance(value.get('enabled', False), bool)
+        and _number(value.get('duration_seconds', 10), positive=True)
+    )
+
+# Each preset key and a check of its value. null switches an effect off.
+SCHEMA = {
+    'description': lambda value: isinstance(value, str),
+    'loop_detection': _loop_detection,
+    'speed_ratio': lambda value: value is None or _number(value, positive=True),
+    'pitch_shift': lambda value: value is None or _number(value),
+    'lowpass_cutoff': lambda value: value is None or _number(value, positive=True),
+    'bass_boost': lambda value: value is None or _number(value),
+    'gain_db': lambda value: value is None or _number(value),
+    'no_reverb': lambda value: isinstance(value, bool),
+    'phaser': lambda value: isinstance(value, bool),
+    'tremolo': lambda value: isinstance(value, bool),
+    'compand': lambda value: isinstance(value, bool),
+    'oops': lambda value: isinstance(value, bool),
+}
+
+def validate(name, preset):
+    """Raises ValueError if preset doesn't match SCHEMA."""
+    if not isinstance(preset, dict):
+        raise ValueError(f"Preset {name} is not an object.")
+    if 'description' not in preset:
+        raise ValueError(f"Preset {name} has no description.")
+    for key, value in preset.items():
+        if key not in SCHEMA:
+            raise ValueError(f"Preset {name} has an unknown setting: {key}")
+        if not SCHEMA[key](value):
+            raise ValueError(f"Preset {name} has an invalid {key}: {value!r}")
+
+def build_chain(options):
+    """
+    Turns fully resolved options into an ordered list of (effect_name, params) tuples.
+    """
+    effect_chain = []
+    if options.get('bass_boost'): effect_chain.append(('bass_boost', {'gain': options['bass_boost']}))
+    if options.get('pitch_shift'): effect_chain.append(('pitch_shift', {'shift': options['pitch_shift']}))
+    if options.get('oops'): effect_chain.append(('oops', {}))
+    if options.get('tremolo'): effect_chain.append(('tremolo', {'freq': 500, 'depth': 50}))
+    if options.get('phaser'): effect_chain.append(('phaser', {}))
+    if options.get('gain_db'): effect_chain.append(('gain', {'db': options['gain_db']}))
+    if options.get('compand'): effect_chain.append(('compand', {}))
+    if options.get('speed_ratio'): effect_chain.append(('speed', {'ratio': options['speed_ratio']}))
+    if options.get('lowpass_cutoff'): effect_chain.append(('lowpass', {'cutoff': options['lowpass_cutoff']}))
+    if not options.get('no_reverb', False): effect_chain.append(('reverb', {}))
+    return effect_chain
+
+def _freeze(value):
+    """A hashable equivalent of a JSON-like value; raises TypeError for anything else."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ('[]',) + tuple(_freeze(item) for item in value)
+    hash(value)
+    # Typed, so 1, 1.0 and True don't share a plan.
+    return (type(value).__name__, value)
+
+def _copy(value):
+    # Much quicker than copy.deepcopy for the dicts and lists options are made of.
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+class ChainPlan:
+    """
+    A preset compiled with one set of overrides. options is the resolved
+    options and chain the effect chain, as read-only mappings; plans with
+    equal options are equal and hash alike.
+    """
+    __slots__ = ('options', 'chain', '_key')
+
+    def __init__(self, options):
+        options = _copy(options)
+        self.options = MappingProxyType(options)
+        self.chain = tuple((name, MappingProxyType(params)) for name, params in build_chain(options))
+        self._key = _freeze(options)
+
+    def resolved(self):
+        """The resolved options as a new dict the caller may change."""
+        return _copy(self.options)
+
+    def effect_chain(self):
+        """The chain as a new list of (effect_name, params) tuples, as the effect backends take it."""
+        return [(name, dict(params)) for name, params in self.chain]
+
+    def __eq__(self, other):
+        return isinstance(other, ChainPlan) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return f"ChainPlan({[name for name, _params in self.chain]})"
+
+_lock = threading.RLock()
+_presets = {}
+_signature = None
+_checked_at = None
+_plans = {}
+
+def _presets_path():
+    # Read at call time, like the stores, so tests and tools can point it elsewhere.
+    return os.environ.get('PRESETS_PATH', DEFAULT_PRESETS_PATH)
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def reload(force=False):
+    """
+    Re-reads the presets file if it changed since it was last read (or with
+    force), and drops the compiled plans if it did. Returns the presets.
+    """
+    global _presets, _signature, _checked_at
+    with _lock:
+        path = _presets_path()
+        signature = _file_signature(path)
+        _checked_at = time.monotonic()
+        if signature == _signature and not force:
+            return _presets
+        _signature = signature
+        try:
+            with open(path, 'r') as f:
+                loaded = json.load(f)
+            if not isinstance(loaded, dict):
+                raise ValueError("the top level is not an object")
+        except FileNotFoundError:
+            print(f"ERROR: presets.json not found at {path}")
+            loaded = {}
+        except ValueError as e:
+            print(f"ERROR: {path} could not be read, keeping the current presets: {e}")
+            return _presets
+        presets = {}
+        for name, preset in loaded.items():
+            try:
+                validate(name, preset)
+                presets[name] = preset
+            except ValueError as e:
+                if name in _presets:
+                    print(f"ERROR: {e} Keeping its previous definition.")
+                    presets[name] = _presets[name]
+                else:
+                    print(f"ERROR: {e} It is left out.")
+        _presets = presets
+        _plans.clear()
+        return _presets
+
+def _current():
+    interval = float(os.environ.get('PRESETS_RELOAD_SECONDS', 1.0))
+    if _checked_at is None or time.monotonic() - _checked_at >= interval:
+        return reload()
+    return _presets
+
+def get_presets():
+    """The current presets by name, as a copy."""
+    return _copy(_current())
+
+def compile_plan(options):
+    """
+    Returns the ChainPlan for options (JSON-like values, as jobs carry them):
+    the named preset, if any, with the rest of options as overrides. Plans
+    are memoized until the presets change.
+    """
+    presets = _current()
+    preset_name = options.get('preset')
+    key = (preset_name, _freeze(options))
+    plan = _plans.get(key)
+    if plan is None:
+        if preset_name and preset_name in presets:
+            plan = ChainPlan({**presets[preset_name], **options})
+        else:
+            plan = ChainPlan(options)
+        with _lock:
+            # Not kept if the presets were reloaded while it compiled.
+            if presets is _presets:
+                if len(_plans) >= PLAN_CACHE_SIZE:
+                    _plans.clear()
+                _plans[key] = plan
+    return plan
@@ -0,0 +1,54 @@
+# progress.py
+"""
+Push-based job progress over Redis pub/sub.
+
+Tasks publish each progress event on a per-task channel; the Server-Sent
+Events endpoint subscribes to it, so clients get updates as they happen
+instead of polling /api/status and the result backend.
+"""
+import json
+import os
+
+import redis
+
+REDIS_URL = os.environ.get('PROGRESS_REDIS_URL', os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
+
+TERMINAL_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+_client = None
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+def channel_name(task_id):
+    return f"slushwave:progress:{task_id}"
+
+def publish(task_id, event):
+    """Publishes a progress event dict. Failures are logged, never raised."""
+    try:
+        _get_client().publish(channel_name(task_id), json.dumps(event))
+    except redis.RedisError as e:
+        print(f"Could not publish progress for {task_id}: {e}")
+
+class Subscription:
+    """Receives the progress events of one task."""
+
+    def __init__(self, task_id):
+        self._pubsub = _get_client().pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(channel_name(task_id))
+
+    def get(self, timeout=15.0):
+        """Returns the next event, or None if nothing arrived within timeout seconds."""
+        message = self._pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self._pubsub.close()
+
+def subscribe(task_id):
+    return Subscription(task_id)
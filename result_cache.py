@@ -0,0 +1,112 @@
+# result_cache.py
+"""
+Content-addressed cache of finished slushify results.
+
+Entries are keyed on the input audio bytes, the fully resolved options and the
+effect backend version, and live in their own directory so cleanup_old_files
+never deletes them. A hit is hard-linked into the outputs folder; the shared
+mtime doubles as the LRU timestamp and keeps the fresh output alive for the
+usual hour before cleanup removes it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', 'slushwave-vaporizer/backend/cache')
+CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_key(input_hash, options, backend_version, reference_hash=None, output_ext=''):
+    """Builds a cache key from everything that determines the rendered output."""
+    payload = json.dumps({
+        'input': input_hash,
+        'reference': reference_hash,
+        'options': options,
+        'backend': backend_version,
+        'ext': output_ext.lower(),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _entry_path(key, output_ext, cache_dir):
+    return os.path.join(cache_dir, f"{key}{output_ext}")
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+def lookup(key, output_ext, output_path, cache_dir=None, now=None):
+    """
+    On a hit, places the cached result at output_path, refreshes its LRU
+    timestamp and returns output_path. Returns None on a miss.
+    """
+    entry = _entry_path(key, output_ext, cache_dir or CACHE_DIR)
+    if now is None:
+        now = time.time()
+    try:
+        if os.path.getmtime(entry) < now - CACHE_TTL_SECONDS:
+            return None
+        os.utime(entry, (now, now))
+        _link_or_copy(entry, output_path)
+    except OSError:
+        return None
+    return output_path
+
+def store(key, output_ext, result_path, cache_dir=None):
+    """Adds a finished result to the cache. Failures are logged, never raised."""
+    cache_dir = cache_dir or CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, f".tmp_{uuid.uuid4()}{output_ext}")
+        _link_or_copy(result_path, tmp_path)
+        os.replace(tmp_path, _entry_path(key, output_ext, cache_dir))
+    except OSError as e:
+        print(f"Could not store result in cache: {e}")
+        return False
+    evict(cache_dir=cache_dir)
+    return True
+
+def evict(cache_dir=None, now=None, max_bytes=None, ttl_seconds=None):
+    """
+    Removes expired entries, then least recently used ones until the cache fits
+    in max_bytes. Returns the number of entries removed.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    ttl_seconds = CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    if now is None:
+        now = time.time()
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and not entry.name.startswith('.tmp_'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    removed = 0
+    total = sum(size for _mtime, size, _path in entries)
+    for mtime, size, path in entries:
+        if mtime >= now - ttl_seconds and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            total -= size
+        except OSError as e:
+            print(f"Error evicting cache entry {path}: {e}")
+    return removed
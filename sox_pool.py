@@ -0,0 +1,125 @@
+# sox_pool.py
+"""
+Bounded pool of SoX runners with raw PCM pipe I/O.
+
+pysndfx forks twice per chain (a `sox --i` probe for the channel count, then
+sox itself) and only exchanges audio through files. Here the channel count
+comes from soundfile, so each chain is exactly one sox process, and buffers
+that are already in memory (an extracted loop, a previous effect's output) go
+in and out over stdin/stdout as float32 PCM instead of through temp WAVs.
+
+A sox process exits at the end of its stream and can't be handed the next
+chain, so what stays warm are the runner threads: they live as long as the
+worker process, and SOX_POOL_SIZE caps how many sox processes it runs at once.
+"""
+import contextlib
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_SIZE = int(os.environ.get('SOX_POOL_SIZE', 2))
+
+# pysndfx wrote every file at this rate; keeping it keeps outputs unchanged.
+OUTPUT_SAMPLE_RATE = 44100
+
+_lock = threading.Lock()
+_executor = None
+_totals = {'processes': 0, 'seconds': 0.0, 'bytes_piped': 0}
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='sox')
+        return _executor
+
+def _reset_after_fork():
+    # Threads don't survive fork(); each Celery worker process starts its own pool.
+    global _executor, _lock
+    _executor = None
+    _lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def warm():
+    """Starts every runner thread now, rather than on the first jobs."""
+    executor = _get_executor()
+    barrier = threading.Barrier(POOL_SIZE)
+    for future in [executor.submit(barrier.wait, 5) for _ in range(POOL_SIZE)]:
+        future.result()
+
+def _execute(cmd, stdin_bytes=None):
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if stdin_bytes is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError as e:
+        raise RuntimeError("SoX command not found. Please ensure SoX is installed and in your system's PATH.") from e
+    stdout, stderr = proc.communicate(stdin_bytes)
+    with _lock:
+        _totals['processes'] += 1
+        _totals['seconds'] += time.perf_counter() - start
+        _totals['bytes_piped'] += len(stdin_bytes or b'') + len(stdout)
+    if proc.returncode or stderr:
+        raise RuntimeError(stderr.decode(errors='replace').strip() or f"sox exited with status {proc.returncode}")
+    return stdout
+
+def _channels(path):
+    import soundfile as sf
+    try:
+        return sf.info(path).channels
+    except RuntimeError:
+        # Formats libsndfile can't read (e.g. m4a): ask SoX, at the cost of a fork.
+        return int(_execute(['sox', '--i', '-c', path]))
+
+def run(effects_command, src, dst=None, output_rate=OUTPUT_SAMPLE_RATE, lossless=False):
+    """
+    Runs one SoX process applying effects_command (an AudioEffectsChain's
+    .command). src is a file path or a (y, sr) buffer, mono or (channels,
+    samples), piped in as float32 PCM. dst is a file path, or None to get the
+    result back as a (y, sr) buffer. The output is at output_rate, 44.1 kHz
+    unless a job asks for less. With lossless, dst is written as 32-bit
+    float, so it is neither clipped nor requantized.
+    """
+    import numpy as np
+    cmd = ['sox', '-N', '-V1']
+    if isinstance(src, str):
+        channels, stdin_bytes = _channels(src), None
+        cmd.append(src)
+    else:
+        y, sr = src
+        y = np.asarray(y, dtype=np.float32)
+        channels = 1 if y.ndim == 1 else y.shape[0]
+        stdin_bytes = np.ascontiguousarray(y.T).tobytes()
+        cmd += ['-t', 'f32', '-r', str(sr), '-c', str(channels), '-']
+    cmd += ['-r', str(output_rate), '-c', str(channels)]
+    if lossless and dst is not None:
+        cmd += ['-e', 'floating-point', '-b', '32']
+    cmd += [dst] if dst is not None else ['-t', 'f32', '-']
+    cmd += shlex.split(' '.join(map(str, effects_command)), posix=False)
+
+    stdout = _get_executor().submit(_execute, cmd, stdin_bytes).result()
+    if dst is not None:
+        return dst
+    out = np.frombuffer(stdout, dtype=np.float32)
+    out = out.copy() if channels == 1 else out.reshape(-1, channels).T.copy()
+    return out, output_rate
+
+@contextlib.contextmanager
+def job_metrics():
+    """Yields a dict that is filled with the SoX processes, seconds and bytes piped during the block."""
+    metrics = {}
+    with _lock:
+        before = dict(_totals)
+    try:
+        yield metrics
+    finally:
+        with _lock:
+            metrics.update({key: _totals[key] - before[key] for key in _totals})
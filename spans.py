@@ -0,0 +1,229 @@
+# spans.py
+"""
+Per-stage timing and resource spans for the processing pipeline.
+
+    with spans.collect() as stages:
+        with spans.span('decode'):
+            ...
+
+A span measures wall time, CPU time (this process plus the SoX children it
+waited for), peak RSS and bytes read and written while it was open. Finished
+spans go to the innermost collect() block as plain dicts, so a task can
+return its per-stage breakdown; spans run through contextvars.copy_context()
+in a worker thread still reach it. They are also exported:
+
+- as Prometheus metrics, if prometheus_client is installed. Set
+  PROMETHEUS_MULTIPROC_DIR so the worker processes and the app share them;
+  the app serves them at /metrics.
+- as OpenTelemetry spans, if opentelemetry-api is installed. Configure the
+  SDK and exporter as usual (e.g. opentelemetry-instrument and the OTEL_*
+  variables). Without an SDK they are no-ops.
+
+The resource figures are process-wide and read from /proc on Linux. Bytes
+are everything read and written, including pipes to SoX and page-cache hits.
+Peak RSS is per span where the kernel lets the high-water mark be reset
+(/proc/self/clear_refs); elsewhere it is the process's peak so far.
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+import resource
+import threading
+import time
+
+_collector = contextvars.ContextVar('spans_collector', default=None)
+_parent = contextvars.ContextVar('spans_parent', default=None)
+
+# Open spans' running peak RSS. Resetting the kernel's high-water mark for a
+# new span would lose the peak of the spans around it, so theirs is folded in first.
+_open = []
+_open_lock = threading.Lock()
+
+_metrics = None
+_tracer = None
+
+def _read_proc(name):
+    try:
+        with open(f"/proc/self/{name}") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _io_bytes():
+    """(bytes read, bytes written) by this process so far, or (None, None) without /proc."""
+    text = _read_proc('io')
+    if text is None:
+        return None, None
+    fields = dict(line.split(':', 1) for line in text.splitlines() if ':' in line)
+    return int(fields['rchar']), int(fields['wchar'])
+
+def _peak_rss():
+    """The process's RSS high-water mark in bytes."""
+    text = _read_proc('status')
+    for line in (text or '').splitlines():
+        if line.startswith('VmHWM:'):
+            return int(line.split()[1]) * 1024
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def _cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+def _prometheus():
+    """The stage metrics, created on first use; False without prometheus_client."""
+    global _metrics
+    if _metrics is None:
+        try:
+            from prometheus_client import Counter, Histogram
+        except ImportError:
+            _metrics = False
+        else:
+            labels = ('stage',)
+            _metrics = {
+                'wall_seconds': Histogram(
+                    'slushwave_stage_wall_seconds', 'Wall time per pipeline stage.', labels,
+                    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+                ),
+                'cpu_seconds': Histogram(
+                    'slushwave_stage_cpu_seconds', 'CPU time per pipeline stage, including SoX.', labels,
+                    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+                ),
+                'peak_rss_bytes': Histogram(
+                    'slushwave_stage_peak_rss_bytes', 'Peak resident memory during a pipeline stage.', labels,
+                    buckets=tuple(2 ** n * 1024 ** 2 for n in range(5, 14)),
+                ),
+                'read_bytes': Counter('slushwave_stage_read_bytes', 'Bytes read during pipeline stages.', labels),
+                'write_bytes': Counter('slushwave_stage_write_bytes', 'Bytes written during pipeline stages.', labels),
+            }
+    return _metrics
+
+def _otel_tracer():
+    """An OpenTelemetry tracer; False without opentelemetry-api."""
+    global _tracer
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _tracer = False
+        else:
+            _tracer = trace.get_tracer('slushwave')
+    return _tracer
+
+def _export(record):
+    metrics = _prometheus()
+    if metrics:
+        stage = record['stage']
+        for name in ('wall_seconds', 'cpu_seconds', 'peak_rss_bytes'):
+            metrics[name].labels(stage).observe(record[name])
+        for name in ('read_bytes', 'write_bytes'):
+            if record[name] is not None:
+                metrics[name].labels(stage).inc(record[name])
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    """
+    Measures the enclosed block as one stage. attributes (JSON-friendly
+    values) are added to the recorded span. A block that raises is still
+    recorded, with 'failed': True.
+    """
+    tracer = _otel_tracer()
+    peak = {'bytes': 0}
+    with _open_lock:
+        high_water = _peak_rss()
+        for other in _open:
+            other['bytes'] = max(other['bytes'], high_water)
+        _open.append(peak)
+        _reset_peak_rss()
+    read_before, written_before = _io_bytes()
+    cpu_before = _cpu_seconds()
+    start = time.perf_counter()
+    record = {'stage': stage, 'parent': _parent.get(), **attributes}
+    token = _parent.set(stage)
+    try:
+        with tracer.start_as_current_span(stage) if tracer else contextlib.nullcontext() as current:
+            try:
+                yield
+            except BaseException:
+                record['failed'] = True
+                raise
+            finally:
+                _finish(record, peak, start, cpu_before, read_before, written_before)
+                if current is not None:
+                    current.set_attributes({
+                        key: value for key, value in record.items()
+                        if key not in ('stage', 'parent') and value is not None
+                    })
+    finally:
+        _parent.reset(token)
+        stages = _collector.get()
+        if stages is not None:
+            stages.append(record)
+        _export(record)
+
+def _finish(record, peak, start, cpu_before, read_before, written_before):
+    record['wall_seconds'] = time.perf_counter() - start
+    record['cpu_seconds'] = _cpu_seconds() - cpu_before
+    read_after, written_after = _io_bytes()
+    with _open_lock:
+        # By identity: concurrent spans' peaks can be equal dicts.
+        _open[:] = [other for other in _open if other is not peak]
+        record['peak_rss_bytes'] = max(peak['bytes'], _peak_rss())
+        for other in _open:
+            other['bytes'] = max(other['bytes'], record['peak_rss_bytes'])
+    record['read_bytes'] = read_after - read_before if read_before is not None else None
+    record['write_bytes'] = written_after - written_before if written_before is not None else None
+
+@contextlib.contextmanager
+def collect():
+    """Yields a list that every span finished inside the block is appended to, innermost first."""
+    stages = []
+    token = _collector.set(stages)
+    try:
+        yield stages
+    finally:
+        _collector.reset(token)
+
+def traced(stage):
+    """
+    Decorator for tasks: runs the function as one span and adds the spans it
+    recorded to its result dict under 'stages'.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with collect() as stages:
+                with span(stage):
+                    result = func(*args, **kwargs)
+            if isinstance(result, dict):
+                result['stages'] = stages
+            return result
+        # Celery checks task arguments against getfullargspec, which ignores __wrapped__.
+        wrapper.__signature__ = inspect.signature(func)
+        return wrapper
+    return decorator
+
+def exposition():
+    """
+    Returns (body, content type) of the Prometheus metrics, aggregated over
+    PROMETHEUS_MULTIPROC_DIR if it is set. None without prometheus_client.
+    """
+    try:
+        from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+    except ImportError:
+        return None
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
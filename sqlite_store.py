@@ -0,0 +1,39 @@
+# sqlite_store.py
+"""
+Connection and query helpers shared by the SQLite stores (analysis_store,
+output_index and cost_model).
+
+Every call opens its own short-lived connection, which keeps the stores safe
+across forked Celery workers, in WAL mode so readers don't wait for a writer.
+The stores read their database path from the environment at call time, so
+tests and tools (e.g. analysis_store's --db) can redirect them.
+"""
+import os
+import sqlite3
+
+def connect(db_path, schema=()):
+    """Opens db_path, creating its folder and running the schema's CREATE ... IF NOT EXISTS statements."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in schema:
+        conn.execute(statement)
+    return conn
+
+def execute(db_path, schema, sql, params=(), fetch=False, name='SQLite store'):
+    """
+    Runs one statement in its own transaction. Returns the rows with fetch,
+    otherwise True. Failures are logged as name's and never raised: the
+    result is then [] with fetch, otherwise False.
+    """
+    try:
+        conn = connect(db_path, schema)
+        try:
+            with conn:
+                cursor = conn.execute(sql, params)
+                return cursor.fetchall() if fetch else True
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"{name} failed: {e}")
+        return [] if fetch else False
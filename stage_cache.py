@@ -0,0 +1,112 @@
+# stage_cache.py
+"""
+Intermediate renders for incremental adjustments.
+
+Each finished render records a session under its output file id: the source
+the effect chain ran on (the input, or the extracted loop), the resolved chain
+and the backend. Stage outputs are kept as lossless WAV, keyed on the source
+and the chain prefix that produced them, so an adjustment re-runs only the
+stages after the changed effect instead of stacking effects on a lossy result.
+
+Sessions, sources and stages share one directory with the same LRU/TTL
+eviction as the result cache.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import result_cache
+
+STAGE_DIR = os.environ.get('STAGE_CACHE_DIR', 'slushwave-vaporizer/backend/stages')
+STAGE_MAX_BYTES = int(os.environ.get('STAGE_CACHE_MAX_BYTES', 4 * 1024 ** 3))
+STAGE_TTL_SECONDS = int(os.environ.get('STAGE_CACHE_TTL_SECONDS', 24 * 3600))
+
+STAGE_EXT = '.wav'
+
+def normalize_chain(effect_chain):
+    """Returns the chain as JSON-friendly [effect_name, params] pairs."""
+    return [[effect_name, dict(params)] for effect_name, params in effect_chain]
+
+def prefix_key(source_key, effect_chain, backend_version):
+    """Key of the stage output after running effect_chain over the source."""
+    payload = json.dumps({
+        'source': source_key,
+        'chain': normalize_chain(effect_chain),
+        'backend': backend_version,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _path(name, cache_dir):
+    return os.path.join(cache_dir or STAGE_DIR, name)
+
+def _touch(path):
+    now = time.time()
+    os.utime(path, (now, now))
+
+def get(key, ext=STAGE_EXT, cache_dir=None):
+    """Returns the path of a cached source or stage output, or None on a miss."""
+    path = _path(f"{key}{ext}", cache_dir)
+    try:
+        _touch(path)
+    except OSError:
+        return None
+    return path
+
+def temp_path(cache_dir=None, ext=STAGE_EXT):
+    """A scratch path inside the cache directory, so store() can hard-link it."""
+    cache_dir = cache_dir or STAGE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f".tmp_{uuid.uuid4()}{ext}")
+
+def store(key, path, ext=STAGE_EXT, cache_dir=None):
+    """Adds a file to the stage cache. Failures are logged, never raised."""
+    return result_cache.store(key, ext, path, cache_dir=cache_dir or STAGE_DIR)
+
+def store_source(path, cache_dir=None):
+    """Adds a render source to the cache and returns its key, or None on failure."""
+    key = result_cache.hash_file(path)
+    ext = os.path.splitext(path)[1]
+    if get(key, ext, cache_dir) is None and not store(key, path, ext, cache_dir):
+        return None
+    return f"{key}{ext}"
+
+def save_session(file_id, source, effect_chain, backend, backend_version, cache_dir=None):
+    """Records how the output named file_id was rendered. Failures are logged, never raised."""
+    session = {
+        'source': source,
+        'chain': normalize_chain(effect_chain),
+        'backend': backend,
+        'backend_version': backend_version,
+    }
+    try:
+        tmp_path = temp_path(cache_dir, '.json')
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, _path(f"session_{file_id}.json", cache_dir))
+    except OSError as e:
+        print(f"Could not save render session: {e}")
+        return None
+    return session
+
+def load_session(file_id, cache_dir=None):
+    """Returns the render session of file_id, or None if it (or its source) is gone."""
+    path = _path(f"session_{file_id}.json", cache_dir)
+    try:
+        with open(path) as f:
+            session = json.load(f)
+        _touch(path)
+    except (OSError, ValueError):
+        return None
+    key, ext = os.path.splitext(session['source'])
+    if get(key, ext, cache_dir) is None:
+        return None
+    return session
+
+def evict(cache_dir=None, now=None):
+    """Applies the stage cache's own size and TTL limits."""
+    return result_cache.evict(
+        cache_dir=cache_dir or STAGE_DIR, now=now,
+        max_bytes=STAGE_MAX_BYTES, ttl_seconds=STAGE_TTL_SECONDS
+    )
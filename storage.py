@@ -0,0 +1,159 @@
+# storage.py
+"""
+Where finished outputs live.
+
+Workers always render into a local file from writable_path(). save() then
+makes the file durable and returns its location, which goes into the task
+result and the output index:
+
+- LocalStorage keeps outputs under OUTPUT_DIR, sharded into two levels of
+  directories by a hash of the file name, so directories stay small however
+  many outputs there are. Its locations are plain paths, and save() moves
+  nothing.
+- S3Storage uploads to an S3-compatible bucket (AWS, MinIO, ...) and removes
+  the local file. Its locations are s3://bucket/key URIs. The app redirects
+  downloads to a presigned URL, so the object store serves the bytes and
+  Range requests.
+
+Select a backend with OUTPUT_STORAGE=local|s3. For S3, also set S3_BUCKET,
+and optionally S3_PREFIX and S3_ENDPOINT_URL. boto3 is only needed for S3.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import uuid
+
+OUTPUT_DIR = os.environ.get('OUTPUT_DIR', 'slushwave-vaporizer/backend/outputs')
+S3_URL_EXPIRES_SECONDS = int(os.environ.get('S3_URL_EXPIRES_SECONDS', 3600))
+
+def shard(name):
+    """Relative path of name in the sharded layout: ab/cd/name."""
+    digest = hashlib.sha1(name.encode()).hexdigest()
+    return posixpath.join(digest[:2], digest[2:4], name)
+
+class LocalStorage:
+    kind = 'local'
+
+    def __init__(self, root=None):
+        self.root = root or OUTPUT_DIR
+
+    def location(self, name):
+        return os.path.join(self.root, *shard(name).split('/'))
+
+    def writable_path(self, name):
+        """Local path a producer should write the output named name to."""
+        path = self.location(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save(self, name, local_path):
+        """Makes the rendered file durable and returns its location."""
+        location = self.location(name)
+        if os.path.abspath(local_path) != os.path.abspath(location):
+            os.makedirs(os.path.dirname(location), exist_ok=True)
+            os.replace(local_path, location)
+        return location
+
+    def fetch(self, location):
+        """Local path of a stored output. Anything but the location itself is a copy for the caller to remove."""
+        return location
+
+    def exists(self, location):
+        return os.path.exists(location)
+
+    def delete(self, location):
+        os.remove(location)
+
+    def relative_path(self, location):
+        """Path below the storage root, for the web server's internal redirect."""
+        return os.path.relpath(location, self.root).replace(os.sep, '/')
+
+    def url(self, location):
+        """A URL the client can download the output from directly, or None to serve it from disk."""
+        return None
+
+class S3Storage:
+    kind = 's3'
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None, scratch_dir=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.scratch_dir = scratch_dir or OUTPUT_DIR
+        self._endpoint_url = endpoint_url
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self._endpoint_url)
+        return self._client
+
+    def key(self, name):
+        return posixpath.join(self.prefix, shard(name)) if self.prefix else shard(name)
+
+    def location(self, name):
+        return f"s3://{self.bucket}/{self.key(name)}"
+
+    def _split(self, location):
+        bucket, _, key = location[len('s3://'):].partition('/')
+        return bucket, key
+
+    def writable_path(self, name):
+        # Renders go to local scratch first; /api/stream can tail them there.
+        path = os.path.join(self.scratch_dir, *shard(name).split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save(self, name, local_path):
+        extra_args = {}
+        content_type = mimetypes.guess_type(name)[0]
+        if content_type:
+            extra_args['ContentType'] = content_type
+        self.client.upload_file(local_path, self.bucket, self.key(name), ExtraArgs=extra_args)
+        os.remove(local_path)
+        return self.location(name)
+
+    def fetch(self, location):
+        """Downloads a stored output to scratch space and returns the local path; the caller removes it."""
+        bucket, key = self._split(location)
+        path = os.path.join(self.scratch_dir, '.fetch', f"{uuid.uuid4()}_{posixpath.basename(key)}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.client.download_file(bucket, key, path)
+        return path
+
+    def exists(self, location):
+        from botocore.exceptions import ClientError
+        bucket, key = self._split(location)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError:
+            return False
+        return True
+
+    def delete(self, location):
+        bucket, key = self._split(location)
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+    def url(self, location):
+        bucket, key = self._split(location)
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=S3_URL_EXPIRES_SECONDS
+        )
+
+_storage = None
+
+def get_storage():
+    """The configured output storage, created on first use."""
+    global _storage
+    if _storage is None:
+        if os.environ.get('OUTPUT_STORAGE', 'local') == 's3':
+            _storage = S3Storage(
+                os.environ['S3_BUCKET'],
+                prefix=os.environ.get('S3_PREFIX', ''),
+                endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            )
+        else:
+            _storage = LocalStorage()
+    return _storage
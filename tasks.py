@@ -1,9 +1,22 @@
 from celery import Celery
-from audio_processor import process_audio
+from celery.signals import worker_init, worker_process_init
+from kombu import Queue
+from audio_processor import process_audio, adjust_audio, resolve_options, warm_up
+import argparse
 import os
 import time
 from datetime import timedelta
 import effects
+import result_cache
+import stage_cache
+import progress
+import sox_pool
+import analysis_pool
+import cost_model
+import output_index
+import storage
+import output_formats
+import spans
 
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
@@ -15,91 +28,325 @@ celery_app.conf.beat_schedule = {
         'task': 'tasks.cleanup_old_files',
         'schedule': timedelta(hours=1),
     },
+    # The hourly run only sweeps indexed outputs, through the output storage.
+    # This one also lists the local output folder for files the index doesn't
+    # know: batch manifests, which are always local and never indexed, and
+    # leftovers of failed jobs.
+    'scan-outputs-every-day': {
+        'task': 'tasks.cleanup_old_files',
+        'schedule': timedelta(days=1),
+        'kwargs': {'full_scan': True},
+    },
 }
 celery_app.conf.timezone = 'UTC'
 
+# --- Queues ---
+# Adjustments (the interactive fast lane, also used for housekeeping), full
+# renders and style-transfer renders each have their own queue, so a long job
+# never sits in front of a fine-tune. Start one worker per queue with its own
+# concurrency:  python tasks.py worker adjust
+QUEUE_CONCURRENCY = {
+    'adjust': int(os.environ.get('ADJUST_CONCURRENCY', 4)),
+    'slushify': int(os.environ.get('SLUSHIFY_CONCURRENCY', 2)),
+    'style_transfer': int(os.environ.get('STYLE_TRANSFER_CONCURRENCY', 1)),
+}
+celery_app.conf.task_queues = tuple(Queue(name) for name in QUEUE_CONCURRENCY)
+celery_app.conf.task_default_queue = 'slushify'
+# The longest a job may run before it is killed (default 6 hours).
+MAX_JOB_SECONDS = int(os.environ.get('MAX_JOB_SECONDS', 6 * 3600))
+celery_app.conf.task_time_limit = MAX_JOB_SECONDS
+# Within a queue, cheaper jobs (lower priority numbers on Redis) go first:
+# the Redis transport keeps one list per priority step and reads them in order.
+# With late acks, an unacknowledged job is redelivered after visibility_timeout,
+# so it must outlast the longest job or a running job is started a second time.
+celery_app.conf.broker_transport_options = {
+    'priority_steps': list(range(cost_model.PRIORITY_STEPS)),
+    'sep': ':',
+    'visibility_timeout': MAX_JOB_SECONDS + 3600,
+}
+# Don't let a worker reserve queued jobs, so priorities apply to all waiting work.
+celery_app.conf.worker_prefetch_multiplier = 1
+celery_app.conf.task_acks_late = True
+
+def slushify_queue(reference_path=None, options=None):
+    # Previews are interactive and render only a short excerpt, like adjustments.
+    if (options or {}).get('preview'):
+        return 'adjust'
+    return 'style_transfer' if reference_path else 'slushify'
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Sends adjustments and cleanup to the fast lane and slushify jobs to the
+    full or style-transfer queue. Slushify priority comes from the estimated
+    cost of the job, read from the uploaded files' headers.
+    """
+    if name in ('tasks.adjust_task', 'tasks.cleanup_old_files'):
+        return {'queue': 'adjust', 'priority': 0}
+    if name != 'tasks.slushify_task':
+        return None
+    input_path = args[0] if args else kwargs.get('input_path')
+    job_options = args[2] if len(args) > 2 else kwargs.get('options')
+    reference_path = args[3] if len(args) > 3 else kwargs.get('reference_path')
+    route = {'queue': slushify_queue(reference_path, job_options)}
+    try:
+        route['priority'] = cost_model.priority_for(cost_model.estimate_job(input_path, job_options, reference_path))
+    except Exception as e:
+        print(f"Could not estimate job cost, using default priority: {e}")
+    return route
+
+celery_app.conf.task_routes = (route_task,)
+
+# Set WORKER_WARM_UP=0 to skip warming librosa and numba (e.g. for a housekeeping-only worker).
+WORKER_WARM_UP = os.environ.get('WORKER_WARM_UP', '1').lower() not in ('0', 'false', 'no')
+
+@worker_init.connect
+def size_analysis_pool(sender=None, **kwargs):
+    # Sent in the main worker process once its concurrency is known, before
+    # the pool processes fork; they split the cores between them.
+    analysis_pool.configure(getattr(sender, 'concurrency', None))
+
+@worker_process_init.connect
+def warm_worker(**kwargs):
+    # Start the SoX runner threads, and pay librosa's imports and numba's JIT
+    # compilation, in each worker process before the first job.
+    sox_pool.warm()
+    if WORKER_WARM_UP:
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Worker warm-up failed: {e}")
+
+def _encode_outputs(task_id, render_path, formats, output_storage, options, on_preview):
+    """
+    Encodes a lossless render into each requested format plus a preview, in
+    parallel, and removes the render. The preview is stored and handed to
+    on_preview as soon as it is encoded; a preview job (options['preview'])
+    gets no separate one, as its outputs are previews. Every output but the first (which
+    the caller stores like any result) is stored and indexed here. Returns
+    one record per format with its format, result (the rendered file for the
+    first, the storage location for the rest), encode seconds and bytes.
+    """
+    targets = [(spec, output_storage.writable_path(f"{task_id}{output_formats.extension(spec)}")) for spec in formats]
+    preview_spec = output_formats.PREVIEW_FORMAT
+    preview_name = f"{task_id}.preview{output_formats.extension(preview_spec)}"
+    preview_path = None
+    if not options.get('preview'):
+        preview_path = output_storage.writable_path(preview_name)
+        targets.append((preview_spec, preview_path))
+
+    def on_done(encoded):
+        if encoded['path'] == preview_path:
+            on_preview(output_index.store(output_storage, f"{task_id}.preview", preview_name, preview_path, options))
+
+    try:
+        encoded = output_formats.encode_all(render_path, targets, on_done=on_done)[:len(formats)]
+    finally:
+        os.remove(render_path)
+    outputs = []
+    for i, record in enumerate(encoded):
+        print(f"Encoded {record['format']}: {record['bytes']} bytes in {record['seconds']:.2f}s")
+        location = record['path']
+        if i > 0:
+            name = os.path.basename(location)
+            location = output_index.store(output_storage, name, name, location, options)
+        outputs.append({'format': record['format'], 'result': location, 'seconds': record['seconds'], 'bytes': record['bytes']})
+    return outputs
+
 @celery_app.task(bind=True)
-def slushify_task(self, input_path, original_filename, options=None, reference_path=None):
+@spans.traced('slushify')
+def slushify_task(self, input_path, original_filename, options=None, reference_path=None, cache_key=None,
+                  content_hash=None):
     """
     Celery task to process an audio file.
     It determines its own output path based on its task ID.
     It now accepts an optional reference_path for style transfer.
+    If cache_key is given, the finished result is added to the result cache.
+    content_hash is the upload's SHA-256; analysis results are kept under it.
+    With options['formats'], the audio is rendered losslessly once and then
+    encoded to each format; the result is the first one.
+    The result's 'stages' holds the per-stage spans (see spans.py).
     """
+    formats = (options or {}).get('formats')
+    output_path = None
     try:
-        self.update_state(state='PROGRESS', meta={'status': 'Initializing...'})
-
-        output_dir = 'slushwave-vaporizer/backend/outputs'
-        file_ext = os.path.splitext(original_filename)[1]
+        output_storage = storage.get_storage()
+        file_ext = output_formats.extension(formats[0]) if formats else os.path.splitext(original_filename)[1]
         output_filename = f"{self.request.id}{file_ext}"
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = stage_cache.temp_path() if formats else output_storage.writable_path(output_filename)
+        preview = None
 
-        self.update_state(state='PROGRESS', meta={'status': 'Processing audio...'})
+        def report(stage, status, fraction=None, **extra):
+            # 'output' lets /api/stream serve the file while it is still being written.
+            event = {'status': status, 'stage': stage, 'progress': fraction, **extra}
+            self.update_state(state='PROGRESS', meta={**event, 'output': output_path, 'preview': preview})
+            progress.publish(self.request.id, {'state': 'PROGRESS', **event})
+
+        report('init', 'Initializing...')
+        report('processing', 'Processing audio...')
         # Pass the reference_path to the audio processor
-        result_path = process_audio(input_path, output_path, options, reference_path)
+        try:
+            estimate = cost_model.estimate_job(input_path, options, reference_path, calibrated=False)
+        except Exception as e:
+            print(f"Could not estimate job cost: {e}")
+            estimate = None
+        start = time.perf_counter()
+        with spans.span('process_audio'), sox_pool.job_metrics() as sox_metrics:
+            result_path = process_audio(
+                input_path, output_path, options, reference_path, progress=report, session_id=self.request.id,
+                content_hash=content_hash
+            )
+        print(f"SoX: {sox_metrics['processes']} processes, {sox_metrics['seconds']:.2f}s")
+        # Recorded timings calibrate the cost model used for admission and ETAs.
+        if estimate:
+            cost_model.record_timing(
+                cost_model.calibration_key(options, reference_path), estimate, time.perf_counter() - start
+            )
+        resolved_options = resolve_options(dict(options or {}))
+        outputs = None
+        if formats:
+            def publish_preview(location):
+                nonlocal preview
+                preview = location
+                report('preview', 'Preview ready', None, preview=location)
+
+            report('encoding', 'Encoding outputs...')
+            with spans.span('encoding', formats=len(formats)):
+                outputs = _encode_outputs(
+                    self.request.id, result_path, formats, output_storage, resolved_options, publish_preview
+                )
+            result_path = outputs[0]['result']
+        with spans.span('store'):
+            if cache_key:
+                result_cache.store(cache_key, file_ext, result_path)
+            result_path = output_index.store(
+                output_storage, self.request.id, output_filename, result_path, resolved_options
+            )
+        if outputs:
+            outputs[0]['result'] = result_path
 
         # Clean up input files
-        if os.path.exists(input_path):
-            os.remove(input_path)
-        if reference_path and os.path.exists(reference_path):
-            os.remove(reference_path)
+        with spans.span('cleanup'):
+            if os.path.exists(input_path):
+                os.remove(input_path)
+            if reference_path and os.path.exists(reference_path):
+                os.remove(reference_path)
 
-        return {'status': 'SUCCESS', 'result': result_path}
+        cost_model.mark_done(self.request.id)
+        progress.publish(self.request.id, {'state': 'SUCCESS', 'status': 'Task completed!', 'result': result_path})
+        result = {'status': 'SUCCESS', 'result': result_path, 'sox': sox_metrics}
+        if outputs:
+            result.update(outputs=outputs, preview=preview)
+        return result
     except Exception as e:
-        # Clean up input files on failure too
+        # Clean up input files (and a lossless render still awaiting encoding) on failure too
+        if formats and output_path and os.path.exists(output_path):
+            os.remove(output_path)
         if os.path.exists(input_path):
             os.remove(input_path)
         if reference_path and os.path.exists(reference_path):
             os.remove(reference_path)
+        cost_model.mark_done(self.request.id)
+        progress.publish(self.request.id, {'state': 'FAILURE', 'status': str(e)})
         raise e
 
 @celery_app.task
-def cleanup_old_files(now=None):
+def cleanup_old_files(now=None, full_scan=False):
     """
-    Deletes files in the output directory that are older than 1 hour.
+    Deletes outputs that are older than 1 hour, using the output index.
+    With full_scan, every file in the output directory is also checked.
     The 'now' parameter is for testability.
     """
     print("Running cleanup task...")
     if now is None:
         now = time.time()
 
-    output_dir = 'slushwave-vaporizer/backend/outputs'
+    output_dir = storage.OUTPUT_DIR
     one_hour_ago = now - 3600
 
+    deleted_count = output_index.sweep(one_hour_ago, delete=storage.get_storage().delete)
+    if full_scan:
+        # Local outputs, or the scratch copies of remote ones.
+        deleted_count += _delete_unindexed_outputs(output_dir, one_hour_ago)
+
+    print(f"Cleanup task finished. Deleted {deleted_count} files.")
+
+    # The result cache lives in its own directory with its own size/TTL limits.
+    evicted_count = result_cache.evict(now=now)
+    print(f"Cleanup task evicted {evicted_count} cached results.")
+    evicted_stages = stage_cache.evict(now=now)
+    print(f"Cleanup task evicted {evicted_stages} cached render stages.")
+    return deleted_count
+
+def _delete_unindexed_outputs(output_dir, cutoff):
     if not os.path.isdir(output_dir):
         print(f"Cleanup task: Output directory {output_dir} not found.")
         return 0
 
     deleted_count = 0
-    for filename in os.listdir(output_dir):
-        file_path = os.path.join(output_dir, filename)
-        if os.path.isfile(file_path):
+    for dirpath, _dirnames, filenames in os.walk(output_dir):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
             try:
                 file_mod_time = os.path.getmtime(file_path)
-                if file_mod_time < one_hour_ago:
+                if file_mod_time < cutoff:
                     os.remove(file_path)
                     print(f"Deleted old file: {file_path}")
                     deleted_count += 1
             except OSError as e:
                 print(f"Error deleting file {file_path}: {e}")
-
-    print(f"Cleanup task finished. Deleted {deleted_count} files.")
     return deleted_count
 
 @celery_app.task
+@spans.traced('adjust')
 def adjust_task(base_file_path, effect_name, effect_params, new_file_id):
     """
-    Applies a single adjustment to an existing audio file.
-    Uses new_file_id to name the output. This is not a bound task.
+    Applies a single adjustment to an existing output, given by its storage
+    location. Uses new_file_id to name the output. This is not a bound task.
+    If the file's render session is still cached, the adjustment re-renders it
+    from the original source, changing the effect's parameters in place;
+    otherwise the effect is applied on top of the processed file.
     """
     try:
-        output_dir = os.path.dirname(base_file_path)
-        _base_name, file_ext = os.path.splitext(os.path.basename(base_file_path))
+        output_storage = storage.get_storage()
+        base_name, file_ext = os.path.splitext(os.path.basename(base_file_path))
         output_filename = f"{new_file_id}{file_ext}"
-        output_path = os.path.join(output_dir, output_filename)
+        output_path = output_storage.writable_path(output_filename)
 
-        effect_func = getattr(effects, f"apply_{effect_name}")
-        effect_func(base_file_path, output_path, **effect_params)
+        with spans.span('render', effect=effect_name):
+            rendered = adjust_audio(base_name, output_path, effect_name, effect_params, new_file_id=new_file_id)
+        if rendered is None:
+            effect_func = getattr(effects, f"apply_{effect_name}")
+            with spans.span('fetch'):
+                base_path = output_storage.fetch(base_file_path)
+            try:
+                with spans.span(f"effects.{effect_name}"):
+                    effect_func(base_path, output_path, **effect_params)
+            finally:
+                if base_path != base_file_path:
+                    os.remove(base_path)
+        with spans.span('store'):
+            output_path = output_index.store(
+                output_storage, new_file_id, output_filename, output_path,
+                {'adjusts': base_name, 'effect_name': effect_name, 'effect_params': effect_params}
+            )
 
         return {'status': 'SUCCESS', 'result': output_path}
     except Exception as e:
         raise e
+
+def main():
+    parser = argparse.ArgumentParser(description="Starts a Celery worker for one of the task queues.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Consume one queue with its configured concurrency.")
+    worker_parser.add_argument("queue", choices=sorted(QUEUE_CONCURRENCY))
+    worker_parser.add_argument(
+        "-c", "--concurrency", type=int, help="Override the queue's configured concurrency."
+    )
+    args = parser.parse_args()
+    concurrency = args.concurrency or QUEUE_CONCURRENCY[args.queue]
+    celery_app.worker_main([
+        'worker', '-Q', args.queue, '-c', str(concurrency), '-n', f'{args.queue}@%h', '--loglevel', 'INFO',
+    ])
+
+if __name__ == '__main__':
+    main()
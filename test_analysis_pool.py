@@ -0,0 +1,56 @@
+import contextvars
+import threading
+
+import pytest
+
+import analysis_pool
+
+def test_results_come_back_in_order(monkeypatch):
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '3')
+
+    assert analysis_pool.run([lambda: 1, lambda: 2, lambda: 3]) == [1, 2, 3]
+
+def test_calls_run_concurrently_in_the_callers_context(monkeypatch):
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '2')
+    job = contextvars.ContextVar('job')
+    job.set('job-1')
+    barrier = threading.Barrier(2, timeout=5)
+    def call():
+        barrier.wait()
+        return job.get(), threading.current_thread().name
+
+    (first_job, first_thread), (second_job, second_thread) = analysis_pool.run([call, call])
+
+    assert first_job == second_job == 'job-1'
+    assert first_thread != second_thread
+    assert first_thread.startswith('analysis')
+
+def test_pool_of_one_runs_in_the_callers_thread(monkeypatch):
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '1')
+
+    assert analysis_pool.run([lambda: threading.current_thread().name] * 2) == [threading.current_thread().name] * 2
+
+def test_error_is_raised_after_every_call_finished(monkeypatch):
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '2')
+    finished = threading.Event()
+    def fail():
+        raise ValueError('bad audio')
+    def slow():
+        finished.wait(0.2)
+        finished.set()
+
+    with pytest.raises(ValueError):
+        analysis_pool.run([fail, slow])
+    assert finished.is_set()
+
+def test_cores_are_split_between_worker_processes(monkeypatch):
+    monkeypatch.delenv('ANALYSIS_POOL_SIZE', raising=False)
+    monkeypatch.setattr(analysis_pool.os, 'cpu_count', lambda: 8)
+    monkeypatch.setattr(analysis_pool, '_worker_processes', 1)
+
+    analysis_pool.configure(3)
+    assert analysis_pool.pool_size() == 2
+    analysis_pool.configure(16)
+    assert analysis_pool.pool_size() == 1
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '4')
+    assert analysis_pool.pool_size() == 4
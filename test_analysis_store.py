@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+import soundfile as sf
+
+# Add parent dir to path to allow import of analysis_store
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import analysis_store
+import audio_processor
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'analysis.sqlite3')
+    monkeypatch.setenv('ANALYSIS_DB_PATH', db_path)
+    return db_path
+
+def _write_tone(path, seconds=3, sr=22050):
+    t = np.arange(seconds * sr) / sr
+    sf.write(str(path), 0.3 * np.sin(2 * np.pi * 440 * t), sr)
+    return str(path)
+
+def test_put_then_get(store_path):
+    features = {'tempo': 120, 'key': 'A'}
+    summaries = {'chroma_mean': [0.0] * 12, 'rms': {'mean': 0.1}}
+    assert analysis_store.put('abc', 1, features, summaries)
+    assert analysis_store.get('abc', 1) == {'features': features, 'summaries': summaries}
+    assert analysis_store.get('missing', 1) is None
+
+def test_version_bump_invalidates(store_path):
+    analysis_store.put('abc', 1, {'tempo': 120}, {})
+    assert analysis_store.get('abc', 2) is None
+
+def test_put_then_get_loop(store_path):
+    assert analysis_store.get_loop('abc', 10) is None
+    assert analysis_store.put_loop('abc', 10, 441000, 882000, 44100)
+    assert analysis_store.get_loop('abc', 10) == (441000, 882000, 44100)
+    assert analysis_store.get_loop('abc', 8) is None
+
+def test_analyze_audio_uses_store(store_path, tmp_path, mocker):
+    """The second analysis of the same content is served from the store without decoding."""
+    path = _write_tone(tmp_path / 'ref.wav')
+    first = audio_processor.analyze_audio(path, use_store=True)
+    stored = analysis_store.get(analysis_store.hash_file(path), audio_processor.ANALYSIS_VERSION)
+    assert stored['features'] == first
+    assert len(stored['summaries']['chroma_mean']) == 12
+    assert set(stored['summaries']['rms']) == {'mean', 'std', 'p10', 'p50', 'p90', 'max'}
+
+    mock_load = mocker.patch('audio_processor.librosa.load')
+    copy_path = tmp_path / 'same_content.wav'
+    copy_path.write_bytes(open(path, 'rb').read())
+    assert audio_processor.analyze_audio(str(copy_path), use_store=True) == first
+    mock_load.assert_not_called()
+
+def test_preanalyze_directory(store_path, tmp_path):
+    tracks = tmp_path / 'tracks'
+    (tracks / 'nested').mkdir(parents=True)
+    _write_tone(tracks / 'a.wav')
+    _write_tone(tracks / 'nested' / 'b.wav', seconds=4)
+    (tracks / 'notes.txt').write_text('not audio')
+    (tracks / 'broken.mp3').write_bytes(b'not really an mp3')
+
+    assert analysis_store.preanalyze_directory(str(tracks)) == (1, 0, 1)
+    assert analysis_store.preanalyze_directory(str(tracks), recursive=True) == (1, 1, 1)
@@ -1,7 +1,21 @@
 import pytest
 from io import BytesIO
 from unittest.mock import MagicMock
+import json
 import os
+import numpy as np
+import soundfile as sf
+import result_cache
+import output_index
+import storage
+import output_formats
+
+def _audio():
+    """A short, valid WAV upload."""
+    buffer = BytesIO()
+    sf.write(buffer, np.zeros(4410), 44100, format='WAV')
+    buffer.seek(0)
+    return buffer
 
 def test_hello_endpoint(client):
     """Tests the hello world endpoint."""
@@ -18,7 +32,7 @@ def test_slushify_no_file(client):
 
 def test_slushify_empty_filename(client):
     """Tests the slushify endpoint with an empty filename."""
-    data = {'file': (BytesIO(b'my file contents'), '')}
+    data = {'file': (_audio(), '')}
     response = client.post('/api/slushify', data=data, content_type='multipart/form-data')
     assert response.status_code == 400
     assert 'error' in response.json
@@ -31,7 +45,7 @@ def test_slushify_dispatch_with_preset(client, mocker):
     mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=mock_task)
 
     form_data = {
-        'file': (BytesIO(b'my file contents'), 'test.mp3'),
+        'file': (_audio(), 'test.mp3'),
         'preset': 'nightcore'
     }
     response = client.post('/api/slushify', data=form_data, content_type='multipart/form-data')
@@ -48,7 +62,7 @@ def test_slushify_dispatch_no_preset_defaults(client, mocker):
     mock_task.id = 'test_task_id_456'
     mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=mock_task)
 
-    form_data = {'file': (BytesIO(b'my file contents'), 'test.mp3')}
+    form_data = {'file': (_audio(), 'test.mp3')}
     response = client.post('/api/slushify', data=form_data, content_type='multipart/form-data')
 
     assert response.status_code == 202
@@ -57,6 +71,299 @@ def test_slushify_dispatch_no_preset_defaults(client, mocker):
     called_options = mock_delay.call_args[0][2]
     assert called_options['preset'] == 'slushwave'
 
+def test_slushify_cache_hit_skips_celery(client, mocker):
+    """A cached result is returned immediately without queueing a task."""
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+    mocker.patch('app.result_cache.lookup', side_effect=lambda key, ext, output_path: output_path)
+    mock_store_result = mocker.patch('app.celery_app.backend.store_result')
+
+    form_data = {'file': (_audio(), 'test.mp3'), 'preset': 'nightcore'}
+    response = client.post('/api/slushify', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.json['state'] == 'SUCCESS'
+    assert response.json['cached'] is True
+    assert response.json['result'].endswith(f"{response.json['task_id']}.mp3")
+    mock_delay.assert_not_called()
+    mock_store_result.assert_called_once()
+
+def test_slushify_cache_key_passed_to_task(client, mocker):
+    """On a miss, the task is given the cache key so it can store its result."""
+    mock_task = MagicMock()
+    mock_task.id = 'test_task_id_789'
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=mock_task)
+
+    form_data = {'file': (_audio(), 'test.mp3')}
+    response = client.post('/api/slushify', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert len(mock_delay.call_args[1]['cache_key']) == 64
+
+def test_batch_dispatches_one_group(app, client, mocker, tmp_path):
+    """Cache misses go out together as one Celery group; hits are served immediately."""
+    mocker.patch.dict(app.config, {'OUTPUT_FOLDER': str(tmp_path)})
+    mocker.patch('app.result_cache.lookup', side_effect=lambda key, ext, output_path: output_path if ext == '.wav' else None)
+    mocker.patch('app.celery_app.backend.store_result')
+    mock_group = mocker.patch('app.group')
+    mock_group.return_value.apply_async.return_value.results = [MagicMock(id='task_a'), MagicMock(id='task_c')]
+
+    form_data = {
+        'files': [(_audio(), 'a.mp3'), (_audio(), 'b.wav'), (_audio(), 'c.mp3')],
+        'preset': 'nightcore',
+    }
+    response = client.post('/api/batch', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert response.json['total'] == 3
+    assert response.json['cached'] == 1
+    signatures = mock_group.call_args[0][0]
+    assert [sig.args[1] for sig in signatures] == ['a.mp3', 'c.mp3']
+    assert all(sig.args[2] == {'preset': 'nightcore'} for sig in signatures)
+    with open(tmp_path / f"batch_{response.json['batch_id']}.json") as f:
+        entries = json.load(f)['entries']
+    assert [entry['task_id'] for entry in entries][::2] == ['task_a', 'task_c']
+    # Manifests are local files, removed by the full scan rather than the indexed sweep.
+    assert output_index.get(f"batch_{response.json['batch_id']}") is None
+
+def test_batch_admits_each_file(app, client, mocker, tmp_path):
+    """Every file is admitted on its own; each dispatched task is counted in its queue's backlog."""
+    mocker.patch.dict(app.config, {
+        'OUTPUT_FOLDER': str(tmp_path), 'JOB_BUDGET_SECONDS': 10.0,
+        'ADMISSION_POLICY': 'downsample', 'DOWNSAMPLE_RATE': 22050,
+    })
+    estimates = {('a.mp3', None): 5.0, ('b.mp3', None): 20.0, ('b.mp3', 22050): 8.0}
+    mocker.patch('app.cost_model.estimate_job', side_effect=lambda path, options, ref: estimates[
+        (path.rsplit('_', 1)[-1], options.get('max_sample_rate'))
+    ])
+    mock_add_pending = mocker.patch('app.cost_model.add_pending')
+    mock_group = mocker.patch('app.group')
+    mock_group.return_value.apply_async.return_value.results = [MagicMock(id='task_a'), MagicMock(id='task_b')]
+
+    form_data = {'files': [(_audio(), 'a.mp3'), (_audio(), 'b.mp3')], 'preset': 'nightcore'}
+    response = client.post('/api/batch', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    signatures = mock_group.call_args[0][0]
+    assert [sig.args[2].get('max_sample_rate') for sig in signatures] == [None, 22050]
+    assert signatures[0].kwargs['cache_key'] != signatures[1].kwargs['cache_key']
+    assert mock_add_pending.call_args_list == [
+        mocker.call('task_a', 'slushify', 5.0), mocker.call('task_b', 'slushify', 8.0)
+    ]
+    with open(tmp_path / f"batch_{response.json['batch_id']}.json") as f:
+        entries = json.load(f)['entries']
+    assert [entry['admission'] for entry in entries] == ['accept', 'downsample']
+
+def test_batch_over_budget_deferred_or_rejected(app, client, mocker, tmp_path):
+    """Deferred files queue behind everything else; one rejected file rejects the batch."""
+    mocker.patch.dict(app.config, {
+        'OUTPUT_FOLDER': str(tmp_path), 'UPLOAD_FOLDER': str(tmp_path),
+        'JOB_BUDGET_SECONDS': 10.0, 'ADMISSION_POLICY': 'defer',
+    })
+    mocker.patch('app.cost_model.estimate_job', side_effect=lambda path, options, ref: 20.0 if path.endswith('big.mp3') else 5.0)
+    mocker.patch('app.cost_model.add_pending')
+    mock_group = mocker.patch('app.group')
+    mock_group.return_value.apply_async.return_value.results = [MagicMock(id='task_a'), MagicMock(id='task_b')]
+    form_data = lambda: {'files': [(_audio(), 'a.mp3'), (_audio(), 'big.mp3')]}
+
+    response = client.post('/api/batch', data=form_data(), content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    signatures = mock_group.call_args[0][0]
+    assert [sig.options.get('priority') for sig in signatures] == [None, 9]
+
+    mocker.patch.dict(app.config, {'ADMISSION_POLICY': 'reject'})
+    mock_group.reset_mock()
+    uploads_before = set(os.listdir(tmp_path))
+
+    response = client.post('/api/batch', data=form_data(), content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert 'big.mp3' in response.json['error']
+    mock_group.assert_not_called()
+    assert set(os.listdir(tmp_path)) == uploads_before
+
+def test_batch_no_files(client):
+    response = client.post('/api/batch', data={}, content_type='multipart/form-data')
+    assert response.status_code == 400
+
+def test_batch_status_aggregates_progress(app, client, mocker, tmp_path):
+    """Batch status combines the per-file task states into one progress figure and a manifest."""
+    mocker.patch.dict(app.config, {'OUTPUT_FOLDER': str(tmp_path)})
+    entries = [{'filename': f'{name}.mp3', 'task_id': name} for name in ('done', 'running', 'failed', 'queued')]
+    (tmp_path / 'batch_b1.json').write_text(json.dumps({'options': {}, 'entries': entries}))
+    states = {
+        'done': ('SUCCESS', {'result': '/out/done.mp3'}),
+        'running': ('PROGRESS', {'status': 'Applying effects...', 'progress': 0.5}),
+        'failed': ('FAILURE', 'boom'),
+        'queued': ('PENDING', None),
+    }
+    mocker.patch('app.celery_app.AsyncResult', side_effect=lambda task_id: MagicMock(state=states[task_id][0], info=states[task_id][1]))
+
+    response = client.get('/api/batch/b1')
+
+    assert response.json['state'] == 'PROGRESS'
+    assert (response.json['completed'], response.json['failed'], response.json['total']) == (1, 1, 4)
+    assert response.json['progress'] == pytest.approx(2.5 / 4)
+    assert response.json['manifest'][0]['result'] == '/out/done.mp3'
+    assert response.json['manifest'][2]['error'] == 'boom'
+    assert client.get('/api/batch/unknown').status_code == 404
+
+def test_slushify_returns_estimate_and_eta(client, mocker):
+    """Accepted jobs report their estimated cost and an ETA that includes the queue's backlog."""
+    mocker.patch('app.cost_model.estimate_job', return_value=20.0)
+    mocker.patch('app.cost_model.pending_seconds', return_value=80.0)
+    mock_add_pending = mocker.patch('app.cost_model.add_pending')
+    mocker.patch('app.QUEUE_CONCURRENCY', {'slushify': 2})
+    mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+
+    response = client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert response.json['admission'] == 'accept'
+    assert response.json['estimated_seconds'] == 20.0
+    assert response.json['eta_seconds'] == 60.0
+    mock_add_pending.assert_called_once_with('t1', 'slushify', 20.0)
+
+def test_slushify_over_budget_rejected(app, client, mocker):
+    mocker.patch.dict(app.config, {'JOB_BUDGET_SECONDS': 10.0, 'ADMISSION_POLICY': 'reject'})
+    mocker.patch('app.cost_model.estimate_job', return_value=20.0)
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+
+    response = client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert response.json['estimated_seconds'] == 20.0
+    mock_delay.assert_not_called()
+
+def test_slushify_over_budget_deferred(app, client, mocker):
+    """Deferred jobs are queued behind everything else."""
+    mocker.patch.dict(app.config, {'JOB_BUDGET_SECONDS': 10.0, 'ADMISSION_POLICY': 'defer'})
+    mocker.patch('app.cost_model.estimate_job', return_value=20.0)
+    mock_apply_async = mocker.patch('tasks.slushify_task.apply_async', return_value=MagicMock(id='t2'))
+
+    response = client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert response.json['admission'] == 'defer'
+    assert mock_apply_async.call_args[1]['priority'] == 9
+
+def test_slushify_over_budget_downsampled(app, client, mocker):
+    """A downsampled job gets the lower sample rate, and its own cache key."""
+    mocker.patch.dict(app.config, {'JOB_BUDGET_SECONDS': 10.0, 'ADMISSION_POLICY': 'downsample', 'DOWNSAMPLE_RATE': 22050})
+    mocker.patch('app.cost_model.estimate_job', side_effect=lambda path, options, ref: 5.0 if options.get('max_sample_rate') else 20.0)
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t3'))
+    mock_make_key = mocker.spy(result_cache, 'make_key')
+
+    response = client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+
+    assert response.json['admission'] == 'downsample'
+    assert mock_delay.call_args[0][2]['max_sample_rate'] == 22050
+    assert mock_delay.call_args[1]['cache_key'] == mock_make_key.spy_return
+    assert mock_make_key.call_args[0][1]['max_sample_rate'] == 22050
+
+def test_slushify_downsampled_repeat_is_served_from_cache(app, client, mocker):
+    """A repeat upload of a downsampled job finds the result stored under the downsampled key."""
+    mocker.patch.dict(app.config, {'JOB_BUDGET_SECONDS': 10.0, 'ADMISSION_POLICY': 'downsample', 'DOWNSAMPLE_RATE': 22050})
+    mocker.patch('app.cost_model.estimate_job', side_effect=lambda path, options, ref: 5.0 if options.get('max_sample_rate') else 20.0)
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t3'))
+    client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+    stored_key = mock_delay.call_args[1]['cache_key']
+    mocker.patch('app.result_cache.lookup', side_effect=lambda key, ext, output_path: output_path if key == stored_key else None)
+    mocker.patch('app.celery_app.backend.store_result')
+
+    response = client.post('/api/slushify', data={'file': (_audio(), 'test.mp3')}, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.json['cached'] is True
+    assert response.json['admission'] == 'downsample'
+    assert mock_delay.call_count == 1
+
+def test_slushify_output_formats(client, mocker):
+    """Requested formats reach the task; the first one decides the cached result's extension."""
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+    mock_make_key = mocker.spy(result_cache, 'make_key')
+
+    response = client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), 'formats': 'flac'}, content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 202
+    assert mock_delay.call_args[0][2]['formats'] == ['flac']
+    assert mock_make_key.call_args[1]['output_ext'] == '.flac'
+
+def test_slushify_several_formats_skip_the_cache(client, mocker):
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+    mock_lookup = mocker.patch('app.result_cache.lookup')
+
+    client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), 'formats': 'flac,opus:64'}, content_type='multipart/form-data'
+    )
+
+    mock_lookup.assert_not_called()
+    assert mock_delay.call_args[1]['cache_key'] is None
+
+def test_slushify_invalid_formats(client, mocker):
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+
+    response = client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), 'formats': 'aac'}, content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 400
+    assert 'Unknown output format' in response.json['error']
+    mock_delay.assert_not_called()
+
+def test_slushify_preview(client, mocker):
+    """A preview goes to the fast lane, encoded in the preview format, with the upload's hash for the analysis cache."""
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+    mock_pending = mocker.patch('app.cost_model.add_pending')
+
+    response = client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), 'preview': 'true', 'preview_seconds': '5'},
+        content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 202
+    options = mock_delay.call_args[0][2]
+    assert options['preview'] is True
+    assert options['preview_seconds'] == 5.0
+    assert options['formats'] == [output_formats.PREVIEW_FORMAT]
+    assert len(mock_delay.call_args[1]['content_hash']) == 64
+    assert mock_pending.call_args[0][1] == 'adjust'
+
+def test_slushify_invalid_preview_seconds(client, mocker):
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+
+    response = client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), 'preview': 'true', 'preview_seconds': '600'},
+        content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 400
+    assert 'preview_seconds' in response.json['error']
+    mock_delay.assert_not_called()
+
+@pytest.mark.parametrize('form, expected', [
+    ({'streaming': 'true'}, {'backend': 'numpy', 'streaming': True}),
+    ({'streaming': 'true', 'backend': 'numpy'}, {'backend': 'numpy', 'streaming': True}),
+    ({'streaming': 'true', 'backend': 'sox'}, None),
+])
+def test_slushify_streaming_runs_on_the_numpy_backend(client, mocker, form, expected):
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+
+    response = client.post(
+        '/api/slushify', data={'file': (_audio(), 'test.mp3'), **form}, content_type='multipart/form-data'
+    )
+
+    if expected is None:
+        assert response.status_code == 400
+        assert 'numpy backend' in response.json['error']
+        mock_delay.assert_not_called()
+    else:
+        assert response.status_code == 202
+        options = mock_delay.call_args[0][2]
+        assert {key: options[key] for key in expected} == expected
+
 # Updated tests for the status endpoint
 def test_taskstatus_pending(client, mocker):
     """Test status endpoint for a PENDING task."""
@@ -90,6 +397,17 @@ def test_taskstatus_success(client, mocker):
     assert response.status_code == 200
     assert response.json['state'] == 'SUCCESS'
 
+def test_taskstatus_stages_on_request(client, mocker):
+    """The per-stage breakdown is only returned when asked for."""
+    mock_result = MagicMock()
+    mock_result.state = 'SUCCESS'
+    mock_result.info = {'result': '/path/to/output.mp3', 'stages': [{'stage': 'decode', 'wall_seconds': 0.5}]}
+    mocker.patch('app.celery_app.AsyncResult', return_value=mock_result)
+
+    assert 'stages' not in client.get('/api/status/some_task_id').json
+    response = client.get('/api/status/some_task_id?stages=1')
+    assert response.json['stages'] == [{'stage': 'decode', 'wall_seconds': 0.5}]
+
 def test_taskstatus_failure(client, mocker):
     """Test status endpoint for a FAILURE task."""
     mock_result = MagicMock()
@@ -101,9 +419,80 @@ def test_taskstatus_failure(client, mocker):
     assert response.status_code == 200
     assert response.json['state'] == 'FAILURE'
 
+def test_events_stream_until_terminal_state(client, mocker):
+    """The SSE endpoint sends the current state, then pushed events until the task ends."""
+    mock_result = MagicMock()
+    mock_result.state = 'PROGRESS'
+    mock_result.info = {'status': 'Processing audio...', 'stage': 'processing', 'progress': None}
+    mocker.patch('app.celery_app.AsyncResult', return_value=mock_result)
+    subscription = MagicMock()
+    subscription.get.side_effect = [
+        {'state': 'PROGRESS', 'status': 'Applying effects...', 'stage': 'effects', 'progress': 0.5},
+        None,
+        {'state': 'SUCCESS', 'status': 'Task completed!', 'result': '/path/to/output.mp3'},
+    ]
+    mocker.patch('app.progress.subscribe', return_value=subscription)
+
+    response = client.get('/api/events/some_task_id')
+
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    events = [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+    assert [event['state'] for event in events] == ['PROGRESS', 'PROGRESS', 'SUCCESS']
+    assert events[1]['stage'] == 'effects'
+    assert ': keep-alive' in body
+    subscription.close.assert_called_once()
+
+def test_stream_finished_output_supports_range(client, mocker, tmp_path):
+    """A finished result is served with HTTP Range support."""
+    output = tmp_path / 'out.wav'
+    output.write_bytes(bytes(range(256)))
+    mock_result = MagicMock()
+    mock_result.state = 'SUCCESS'
+    mock_result.info = {'result': str(output)}
+    mocker.patch('app.celery_app.AsyncResult', return_value=mock_result)
+
+    response = client.get('/api/stream/some_task_id', headers={'Range': 'bytes=10-19'})
+
+    assert response.status_code == 206
+    assert response.data == bytes(range(10, 20))
+
+def test_stream_in_flight_output(client, mocker, tmp_path):
+    """A file still being written is streamed from the offset and drained once the task ends."""
+    output = tmp_path / 'out.wav'
+    output.write_bytes(b'0123456789')
+    mock_result = MagicMock()
+    mock_result.state = 'PROGRESS'
+    mock_result.info = {'status': 'Applying effects...', 'output': str(output)}
+    mocker.patch('app.celery_app.AsyncResult', return_value=mock_result)
+
+    def finish(timeout):
+        with open(output, 'ab') as f:
+            f.write(b'abc')
+        return {'state': 'SUCCESS', 'status': 'Task completed!', 'result': str(output)}
+    subscription = MagicMock()
+    subscription.get.side_effect = finish
+    mocker.patch('app.progress.subscribe', return_value=subscription)
+
+    response = client.get('/api/stream/some_task_id?offset=4')
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.data == b'456789abc'
+
+def test_stream_not_started(client, mocker):
+    """Nothing can be streamed before the worker has started writing."""
+    mock_result = MagicMock()
+    mock_result.state = 'PENDING'
+    mocker.patch('app.celery_app.AsyncResult', return_value=mock_result)
+
+    response = client.get('/api/stream/some_task_id')
+
+    assert response.status_code == 409
+
 def test_adjust_endpoint_success(client, mocker):
     """Tests the adjust endpoint for successful dispatch."""
-    mocker.patch('os.listdir', return_value=['original_task_id.mp3'])
+    output_index.record('original_task_id', 'slushwave-vaporizer/backend/outputs/original_task_id.mp3')
     mocker.patch('os.path.exists', return_value=True)
 
     mock_task = MagicMock()
@@ -128,7 +517,7 @@ def test_adjust_endpoint_success(client, mocker):
 
 def test_adjust_endpoint_file_not_found(client, mocker):
     """Tests the adjust endpoint when the original file is not found."""
-    mocker.patch('os.listdir', return_value=['another_file.mp3'])
+    output_index.record('another_file', 'slushwave-vaporizer/backend/outputs/another_file.mp3')
 
     adj_data = {'effect_name': 'phaser', 'effect_params': {}}
     response = client.post('/api/adjust/original_task_id', json=adj_data)
@@ -136,9 +525,17 @@ def test_adjust_endpoint_file_not_found(client, mocker):
     assert response.status_code == 404
     assert 'Original processed file not found' in response.json['error']
 
+def test_adjust_endpoint_indexed_file_deleted(client):
+    """An indexed output that cleanup already removed is reported as missing."""
+    output_index.record('original_task_id', 'slushwave-vaporizer/backend/outputs/gone.mp3')
+
+    response = client.post('/api/adjust/original_task_id', json={'effect_name': 'phaser', 'effect_params': {}})
+
+    assert response.status_code == 404
+
 def test_adjust_endpoint_bad_data(client, mocker):
     """Tests the adjust endpoint with invalid request data."""
-    mocker.patch('os.listdir', return_value=['original_task_id.mp3'])
+    output_index.record('original_task_id', 'slushwave-vaporizer/backend/outputs/original_task_id.mp3')
     mocker.patch('os.path.exists', return_value=True)
 
     bad_data = {'effect_params': {}} # Missing 'effect_name'
@@ -147,14 +544,52 @@ def test_adjust_endpoint_bad_data(client, mocker):
     assert response.status_code == 400
     assert 'Invalid adjustment data' in response.json['error']
 
-def test_serve_output_file(client, mocker):
-    """Tests the file serving endpoint."""
-    mock_send = mocker.patch('app.send_from_directory', return_value="file content")
+def test_serve_output_file(client, output_storage):
+    """Outputs are found in their shard and served with Range support."""
+    with open(output_storage.writable_path('test.mp3'), 'wb') as f:
+        f.write(bytes(range(100)))
+
+    response = client.get('/api/outputs/test.mp3')
+    assert response.status_code == 200
+    assert response.data == bytes(range(100))
+
+    response = client.get('/api/outputs/test.mp3', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == bytes(range(10, 20))
+
+    assert client.get('/api/outputs/missing.mp3').status_code == 404
+
+def test_serve_output_file_x_accel_redirect(app, client, output_storage, mocker):
+    """With an internal redirect prefix, nginx sends the bytes instead of the Flask worker."""
+    mocker.patch.dict(app.config, {'X_ACCEL_REDIRECT_PREFIX': '/protected-outputs/'})
+    location = output_storage.writable_path('test.mp3')
+    with open(location, 'wb') as f:
+        f.write(b'x' * 100)
 
     response = client.get('/api/outputs/test.mp3')
 
     assert response.status_code == 200
-    assert response.data == b"file content"
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/protected-outputs/' + storage.shard('test.mp3')
+    assert response.mimetype == 'audio/mpeg'
+
+def test_serve_output_file_x_sendfile(app, client, output_storage, mocker):
+    mocker.patch.dict(app.config, {'USE_X_SENDFILE': True})
+    location = output_storage.writable_path('test.mp3')
+    with open(location, 'wb') as f:
+        f.write(b'x' * 100)
+
+    response = client.get('/api/outputs/test.mp3')
+
+    assert response.headers['X-Sendfile'] == os.path.abspath(location)
+    assert response.data == b''
+
+def test_serve_remote_output_redirects(client, mocker):
+    remote = MagicMock()
+    remote.url.return_value = 'https://bucket.example/ab/cd/test.mp3?X-Amz-Signature=abc'
+    mocker.patch('app.storage.get_storage', return_value=remote)
+
+    response = client.get('/api/outputs/test.mp3')
 
-    expected_dir = os.path.abspath('slushwave-vaporizer/backend/outputs')
-    mock_send.assert_called_once_with(expected_dir, 'test.mp3')
+    assert response.status_code == 302
+    assert response.headers['Location'] == remote.url.return_value
@@ -0,0 +1,51 @@
+import argparse
+
+import soundfile as sf
+
+import benchmark
+
+def _results(**seconds):
+    return {'cases': {case: {'seconds': value} for case, value in seconds.items()}}
+
+def test_make_fixture_shape(tmp_path):
+    path = benchmark.make_fixture(str(tmp_path / 'fixture.wav'), 1.5, sr=22050, channels=1)
+    info = sf.info(path)
+    assert (info.frames, info.samplerate, info.channels) == (33075, 22050, 1)
+
+def test_compare_reports_only_real_slowdowns():
+    baseline = _results(slower=1.0, noisy=0.01, faster=2.0, removed=1.0)
+    current = _results(slower=1.5, noisy=0.03, faster=1.0, added=5.0)
+
+    regressions = benchmark.compare(current, baseline, tolerance=0.25, min_seconds=0.05)
+
+    assert [regression['case'] for regression in regressions] == ['slower']
+    assert regressions[0]['ratio'] == 1.5
+
+def test_suite_times_each_case(tmp_path):
+    args = argparse.Namespace(
+        durations=[1], sample_rates=[22050], channels=[2], presets=['nightcore'], backends=['numpy'],
+        repeat=1, warmup=0, video=False, baseline=None, tolerance=0.25, min_seconds=0.05,
+    )
+
+    results = benchmark.bench_suite(args)
+
+    assert set(results['cases']) == {
+        'process_audio/nightcore/numpy/no_reference/1s_22050hz_2ch',
+        'process_audio/nightcore/numpy/reference/1s_22050hz_2ch',
+        'analyze_audio/1s_22050hz_2ch',
+        'find_and_extract_loop/1s_22050hz_2ch',
+    }
+    case = results['cases']['process_audio/nightcore/numpy/reference/1s_22050hz_2ch']
+    assert case['seconds'] > 0
+    assert {'decode', 'style_analysis', 'effects'} <= set(case['stages'])
+    assert 'regressions' not in results
+
+def test_parallel_reports_both_modes(monkeypatch):
+    monkeypatch.delenv('ANALYSIS_POOL_SIZE', raising=False)
+    args = argparse.Namespace(duration=2, preset='lofi', backend='numpy', workers=2, repeat=1)
+
+    results = benchmark.bench_parallel(args)
+
+    assert (results['sequential']['workers'], results['parallel']['workers']) == (1, 2)
+    assert results['sequential']['analysis_seconds'] > 0 and results['parallel']['analysis_seconds'] > 0
+    assert results['analysis_speedup'] > 0
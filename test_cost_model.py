@@ -0,0 +1,66 @@
+import numpy as np
+import soundfile as sf
+
+import cost_model
+
+def test_probe_reads_header(tmp_path):
+    path = str(tmp_path / 'in.wav')
+    sf.write(path, np.zeros((22050 * 3, 2), dtype=np.float32), 22050)
+    assert cost_model.probe(path) == {'duration': 3.0, 'samplerate': 22050, 'channels': 2}
+
+def test_duration_guessed_from_size_when_header_unreadable(tmp_path):
+    path = tmp_path / 'in.m4a'
+    path.write_bytes(b'\0' * 16000)
+    assert cost_model.probe(str(path)) is None
+    assert cost_model.estimate_duration(str(path)) == 1.0
+
+def test_estimate_grows_with_duration_and_effects():
+    short = cost_model.estimate_seconds(60, {'preset': 'nightcore'})
+    assert cost_model.estimate_seconds(600, {'preset': 'nightcore'}) > short
+    assert cost_model.estimate_seconds(60, {'preset': 'nightcore', 'no_reverb': False, 'phaser': True}) > \
+        cost_model.estimate_seconds(60, {'preset': 'nightcore', 'no_reverb': True})
+    assert cost_model.estimate_seconds(60, {'preset': 'nightcore'}, reference_duration=60) > short
+
+def test_loop_presets_only_render_the_loop():
+    options = {'loop_detection': {'enabled': True, 'duration_seconds': 10}, 'no_reverb': True}
+    assert cost_model.estimate_seconds(3600, options) < cost_model.estimate_seconds(3600, {'no_reverb': True})
+
+def test_preview_renders_a_short_low_rate_excerpt():
+    full = cost_model.estimate_seconds(600, {'preset': 'nightcore'}, sample_rate=44100)
+    preview = cost_model.estimate_seconds(
+        600, {'preset': 'nightcore', 'preview': True, 'formats': ['opus:48']}, sample_rate=44100
+    )
+    assert preview < full / 20
+
+def test_priority_for():
+    assert cost_model.priority_for(0) == 0
+    assert cost_model.priority_for(1) < cost_model.priority_for(60) < cost_model.priority_for(600)
+    assert cost_model.priority_for(1e9) == cost_model.PRIORITY_STEPS - 1
+
+def test_calibration_factor_from_recorded_timings():
+    assert cost_model.calibration_factor('nightcore') == 1.0
+    cost_model.record_timing('nightcore', 10.0, 30.0)
+    cost_model.record_timing('nightcore', 10.0, 10.0)
+    cost_model.record_timing('lofi', 10.0, 5.0)
+    assert cost_model.calibration_factor('nightcore') == 2.0
+    assert cost_model.calibration_factor('lofi') == 0.5
+
+def test_calibration_key():
+    assert cost_model.calibration_key({'preset': 'lofi'}) == 'lofi'
+    assert cost_model.calibration_key({'preset': 'lofi'}, 'ref.mp3') == 'lofi+reference'
+    assert cost_model.calibration_key({}) == 'custom'
+
+def test_pending_backlog():
+    cost_model.add_pending('a', 'slushify', 30.0)
+    cost_model.add_pending('b', 'slushify', 10.0)
+    cost_model.add_pending('c', 'style_transfer', 100.0)
+    assert cost_model.pending_seconds('slushify') == 40.0
+
+    cost_model.mark_done('a')
+    assert cost_model.pending_seconds('slushify') == 10.0
+    # A job that finished before it was counted doesn't reappear.
+    cost_model.mark_done('d')
+    cost_model.add_pending('d', 'slushify', 50.0)
+    assert cost_model.pending_seconds('slushify') == 10.0
+    # Entries of jobs that never reported back expire.
+    assert cost_model.pending_seconds('style_transfer', now=1e12) == 0.0
@@ -6,6 +6,7 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import effects
+import pysndfx
 
 @pytest.fixture
 def mock_fx_chain(mocker):
@@ -26,7 +27,7 @@ def mock_fx_chain(mocker):
     mock_chain_instance.reverb.return_value = mock_chain_instance
 
     # Mock the class constructor to return our configured instance
-    mocker.patch('effects.AudioEffectsChain', return_value=mock_chain_instance)
+    mocker.patch('pysndfx.AudioEffectsChain', return_value=mock_chain_instance)
 
     return mock_chain_instance
 
@@ -57,3 +58,17 @@ def test_apply_bass_boost(mocker, mock_fx_chain):
     effects.apply_bass_boost('in.wav', 'out.wav', gain=10)
     mock_fx_chain.custom.assert_called_once_with('bass 10')
     mock_apply_helper.assert_called_once_with('in.wav', 'out.wav', mock_fx_chain)
+
+def test_build_chain_fuses_effects(mocker, mock_fx_chain):
+    """Tests that build_chain appends every effect to a single chain."""
+    fx = effects.build_chain([('bass_boost', {'gain': 3}), ('speed', {'ratio': 0.75}), ('reverb', {})])
+    assert fx is mock_fx_chain
+    pysndfx.AudioEffectsChain.assert_called_once_with()
+    mock_fx_chain.custom.assert_called_once_with('bass 3')
+    mock_fx_chain.speed.assert_called_once_with(0.75)
+    mock_fx_chain.reverb.assert_called_once()
+
+def test_build_chain_unknown_effect():
+    """Tests that an unknown effect name is rejected."""
+    with pytest.raises(ValueError):
+        effects.build_chain([('flanger', {})])
@@ -0,0 +1,236 @@
+import pytest
+import numpy as np
+import shutil
+import soundfile as sf
+
+# Add parent dir to path to allow import of numpy_effects
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy_effects
+import effects
+from audio_processor import process_audio
+
+SR = 44100
+
+# How closely the NumPy backend must match SoX, per effect:
+# overall level difference (dB) and the largest per-band spectral difference (dB).
+TOLERANCES = {
+    'bass_boost': {'level_db': 0.5, 'band_db': 1.5},
+    'pitch_shift': {'level_db': 1.0, 'band_db': 4.0},
+    'oops': {'level_db': 0.5, 'band_db': 1.5},
+    'tremolo': {'level_db': 0.5, 'band_db': 2.0},
+    'phaser': {'level_db': 1.0, 'band_db': 3.0},
+    'gain': {'level_db': 0.1, 'band_db': 0.5},
+    'compand': {'level_db': 1.0, 'band_db': 2.0},
+    'speed': {'level_db': 0.5, 'band_db': 2.0},
+    'lowpass': {'level_db': 0.5, 'band_db': 1.5},
+    'reverb': {'level_db': 1.0, 'band_db': 3.0},
+}
+
+PARAMS = {
+    'bass_boost': {'gain': 8},
+    'pitch_shift': {'shift': -75},
+    'tremolo': {'freq': 500, 'depth': 50},
+    'gain': {'db': -6},
+    'speed': {'ratio': 0.75},
+    'lowpass': {'cutoff': 3500},
+}
+
+def _signal(seconds=2.0, channels=2):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SR)) / SR
+    left = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))
+    right = 0.3 * np.sin(2 * np.pi * 330 * t) + 0.05 * rng.standard_normal(len(t))
+    return np.stack([left, right][:channels]).astype(np.float32)
+
+def _band_levels(y):
+    """Mean spectrum in octave bands from 31.5 Hz to 16 kHz, in dB."""
+    spectrum = np.abs(np.fft.rfft(np.mean(y, axis=0)))
+    freqs = np.fft.rfftfreq(y.shape[-1], 1 / SR)
+    edges = 31.5 * 2 ** np.arange(0, 10)
+    return np.array([
+        20 * np.log10(np.mean(spectrum[(freqs >= lo) & (freqs < hi)]) + 1e-9)
+        for lo, hi in zip(edges[:-1], edges[1:])
+    ])
+
+def _level_db(y):
+    return 20 * np.log10(np.sqrt(np.mean(y ** 2)) + 1e-9)
+
+def test_gain_scales_signal():
+    y = _signal()
+    out = numpy_effects.gain(y, SR, db=-6)
+    assert np.allclose(out, y * 10 ** (-6 / 20), atol=1e-6)
+
+def test_lowpass_attenuates_high_frequencies():
+    t = np.arange(SR) / SR
+    low = np.sin(2 * np.pi * 200 * t)[None, :]
+    high = np.sin(2 * np.pi * 12000 * t)[None, :]
+    assert _level_db(numpy_effects.lowpass(low, SR, cutoff=3500)) > _level_db(low) - 0.5
+    assert _level_db(numpy_effects.lowpass(high, SR, cutoff=3500)) < _level_db(high) - 20
+
+def test_bass_boost_raises_low_end_only():
+    t = np.arange(SR) / SR
+    low = np.sin(2 * np.pi * 20 * t)[None, :]
+    high = np.sin(2 * np.pi * 5000 * t)[None, :]
+    assert _level_db(numpy_effects.bass_boost(low, SR, gain=8)) == pytest.approx(_level_db(low) + 8, abs=1.0)
+    assert _level_db(numpy_effects.bass_boost(high, SR, gain=8)) == pytest.approx(_level_db(high), abs=0.5)
+
+def test_speed_changes_length():
+    y = _signal(seconds=1.0)
+    out = numpy_effects.speed(y, SR, ratio=0.75)
+    assert out.shape[0] == 2
+    assert out.shape[1] == pytest.approx(SR / 0.75, rel=0.01)
+
+def test_oops_outputs_side_signal():
+    y = _signal()
+    out = numpy_effects.oops(y, SR)
+    assert np.allclose(out[0], y[0] - y[1])
+    assert np.allclose(out[1], y[0] - y[1])
+
+def test_tremolo_depth():
+    y = np.ones((1, SR), dtype=np.float32)
+    out = numpy_effects.tremolo(y, SR, freq=5, depth=50)
+    assert out.max() == pytest.approx(1.0, abs=1e-3)
+    assert out.min() == pytest.approx(0.5, abs=1e-3)
+
+def test_apply_chain_keeps_shape_and_dtype():
+    y = _signal()
+    chain = [('bass_boost', {'gain': 4}), ('phaser', {}), ('compand', {}), ('lowpass', {'cutoff': 4000}), ('reverb', {})]
+    out = numpy_effects.apply_chain(y, SR, chain)
+    assert out.shape == y.shape
+    assert out.dtype == np.float32
+    assert np.all(np.isfinite(out))
+
+def test_apply_chain_unknown_effect():
+    with pytest.raises(ValueError):
+        numpy_effects.apply_chain(_signal(), SR, [('flanger', {})])
+
+def test_process_audio_numpy_backend_writes_once(tmp_path, mocker):
+    """The numpy backend never calls SoX and encodes the output exactly once."""
+    input_path = str(tmp_path / 'in.wav')
+    output_path = str(tmp_path / 'out.wav')
+    sf.write(input_path, _signal(seconds=3.0).T, SR)
+    mock_apply_fx = mocker.patch('effects._apply_fx')
+    mock_write = mocker.spy(numpy_effects.sf, 'write')
+
+    process_audio(input_path, output_path, {'preset': 'nightcore', 'backend': 'numpy'})
+
+    mock_apply_fx.assert_not_called()
+    assert mock_write.call_count == 1
+    out, sr = sf.read(output_path, always_2d=True)
+    assert sr == numpy_effects.OUTPUT_SAMPLE_RATE
+    assert out.shape[0] == pytest.approx(3.0 * SR / 1.25, rel=0.01)
+    assert sorted(os.listdir(tmp_path)) == ['in.wav', 'out.wav']
+
+@pytest.mark.skipif(shutil.which('sox') is None, reason="SoX is not installed")
+@pytest.mark.parametrize('effect_name', sorted(TOLERANCES))
+def test_matches_sox_within_tolerance(tmp_path, effect_name):
+    y = _signal()
+    params = PARAMS.get(effect_name, {})
+    input_path = str(tmp_path / 'in.wav')
+    sox_path = str(tmp_path / 'sox.wav')
+    sf.write(input_path, y.T, SR, subtype='FLOAT')
+    getattr(effects, f"apply_{effect_name}")(input_path, sox_path, **params)
+    expected, _ = sf.read(sox_path, always_2d=True, dtype='float32')
+    expected = expected.T
+
+    actual = numpy_effects.apply_chain(y, SR, [(effect_name, params)])
+
+    tolerance = TOLERANCES[effect_name]
+    assert actual.shape[-1] == pytest.approx(expected.shape[-1], rel=0.01)
+    assert abs(_level_db(actual) - _level_db(expected)) <= tolerance['level_db']
+    assert np.max(np.abs(_band_levels(actual) - _band_levels(expected))) <= tolerance['band_db']
+
+def test_streaming_chain_matches_one_pass_for_stateful_effects():
+    """Filter, tremolo, phaser, compand and reverb state carries across block boundaries exactly."""
+    y = _signal(seconds=3.0)
+    chain = [('bass_boost', {'gain': 5}), ('tremolo', {'freq': 500, 'depth': 50}), ('phaser', {}),
+             ('compand', {}), ('lowpass', {'cutoff': 3500}), ('reverb', {})]
+    expected = numpy_effects.apply_chain(y, SR, chain)
+
+    stream = numpy_effects.StreamingChain(chain, SR, 2)
+    blocks = [stream.process(y[:, i:i + 30001]) for i in range(0, y.shape[-1], 30001)]
+    actual = np.concatenate(blocks + [stream.flush()], axis=-1)
+
+    assert np.allclose(actual, expected, atol=1e-5)
+
+def test_streaming_chain_pitch_and_speed_keep_length_and_level():
+    y = _signal(seconds=3.0)
+    chain = [('pitch_shift', {'shift': -75}), ('speed', {'ratio': 0.75})]
+    expected = numpy_effects.apply_chain(y, SR, chain)
+
+    stream = numpy_effects.StreamingChain(chain, SR, 2)
+    blocks = [stream.process(y[:, i:i + SR]) for i in range(0, y.shape[-1], SR)]
+    actual = np.concatenate(blocks + [stream.flush()], axis=-1)
+
+    assert actual.shape == expected.shape
+    assert abs(_level_db(actual) - _level_db(expected)) < 0.5
+
+def test_process_audio_streaming_writes_progressively(tmp_path, mocker):
+    input_path = str(tmp_path / 'in.wav')
+    output_path = str(tmp_path / 'out.wav')
+    y = _signal(seconds=2.5)
+    sf.write(input_path, y.T, 22050) # 5 seconds at half the rate, so the output is resampled too
+    write_spy = mocker.spy(sf.SoundFile, 'write')
+
+    numpy_effects.process_file_streaming(input_path, output_path, [('gain', {'db': -3}), ('reverb', {})], block_seconds=1)
+
+    assert write_spy.call_count >= 5
+    out, sr = sf.read(output_path, always_2d=True)
+    assert sr == numpy_effects.OUTPUT_SAMPLE_RATE
+    assert out.shape == (pytest.approx(5.0 * SR, abs=2), 2)
+
+def test_process_audio_streaming_downsamples_above_max_sample_rate(tmp_path):
+    """A downsampled streaming job drops content above the capped rate's Nyquist frequency."""
+    input_path = str(tmp_path / 'in.wav')
+    output_path = str(tmp_path / 'out.wav')
+    t = np.arange(2 * 48000) / 48000
+    y = 0.3 * np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 15000 * t)]).astype(np.float32)
+    sf.write(input_path, y.T, 48000)
+
+    numpy_effects.process_file_streaming(
+        input_path, output_path, [('gain', {'db': -3})], block_seconds=0.5, max_sample_rate=22050
+    )
+
+    out, sr = sf.read(output_path, always_2d=True)
+    assert sr == numpy_effects.OUTPUT_SAMPLE_RATE
+    assert out.shape[0] == pytest.approx(2.0 * SR, abs=64)
+    assert _level_db(out[:, 0]) > -20
+    assert _level_db(out[:, 1]) < -60
+
+def test_process_audio_streaming_mode(tmp_path, mocker):
+    """
+    Presets without loop detection stream; loop presets render the loop as
+    usual. The SoX backend ignores streaming and keeps its own DSP.
+    """
+    input_path = str(tmp_path / 'in.wav')
+    sf.write(input_path, _signal(seconds=3.0).T, SR)
+    mock_stream = mocker.patch('audio_processor.numpy_effects.process_file_streaming', side_effect=lambda i, o, *a, **k: o)
+    mock_apply_fx = mocker.patch('effects._apply_fx')
+
+    process_audio(input_path, str(tmp_path / 'a.wav'), {
+        'preset': 'chopped_and_screwed', 'backend': 'numpy', 'streaming': True, 'max_sample_rate': 22050
+    })
+    assert mock_stream.call_count == 1
+    assert mock_stream.call_args.kwargs['max_sample_rate'] == 22050
+
+    process_audio(input_path, str(tmp_path / 'b.wav'), {'preset': 'slushwave', 'backend': 'numpy', 'streaming': True})
+    assert mock_stream.call_count == 1
+    assert os.path.exists(tmp_path / 'b.wav')
+
+    process_audio(input_path, str(tmp_path / 'c.wav'), {'preset': 'chopped_and_screwed', 'streaming': True})
+    assert mock_stream.call_count == 1
+    assert mock_apply_fx.call_count == 1
+
+def test_process_audio_streaming_falls_back_for_unreadable_formats(tmp_path, mocker):
+    """Containers libsndfile can't read (m4a, webm) are rendered in memory instead."""
+    mock_stream = mocker.patch('audio_processor.numpy_effects.process_file_streaming')
+    mocker.patch('audio_processor._sample_rate', return_value=0)
+    mocker.patch('audio_processor.librosa.load', return_value=(_signal(seconds=1.0), SR))
+    output_path = str(tmp_path / 'out.wav')
+
+    process_audio(str(tmp_path / 'in.m4a'), output_path, {'preset': 'chopped_and_screwed', 'backend': 'numpy', 'streaming': True})
+
+    mock_stream.assert_not_called()
+    assert os.path.exists(output_path)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+import output_formats
+
+def test_normalize():
+    assert output_formats.normalize('FLAC, mp3:128,opus') == ['flac', 'mp3:128', 'opus:96']
+    assert output_formats.normalize(['wav']) == ['wav']
+
+@pytest.mark.parametrize('specs, message', [
+    ('aac', 'Unknown output format'),
+    ('flac:320', 'lossless'),
+    ('mp3:fast', 'Invalid bitrate'),
+    ('mp3:128,mp3:320', 'more than once'),
+    (' , ', 'No output formats'),
+])
+def test_normalize_rejects(specs, message):
+    with pytest.raises(ValueError, match=message):
+        output_formats.normalize(specs)
+
+def test_encode_all_from_one_buffer(tmp_path):
+    sr = 44100
+    t = np.arange(sr * 2) / sr
+    y = np.stack([0.3 * np.sin(2 * np.pi * 440 * t), 0.3 * np.sin(2 * np.pi * 660 * t)])
+    specs = ['wav', 'flac', 'mp3:128', 'opus:64']
+    targets = [(spec, str(tmp_path / f"out{output_formats.extension(spec)}")) for spec in specs]
+    finished = []
+
+    results = output_formats.encode_all((y, sr), targets, on_done=lambda result: finished.append(result['format']))
+
+    assert [result['format'] for result in results] == specs
+    assert sorted(finished) == sorted(specs)
+    for result, (_spec, path) in zip(results, targets):
+        assert result['path'] == path and result['bytes'] > 0 and result['seconds'] >= 0
+    assert sf.info(targets[3][1]).samplerate == 48000
+    # Roughly the requested bitrates (container overhead aside).
+    assert 110 < results[2]['bytes'] * 8 / 2 / 1000 < 150
+    assert 50 < results[3]['bytes'] * 8 / 2 / 1000 < 80
+    np.testing.assert_allclose(sf.read(targets[1][1])[0].T, y, atol=1e-4)
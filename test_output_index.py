@@ -0,0 +1,23 @@
+import output_index
+
+def test_record_and_get(tmp_path):
+    path = tmp_path / 'job.wav'
+    path.write_bytes(b'abcd')
+    output_index.record('job', str(path), {'preset': 'lofi', 'speed': 0.9}, created_at=100)
+
+    assert output_index.get('job') == {
+        'task_id': 'job', 'path': str(path), 'size': 4, 'created_at': 100, 'options': {'preset': 'lofi', 'speed': 0.9}
+    }
+    assert output_index.get('other') is None
+
+def test_sweep_removes_expired_files_and_rows(tmp_path):
+    for name, created_at in (('a', 10), ('b', 20), ('c', 30)):
+        (tmp_path / f'{name}.wav').write_bytes(b'x')
+        output_index.record(name, str(tmp_path / f'{name}.wav'), created_at=created_at)
+    # Already gone from disk: the row is still dropped.
+    output_index.record('gone', str(tmp_path / 'gone.wav'), created_at=5)
+
+    assert output_index.sweep(before=25) == 3
+
+    assert sorted(p.name for p in tmp_path.glob('*.wav')) == ['c.wav']
+    assert [output_index.get(name) is None for name in ('a', 'b', 'c', 'gone')] == [True, True, False, True]
@@ -0,0 +1,94 @@
+import json
+import os
+
+import pytest
+
+import preset_registry
+
+PRESETS = {
+    'slow': {'description': 'Slowed.', 'speed_ratio': 0.8, 'no_reverb': True, 'loop_detection': {'enabled': False}},
+    'bright': {'description': 'Boosted.', 'bass_boost': 4, 'no_reverb': True},
+}
+
+@pytest.fixture
+def presets_file(tmp_path, monkeypatch):
+    """A presets file the registry watches without delay; the registry's state is restored afterwards."""
+    path = tmp_path / 'presets.json'
+    path.write_text(json.dumps(PRESETS))
+    monkeypatch.setenv('PRESETS_PATH', str(path))
+    monkeypatch.setenv('PRESETS_RELOAD_SECONDS', '0')
+    for name, value in (('_presets', {}), ('_signature', None), ('_checked_at', None), ('_plans', {})):
+        monkeypatch.setattr(preset_registry, name, value)
+    return path
+
+def _rewrite(path, presets):
+    path.write_text(json.dumps(presets))
+    # Same-size rewrites within the file system's timestamp granularity would look unchanged.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def test_plan_merges_preset_and_overrides(presets_file):
+    plan = preset_registry.compile_plan({'preset': 'slow', 'gain_db': 3})
+
+    assert plan.resolved() == {**PRESETS['slow'], 'preset': 'slow', 'gain_db': 3}
+    assert plan.effect_chain() == [('gain', {'db': 3}), ('speed', {'ratio': 0.8})]
+
+def test_plans_are_memoized_and_immutable(presets_file):
+    plan = preset_registry.compile_plan({'preset': 'slow'})
+
+    assert preset_registry.compile_plan({'preset': 'slow'}) is plan
+    assert preset_registry.compile_plan({'preset': 'slow', 'gain_db': 3}) is not plan
+    assert hash(plan) == hash(preset_registry.ChainPlan({**PRESETS['slow'], 'preset': 'slow'}))
+    with pytest.raises(TypeError):
+        plan.options['speed_ratio'] = 2
+    # Callers get copies, so changing them leaves the plan alone.
+    plan.resolved()['loop_detection']['enabled'] = True
+    plan.effect_chain()[0][1]['ratio'] = 2
+    assert plan.options['loop_detection'] == {'enabled': False}
+    assert plan.chain[0][1]['ratio'] == 0.8
+
+def test_edited_file_is_reloaded(presets_file):
+    assert preset_registry.compile_plan({'preset': 'bright'}).effect_chain() == [('bass_boost', {'gain': 4})]
+
+    _rewrite(presets_file, {**PRESETS, 'bright': {**PRESETS['bright'], 'bass_boost': 9}})
+
+    assert preset_registry.compile_plan({'preset': 'bright'}).effect_chain() == [('bass_boost', {'gain': 9})]
+
+def test_reload_waits_for_the_check_interval(presets_file, monkeypatch):
+    preset_registry.get_presets()
+    monkeypatch.setenv('PRESETS_RELOAD_SECONDS', '3600')
+
+    _rewrite(presets_file, {'other': {'description': 'Other.'}})
+
+    assert set(preset_registry.get_presets()) == {'slow', 'bright'}
+    assert set(preset_registry.reload()) == {'other'}
+
+def test_invalid_preset_keeps_its_previous_definition(presets_file, capsys):
+    preset_registry.get_presets()
+
+    _rewrite(presets_file, {
+        'slow': {**PRESETS['slow'], 'speed_ratio': 'fast'},
+        'bright': {**PRESETS['bright'], 'reverb_amount': 3},
+        'new': {'speed_ratio': 0.5},
+    })
+
+    presets = preset_registry.get_presets()
+    assert presets == PRESETS
+    output = capsys.readouterr().out
+    assert "invalid speed_ratio" in output
+    assert "unknown setting: reverb_amount" in output
+    assert "Preset new has no description" in output
+
+def test_unreadable_file_keeps_the_current_presets(presets_file):
+    preset_registry.get_presets()
+
+    presets_file.write_text('{"slow": ')
+
+    assert set(preset_registry.reload(force=True)) == {'slow', 'bright'}
+
+def test_shipped_presets_are_valid():
+    with open(preset_registry.DEFAULT_PRESETS_PATH) as f:
+        presets = json.load(f)
+
+    for name, preset in presets.items():
+        preset_registry.validate(name, preset)
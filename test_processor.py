@@ -5,7 +5,14 @@ import numpy as np
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from audio_processor import analyze_audio, find_and_extract_loop, process_audio
+from audio_processor import analyze_audio, analyze_signal, find_and_extract_loop, process_audio, build_effect_chain
+from audio_processor import find_loop_bounds, find_loop_bounds_streaming
+import librosa
+import soundfile as sf
+import threading
+import tracemalloc
+import audio_processor
+import spans
 
 
 def test_analyze_audio(mocker):
@@ -65,6 +72,85 @@ def test_find_and_extract_loop(mocker):
     assert written_sr == sr
     assert np.max(written_data) == 1.0
 
+def test_analyze_audio_reuses_decoded_buffer(mocker):
+    """With a decoded buffer, analysis neither loads the file nor recomputes the STFT per feature."""
+    mock_load = mocker.patch('audio_processor.librosa.load')
+    stft_spy = mocker.spy(sys.modules['audio_processor'].librosa, 'stft')
+    sr = 22050
+    t = np.arange(sr * 5) / sr
+    y = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 440 * t)]).astype(np.float32)
+
+    result = analyze_audio('dummy_path.mp3', audio=(y, sr))
+
+    mock_load.assert_not_called()
+    assert stft_spy.call_count == 1
+    assert result['key'] == 'A'
+    assert result == analyze_signal(y[0], sr)
+
+def test_find_and_extract_loop_reuses_decoded_buffer(mocker):
+    """A decoded (stereo) buffer is downmixed and used without loading the file again."""
+    mock_load = mocker.patch('audio_processor.librosa.load')
+    mock_write = mocker.patch('audio_processor.sf.write')
+    sr = 22050
+    y = np.zeros((2, sr * 40))
+    y[:, sr * 35 : sr * 36] = 1.0
+
+    find_and_extract_loop('dummy_path.mp3', '/tmp', duration_seconds=5, audio=(y, sr))
+
+    mock_load.assert_not_called()
+    _path, written_data, _sr = mock_write.call_args[0]
+    assert written_data.ndim == 1
+    assert np.max(written_data) == 1.0
+
+@pytest.mark.parametrize('sr, seconds, channels, duration_seconds', [
+    (22050, 100, 2, 10),     # stereo, long enough to search after 30 s
+    (44100, 50, 1, 7.00003), # odd frame length
+    (8000, 20, 1, 5),        # shorter than 30 s: searches the whole track
+])
+def test_streaming_loop_bounds_match_in_memory(tmp_path, sr, seconds, channels, duration_seconds):
+    """The streaming scan selects exactly the same window as the in-memory one."""
+    rng = np.random.default_rng(seconds)
+    envelope = np.repeat(rng.random(seconds + 1), sr)[:sr * seconds, None]
+    y = (0.3 * rng.standard_normal((sr * seconds, channels)) * envelope).astype(np.float32)
+    path = str(tmp_path / 'track.wav')
+    sf.write(path, y, sr, subtype='FLOAT')
+
+    mono, _ = librosa.load(path, sr=None)
+    expected = find_loop_bounds(mono, sr, duration_seconds)
+
+    assert find_loop_bounds_streaming(path, duration_seconds, blocksize=10007) == (*expected, sr)
+
+def test_streaming_loop_detection_memory_is_bounded(tmp_path):
+    """Peak memory depends on the block and loop size, not the track length."""
+    sr = 44100
+    path = str(tmp_path / 'long.wav')
+    with sf.SoundFile(path, 'w', sr, 2, subtype='PCM_16') as f:
+        for _ in range(120):
+            f.write(np.full((sr, 2), 0.1, dtype=np.float32))
+
+    tracemalloc.start()
+    loop_path = find_and_extract_loop(path, str(tmp_path), duration_seconds=2)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert loop_path != path
+    # Decoding the whole track would take ~42 MB as float32.
+    assert peak < 8 * 1024 * 1024
+
+def test_process_audio_decodes_input_once(mocker):
+    """Style transfer and loop detection share a single decode of the input."""
+    sr = 22050
+    mock_load = mocker.patch('audio_processor.librosa.load', return_value=(np.zeros(sr * 40, dtype=np.float32), sr))
+    mock_analyze = mocker.patch('audio_processor.analyze_audio', return_value={'tempo': 100, 'brightness': 1000, 'avg_loudness': 0.5})
+    mock_loop = mocker.patch('audio_processor.extract_loop', return_value=None)
+    mocker.patch('effects._apply_fx')
+
+    process_audio('target.mp3', 'output.mp3', options={'preset': 'slushwave'}, reference_path='ref.mp3')
+
+    mock_load.assert_called_once_with('target.mp3', sr=None, mono=True)
+    decoded = next(call[1]['audio'] for call in mock_analyze.call_args_list if call[0][0] == 'target.mp3')
+    assert mock_loop.call_args[1]['audio'] is decoded
+
 def test_process_audio_with_style_transfer(mocker):
     """
     Tests that process_audio correctly calculates and applies effects
@@ -73,7 +159,11 @@ def test_process_audio_with_style_transfer(mocker):
     # 1. Mock the analysis function to return different fingerprints
     target_analysis = {'tempo': 100, 'brightness': 1000, 'avg_loudness': 0.5}
     ref_analysis = {'tempo': 150, 'brightness': 3000, 'avg_loudness': 0.25}
-    mocker.patch('audio_processor.analyze_audio', side_effect=[target_analysis, ref_analysis])
+    # The two analyses may run in either order (see analysis_pool.py).
+    mocker.patch(
+        'audio_processor.analyze_audio',
+        side_effect=lambda path, **kwargs: target_analysis if path == 'target.mp3' else ref_analysis
+    )
 
     # 2. Mock the _apply_fx helper to prevent any SoX calls
     mock_apply_fx = mocker.patch('effects._apply_fx')
@@ -82,15 +172,118 @@ def test_process_audio_with_style_transfer(mocker):
     options = {'preset': 'slushwave'}
     process_audio('target.mp3', 'output.mp3', options=options, reference_path='ref.mp3')
 
-    # 4. Assert that the helper was called for each effect in the chain
-    # The slushwave preset has several effects. Let's check a few key ones.
-
-    # The test can't easily know the intermediate filenames.
-    # A better assertion is to check the *number* of calls to the helper.
+    # 4. The whole chain is fused into a single SoX invocation.
     # The 'slushwave' preset has: speed, pitch, lowpass, phaser, compand, reverb.
-    # And the style transfer adds: gain. So 7 effects.
-    assert mock_apply_fx.call_count == 7
+    # And the style transfer adds: gain. So 7 effects in one call.
+    assert mock_apply_fx.call_count == 1
+    infile, outfile, fx_chain = mock_apply_fx.call_args[0]
+    assert outfile == 'output.mp3'
+    assert [cmd for cmd in fx_chain.command if cmd in ('speed', 'pitch', 'lowpass', 'phaser', 'gain', 'compand', 'reverb')] == \
+        ['pitch', 'phaser', 'gain', 'compand', 'speed', 'lowpass', 'reverb']
+
+def test_style_transfer_analyses_and_loop_detection_run_concurrently(mocker, monkeypatch):
+    """Each of the three waits for the others, so this only finishes if they run side by side."""
+    monkeypatch.setenv('ANALYSIS_POOL_SIZE', '3')
+    barrier = threading.Barrier(3, timeout=5)
+    def analyze(path, **kwargs):
+        barrier.wait()
+        return {'tempo': 100, 'brightness': 1000, 'avg_loudness': 0.5}
+    def extract_loop(*args, **kwargs):
+        barrier.wait()
+        return np.zeros(100, dtype=np.float32), 22050
+    mocker.patch('audio_processor.decode_audio', return_value=(np.zeros(22050, dtype=np.float32), 22050))
+    mocker.patch('audio_processor.analyze_audio', side_effect=analyze)
+    mocker.patch('audio_processor.extract_loop', side_effect=extract_loop)
+    mock_apply_fx = mocker.patch('effects._apply_fx')
+
+    with spans.collect() as stages:
+        process_audio('target.mp3', 'output.mp3', options={'preset': 'slushwave'}, reference_path='ref.mp3')
+
+    assert sorted(
+        (span['stage'], span.get('track')) for span in stages if span['parent'] == 'style_analysis'
+    ) == [('analysis', 'reference'), ('analysis', 'target'), ('loop', None)]
+    # The prefetched loop is what the effects run on.
+    assert isinstance(mock_apply_fx.call_args[0][0], tuple)
 
-    # We can inspect the last call to see if it wrote to the final output file
+def test_process_audio_falls_back_to_per_effect_chain(mocker):
+    """
+    Tests that a failing fused chain falls back to one SoX call per effect.
+    """
+    mocker.patch('audio_processor.effects.apply_chain', side_effect=RuntimeError("boom"))
+    mock_apply_fx = mocker.patch('effects._apply_fx')
+
+    options = {'preset': 'nightcore'}
+    process_audio('target.mp3', 'output.mp3', options=options)
+
+    # nightcore: bass_boost, pitch_shift, speed.
+    assert mock_apply_fx.call_count == 3
     final_call_args = mock_apply_fx.call_args_list[-1]
     assert final_call_args[0][1] == 'output.mp3' # outfile is the second argument
+
+def test_process_audio_downsamples_before_effects(mocker):
+    """max_sample_rate puts a SoX rate change in front of the chain for higher-rate inputs."""
+    mocker.patch('audio_processor._sample_rate', return_value=48000)
+    mock_apply_chain = mocker.patch('audio_processor.effects.apply_chain')
+
+    process_audio('target.wav', 'output.mp3', options={'preset': 'nightcore', 'max_sample_rate': 22050})
+
+    chain = mock_apply_chain.call_args[0][2]
+    assert chain[0] == ('rate', {'sample_rate': 22050})
+    assert [name for name, _ in chain[1:]] == ['bass_boost', 'pitch_shift', 'speed']
+    # The output keeps the reduced rate instead of being resampled back up.
+    assert mock_apply_chain.call_args[1] == {'output_rate': 22050}
+
+def test_downsampled_fallback_keeps_the_reduced_rate(mocker):
+    mocker.patch('audio_processor._sample_rate', return_value=48000)
+    mocker.patch('audio_processor.effects.apply_chain', side_effect=RuntimeError("boom"))
+    mock_apply_fx = mocker.patch('effects._apply_fx')
+
+    process_audio('target.wav', 'output.mp3', options={'preset': 'nightcore', 'max_sample_rate': 22050})
+
+    # rate, bass_boost, pitch_shift, speed.
+    assert mock_apply_fx.call_count == 4
+    assert all(call[1] == {'output_rate': 22050} for call in mock_apply_fx.call_args_list)
+
+def test_preview_renders_first_seconds_mono_at_reduced_rate(tmp_path):
+    input_path = str(tmp_path / 'in.wav')
+    sf.write(input_path, np.random.default_rng(0).uniform(-0.5, 0.5, (44100 * 30, 2)), 44100)
+    output_path = str(tmp_path / 'out.wav')
+
+    process_audio(
+        input_path, output_path, options={'backend': 'numpy', 'no_reverb': True, 'preview': True, 'preview_seconds': 2}
+    )
+
+    info = sf.info(output_path)
+    assert (info.samplerate, info.channels, info.frames) == (22050, 1, 44100)
+
+def test_full_render_reuses_preview_loop_window(tmp_path, monkeypatch, mocker):
+    """The preview's loop detection is stored under the content hash; the full render only reads the window."""
+    monkeypatch.setenv('ANALYSIS_DB_PATH', str(tmp_path / 'analysis.sqlite3'))
+    input_path = str(tmp_path / 'in.wav')
+    sf.write(input_path, np.random.default_rng(0).uniform(-0.5, 0.5, (44100 * 40, 2)), 44100)
+    mock_apply_chain = mocker.patch('audio_processor.effects.apply_chain')
+
+    process_audio(input_path, 'preview.wav', options={'preset': 'slushwave', 'preview': True}, content_hash='abc')
+    y, sr = mock_apply_chain.call_args[0][0]
+    assert (sr, y.ndim, len(y)) == (22050, 1, 22050 * 10)
+    # SoX writes the preview at its reduced rate too.
+    assert mock_apply_chain.call_args[1] == {'output_rate': 22050}
+
+    mock_scan = mocker.spy(audio_processor, 'find_loop_bounds_streaming')
+    process_audio(input_path, 'full.wav', options={'preset': 'slushwave'}, content_hash='abc')
+    mock_scan.assert_not_called()
+    y, sr = mock_apply_chain.call_args[0][0]
+    assert (sr, len(y)) == (44100, 44100 * 10)
+
+def test_build_effect_chain_order():
+    """Tests that resolved options compile to the expected ordered chain."""
+    options = {'bass_boost': 4, 'pitch_shift': -50, 'compand': True, 'speed_ratio': 0.85,
+               'lowpass_cutoff': 4000, 'no_reverb': True}
+    chain = build_effect_chain(options)
+    assert chain == [
+        ('bass_boost', {'gain': 4}),
+        ('pitch_shift', {'shift': -50}),
+        ('compand', {}),
+        ('speed', {'ratio': 0.85}),
+        ('lowpass', {'cutoff': 4000}),
+    ]
@@ -0,0 +1,59 @@
+import pytest
+import os
+
+# Add parent dir to path to allow import of result_cache
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import result_cache
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+def test_make_key_depends_on_every_input():
+    options = {'preset': 'slushwave', 'speed_ratio': 0.75}
+    key = result_cache.make_key('abc', options, 'sox-1', output_ext='.mp3')
+    assert key == result_cache.make_key('abc', dict(options), 'sox-1', output_ext='.MP3')
+    assert key != result_cache.make_key('abd', options, 'sox-1', output_ext='.mp3')
+    assert key != result_cache.make_key('abc', {**options, 'speed_ratio': 0.8}, 'sox-1', output_ext='.mp3')
+    assert key != result_cache.make_key('abc', options, 'numpy-1', output_ext='.mp3')
+    assert key != result_cache.make_key('abc', options, 'sox-1', reference_hash='ref', output_ext='.mp3')
+
+def test_store_then_lookup(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    result = _write(tmp_path / 'result.mp3', b'audio')
+    assert result_cache.store('key1', '.mp3', result, cache_dir=cache_dir)
+
+    output_path = str(tmp_path / 'new_task.mp3')
+    assert result_cache.lookup('key1', '.mp3', output_path, cache_dir=cache_dir) == output_path
+    with open(output_path, 'rb') as f:
+        assert f.read() == b'audio'
+
+    assert result_cache.lookup('missing', '.mp3', str(tmp_path / 'x.mp3'), cache_dir=cache_dir) is None
+
+def test_lookup_ignores_expired_entries(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    result_cache.store('key1', '.wav', _write(tmp_path / 'r.wav', b'x'), cache_dir=cache_dir)
+    later = os.path.getmtime(os.path.join(cache_dir, 'key1.wav')) + result_cache.CACHE_TTL_SECONDS + 1
+    assert result_cache.lookup('key1', '.wav', str(tmp_path / 'o.wav'), cache_dir=cache_dir, now=later) is None
+
+def test_evict_removes_expired_then_least_recently_used(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    for name, mtime in (('old.wav', 100), ('lru.wav', 1000), ('mru.wav', 2000)):
+        path = _write(cache_dir / name, b'0123456789')
+        os.utime(path, (mtime, mtime))
+
+    removed = result_cache.evict(cache_dir=str(cache_dir), now=2000, max_bytes=10, ttl_seconds=1500)
+
+    assert removed == 2
+    assert os.listdir(cache_dir) == ['mru.wav']
+
+def test_cached_result_survives_output_cleanup(tmp_path):
+    """Deleting the served output (as cleanup_old_files does) leaves the cache entry intact."""
+    cache_dir = str(tmp_path / 'cache')
+    result_cache.store('key1', '.wav', _write(tmp_path / 'r.wav', b'x'), cache_dir=cache_dir)
+    output_path = result_cache.lookup('key1', '.wav', str(tmp_path / 'o.wav'), cache_dir=cache_dir)
+    os.remove(output_path)
+    assert os.path.exists(os.path.join(cache_dir, 'key1.wav'))
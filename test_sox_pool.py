@@ -0,0 +1,81 @@
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+from unittest.mock import MagicMock
+
+import sox_pool
+
+def _fake_popen(mocker, stdout=b'', stderr=b'', returncode=0):
+    proc = MagicMock(returncode=returncode)
+    proc.communicate.return_value = (stdout, stderr)
+    return mocker.patch('sox_pool.subprocess.Popen', return_value=proc)
+
+def test_file_to_file_is_a_single_process(mocker, tmp_path):
+    """The channel count comes from soundfile, so there is no `sox --i` probe."""
+    infile = str(tmp_path / 'in.wav')
+    sf.write(infile, np.zeros((100, 2), dtype=np.float32), 22050)
+    mock_popen = _fake_popen(mocker)
+
+    with sox_pool.job_metrics() as metrics:
+        assert sox_pool.run(['bass 5', 'reverb'], infile, 'out.mp3') == 'out.mp3'
+
+    mock_popen.assert_called_once()
+    assert mock_popen.call_args[0][0] == [
+        'sox', '-N', '-V1', infile, '-r', '44100', '-c', '2', 'out.mp3', 'bass', '5', 'reverb'
+    ]
+    assert metrics['processes'] == 1
+
+def test_output_rate(mocker):
+    mock_popen = _fake_popen(mocker)
+
+    _result, sr = sox_pool.run(['rate 22050'], (np.zeros(10, dtype=np.float32), 48000), output_rate=22050)
+
+    assert mock_popen.call_args[0][0][10:14] == ['-r', '22050', '-c', '1']
+    assert sr == 22050
+
+def test_lossless_output_is_float(mocker, tmp_path):
+    infile = str(tmp_path / 'in.wav')
+    sf.write(infile, np.zeros(100, dtype=np.float32), 44100)
+    mock_popen = _fake_popen(mocker)
+
+    sox_pool.run(['gain', '6'], infile, 'stage.wav', lossless=True)
+
+    assert mock_popen.call_args[0][0][4:12] == ['-r', '44100', '-c', '1', '-e', 'floating-point', '-b', '32']
+
+def test_buffers_are_piped_as_float32(mocker):
+    y = np.array([[0.1, 0.2, 0.3], [-0.1, -0.2, -0.3]], dtype=np.float32)
+    out = np.array([[0.5, -0.5], [0.25, -0.25]], dtype=np.float32)
+    mock_popen = _fake_popen(mocker, stdout=np.ascontiguousarray(out.T).tobytes())
+
+    result, sr = sox_pool.run(['gain', '-3'], (y, 22050))
+
+    cmd = mock_popen.call_args[0][0]
+    assert cmd[3:10] == ['-t', 'f32', '-r', '22050', '-c', '2', '-']
+    assert cmd[-4:] == ['f32', '-', 'gain', '-3']
+    stdin_bytes = mock_popen.return_value.communicate.call_args[0][0]
+    np.testing.assert_array_equal(np.frombuffer(stdin_bytes, dtype=np.float32), y.T.ravel())
+    np.testing.assert_array_equal(result, out)
+    assert sr == sox_pool.OUTPUT_SAMPLE_RATE
+
+def test_sox_errors_are_raised(mocker):
+    _fake_popen(mocker, stderr=b'sox FAIL formats: can\'t open input file', returncode=2)
+    with pytest.raises(RuntimeError, match="can't open input file"):
+        sox_pool.run([], (np.zeros(10, dtype=np.float32), 44100))
+
+def test_missing_sox(mocker):
+    mocker.patch('sox_pool.subprocess.Popen', side_effect=FileNotFoundError)
+    with pytest.raises(RuntimeError, match="SoX command not found"):
+        sox_pool.run([], (np.zeros(10, dtype=np.float32), 44100))
+
+def test_warm_starts_every_runner():
+    sox_pool.warm()
+    assert len(sox_pool._get_executor()._threads) == sox_pool.POOL_SIZE
+
+@pytest.mark.skipif(shutil.which('sox') is None, reason="SoX is not installed")
+def test_pipe_round_trip_with_sox():
+    y = (0.1 * np.sin(np.linspace(0, 100, 44100))).astype(np.float32)
+    result, sr = sox_pool.run([], (np.stack([y, -y]), 44100))
+    assert sr == 44100
+    np.testing.assert_allclose(result, np.stack([y, -y]), atol=1e-6)
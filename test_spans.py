@@ -0,0 +1,71 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import spans
+
+def test_spans_record_parents_and_resources():
+    with spans.collect() as stages:
+        with spans.span('render', preset='lofi'):
+            with spans.span('decode'):
+                buffer = np.ones(10 * 1024 ** 2)
+                del buffer
+
+    decode, render = stages
+    assert (decode['stage'], decode['parent']) == ('decode', 'render')
+    assert (render['stage'], render['parent'], render['preset']) == ('render', None, 'lofi')
+    assert render['wall_seconds'] >= decode['wall_seconds'] >= 0
+    assert render['cpu_seconds'] >= 0
+    # The outer span's peak includes the inner one's, though the mark was reset for it.
+    assert render['peak_rss_bytes'] >= decode['peak_rss_bytes'] >= 80 * 1024 ** 2
+
+def test_failed_span_is_recorded():
+    with spans.collect() as stages:
+        with pytest.raises(ValueError):
+            with spans.span('analysis'):
+                raise ValueError('bad audio')
+    assert stages[0]['stage'] == 'analysis'
+    assert stages[0]['failed'] is True
+
+def test_spans_outside_collect_are_not_kept():
+    with spans.collect() as stages:
+        pass
+    with spans.span('decode'):
+        pass
+    assert stages == []
+
+def test_spans_reach_the_collector_from_a_copied_context():
+    def analyze():
+        with spans.span('analysis'):
+            pass
+
+    with spans.collect() as stages:
+        with ThreadPoolExecutor(1) as executor:
+            executor.submit(contextvars.copy_context().run, analyze).result()
+    assert [span['stage'] for span in stages] == ['analysis']
+
+def test_concurrent_spans_are_all_recorded():
+    barrier = threading.Barrier(4, timeout=5)
+    def analyze(track):
+        with spans.span('analysis', track=track):
+            barrier.wait()
+
+    with spans.collect() as stages:
+        with ThreadPoolExecutor(4) as executor:
+            for future in [executor.submit(contextvars.copy_context().run, analyze, i) for i in range(4)]:
+                future.result()
+    assert sorted(span['track'] for span in stages) == [0, 1, 2, 3]
+    assert spans._open == []
+
+def test_traced_adds_stages_to_the_result():
+    @spans.traced('job')
+    def job(x):
+        with spans.span('step'):
+            return {'result': x}
+
+    result = job(1)
+    assert result['result'] == 1
+    assert [span['stage'] for span in result['stages']] == ['step', 'job']
@@ -0,0 +1,17 @@
+import sqlite_store
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)',)
+
+def test_execute_creates_the_schema_and_folder(tmp_path):
+    db_path = str(tmp_path / 'nested' / 'items.sqlite3')
+
+    assert sqlite_store.execute(db_path, SCHEMA, 'INSERT INTO items VALUES (?)', ('a',)) is True
+
+    assert sqlite_store.execute(db_path, SCHEMA, 'SELECT name FROM items', fetch=True) == [('a',)]
+
+def test_failures_are_logged_not_raised(tmp_path, capsys):
+    db_path = str(tmp_path / 'items.sqlite3')
+
+    assert sqlite_store.execute(db_path, SCHEMA, 'SELECT missing FROM items', fetch=True, name='Item store') == []
+    assert sqlite_store.execute(db_path, SCHEMA, 'INSERT INTO nowhere VALUES (1)') is False
+    assert "Item store failed: no such column: missing" in capsys.readouterr().out
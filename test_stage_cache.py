@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import audio_processor
+import stage_cache
+from audio_processor import adjust_audio, adjust_effect_chain, process_audio, render_chain
+
+@pytest.fixture(autouse=True)
+def stage_dir(tmp_path, monkeypatch):
+    stage_dir = str(tmp_path / 'stages')
+    monkeypatch.setattr(stage_cache, 'STAGE_DIR', stage_dir)
+    return stage_dir
+
+@pytest.fixture
+def track(tmp_path):
+    sr = 44100
+    t = np.arange(sr) / sr
+    path = str(tmp_path / 'in.wav')
+    sf.write(path, 0.3 * np.sin(2 * np.pi * 440 * t), sr)
+    return path
+
+OPTIONS = {'backend': 'numpy', 'bass_boost': 4, 'gain_db': -3, 'lowpass_cutoff': 4000, 'no_reverb': True}
+
+def test_prefix_key_depends_on_source_chain_and_backend():
+    chain = [('gain', {'db': -3})]
+    key = stage_cache.prefix_key('abc.wav', chain, 'numpy-1')
+    assert key == stage_cache.prefix_key('abc.wav', [['gain', {'db': -3}]], 'numpy-1')
+    assert key != stage_cache.prefix_key('def.wav', chain, 'numpy-1')
+    assert key != stage_cache.prefix_key('abc.wav', [('gain', {'db': -2})], 'numpy-1')
+    assert key != stage_cache.prefix_key('abc.wav', chain, 'sox-1')
+
+def test_load_session_needs_its_source(track):
+    source = stage_cache.store_source(track)
+    stage_cache.save_session('job', source, [('gain', {'db': 1})], 'numpy', 'numpy-1')
+    assert stage_cache.load_session('job')['chain'] == [['gain', {'db': 1}]]
+    assert stage_cache.load_session('other') is None
+
+    stage_cache.evict(now=1e12)
+    assert stage_cache.load_session('job') is None
+
+def test_adjust_effect_chain():
+    chain = [('bass_boost', {'gain': 4}), ('lowpass', {'cutoff': 4000}), ('reverb', {})]
+    assert adjust_effect_chain(chain, 'lowpass', {'cutoff': 3000}) == (
+        [['bass_boost', {'gain': 4}], ['lowpass', {'cutoff': 3000}], ['reverb', {}]], 1
+    )
+    assert adjust_effect_chain(chain, 'gain', {'db': 2})[1] == 3
+    assert adjust_effect_chain(chain, 'gain', {'db': 2})[0][-1] == ['gain', {'db': 2}]
+    assert adjust_effect_chain(chain, 'lowpass', {'cutoff': 4000})[1] == 3
+
+def test_adjust_reruns_only_downstream_stages(track, tmp_path, mocker):
+    """Changing the lowpass re-renders from the cached stage output, not from the processed file."""
+    first = str(tmp_path / 'job.wav')
+    process_audio(track, first, dict(OPTIONS), session_id='job')
+
+    spy = mocker.spy(audio_processor, 'render_chain')
+    adjusted = str(tmp_path / 'adjusted.wav')
+    assert adjust_audio('job', adjusted, 'lowpass', {'cutoff': 2000}, new_file_id='adjusted') == adjusted
+
+    # Nothing upstream of the lowpass was cached yet, so that prefix is rendered once...
+    rendered = [call.args[2] for call in spy.call_args_list if call.args[2]]
+    assert rendered == [[['bass_boost', {'gain': 4}], ['gain', {'db': -3}]], [['lowpass', {'cutoff': 2000}]]]
+
+    # ...and the next tweak of the same effect starts right at the lowpass.
+    spy.reset_mock()
+    again = str(tmp_path / 'again.wav')
+    adjust_audio('adjusted', again, 'lowpass', {'cutoff': 1000}, new_file_id='again')
+    assert [call.args[2] for call in spy.call_args_list if call.args[2]] == [[['lowpass', {'cutoff': 1000}]]]
+
+    # The result matches rendering the changed chain from scratch, with no stacked effects.
+    expected = str(tmp_path / 'expected.wav')
+    render_chain(track, expected, [('bass_boost', {'gain': 4}), ('gain', {'db': -3}), ('lowpass', {'cutoff': 1000})], 'numpy')
+    np.testing.assert_allclose(sf.read(again)[0], sf.read(expected)[0], atol=1e-3)
+
+def test_adjust_appends_new_effect_to_cached_render(track, tmp_path, mocker):
+    process_audio(track, str(tmp_path / 'job.wav'), dict(OPTIONS), session_id='job')
+
+    spy = mocker.spy(audio_processor, 'render_chain')
+    adjust_audio('job', str(tmp_path / 'adjusted.wav'), 'tremolo', {'freq': 4, 'depth': 40}, new_file_id='adjusted')
+
+    # The first adjustment renders the original chain once, and keeps it.
+    assert [call.args[2] for call in spy.call_args_list if call.args[2]] == [
+        [['bass_boost', {'gain': 4}], ['gain', {'db': -3}], ['lowpass', {'cutoff': 4000}]],
+        [['tremolo', {'freq': 4, 'depth': 40}]],
+    ]
+    spy.reset_mock()
+    adjust_audio('adjusted', str(tmp_path / 'again.wav'), 'tremolo', {'freq': 6})
+    assert [call.args[2] for call in spy.call_args_list if call.args[2]] == [[['tremolo', {'freq': 6, 'depth': 40}]]]
+
+def test_stages_are_lossless_and_only_the_output_is_clipped(track, tmp_path, stage_dir):
+    """Stage outputs keep float samples above full scale at the working rate; the output is clipped 16-bit."""
+    sf.write(track, 0.3 * np.sin(2 * np.pi * 440 * np.arange(22050) / 22050), 22050)
+    options = {'backend': 'numpy', 'gain_db': 12, 'no_reverb': True}
+    process_audio(track, str(tmp_path / 'job.wav'), options, session_id='job')
+    adjusted = str(tmp_path / 'adjusted.wav')
+
+    adjust_audio('job', adjusted, 'lowpass', {'cutoff': 8000}, new_file_id='adjusted')
+
+    stages = [os.path.join(stage_dir, name) for name in os.listdir(stage_dir) if name.endswith('.wav')]
+    rendered = [path for path in stages if np.max(np.abs(sf.read(path)[0])) > 1.0]
+    assert rendered
+    for path in rendered:
+        assert sf.info(path).subtype == 'FLOAT'
+        assert sf.info(path).samplerate == 22050
+    assert sf.info(adjusted).subtype == 'PCM_16'
+    assert sf.info(adjusted).samplerate == 44100
+    assert np.max(np.abs(sf.read(adjusted)[0])) <= 1.0
+
+@pytest.mark.parametrize('options', [{'preset': 'nightcore'}, dict(OPTIONS)])
+def test_first_render_only_records_the_session(track, tmp_path, mocker, stage_dir, options):
+    """The first render is a single pass straight into the output; no stage output is rendered."""
+    import shutil
+    mock_chain = mocker.patch('audio_processor.effects.apply_chain', side_effect=lambda i, o, chain: shutil.copy(i, o))
+    spy = mocker.spy(audio_processor, 'render_incremental')
+    output = str(tmp_path / 'job.wav')
+
+    process_audio(track, output, options, session_id='job')
+
+    spy.assert_not_called()
+    if options.get('backend') != 'numpy':
+        (_in, out, chain), = [call.args for call in mock_chain.call_args_list]
+        assert out == output and [name for name, _ in chain] == ['bass_boost', 'pitch_shift', 'speed']
+    assert os.path.exists(output)
+    session = stage_cache.load_session('job')
+    assert session['backend'] == options.get('backend', 'sox')
+    # Only the source and the session file.
+    assert len(os.listdir(stage_dir)) == 2
+
+def test_adjust_without_session_returns_none(tmp_path):
+    assert adjust_audio('unknown', str(tmp_path / 'out.wav'), 'lowpass', {'cutoff': 2000}) is None
@@ -0,0 +1,31 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Generous for slow CI machines; a regression back to eager imports costs about a second.
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', 0.75))
+
+def _import(module, tmp_path):
+    """Imports module in a fresh interpreter; returns (import seconds, loaded module names)."""
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=tmp_path, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': REPO_DIR},
+    )
+    cumulative = re.search(rf"\|\s*(\d+) \| {module}$", result.stderr, re.MULTILINE)
+    return int(cumulative.group(1)) / 1e6, set(result.stdout.split())
+
+@pytest.mark.parametrize('module, deferred', [
+    # Of these the web process only needs soundfile, to check and estimate uploads; the first one loads it.
+    ('app', {'numpy_effects', 'scipy', 'numba', 'numpy', 'soundfile', 'soxr', 'librosa', 'pysndfx'}),
+    ('vaporiser', {'moviepy', 'skimage'}),
+])
+def test_import_defers_heavy_modules(module, deferred, tmp_path):
+    seconds, loaded = _import(module, tmp_path)
+    assert not deferred & loaded
+    assert seconds < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import output_index
+import storage
+
+def test_local_layout_is_sharded(tmp_path):
+    local = storage.LocalStorage(str(tmp_path))
+    location = local.location('job.mp3')
+
+    assert location == os.path.join(str(tmp_path), *storage.shard('job.mp3').split('/'))
+    assert [len(part) for part in storage.shard('job.mp3').split('/')[:2]] == [2, 2]
+    assert local.relative_path(location) == storage.shard('job.mp3')
+
+def test_local_save_moves_into_place(tmp_path):
+    local = storage.LocalStorage(str(tmp_path / 'outputs'))
+    rendered = tmp_path / 'render.wav'
+    rendered.write_bytes(b'abc')
+
+    location = local.save('job.wav', str(rendered))
+
+    assert location == local.location('job.wav') and not rendered.exists()
+    assert local.fetch(location) == location
+    # Rendering straight into writable_path() needs no move at all.
+    with open(local.writable_path('other.wav'), 'wb') as f:
+        f.write(b'x')
+    assert local.save('other.wav', local.writable_path('other.wav')) == local.location('other.wav')
+
+def test_full_scan_cleanup_walks_shards(tmp_path, mocker):
+    from tasks import _delete_unindexed_outputs
+    local = storage.LocalStorage(str(tmp_path))
+    for name in ('a.mp3', 'b.mp3'):
+        with open(local.writable_path(name), 'wb') as f:
+            f.write(b'x')
+    os.utime(local.location('a.mp3'), (0, 0))
+
+    assert _delete_unindexed_outputs(str(tmp_path), cutoff=1000) == 1
+    assert not os.path.exists(local.location('a.mp3')) and os.path.exists(local.location('b.mp3'))
+
+@pytest.fixture
+def s3(tmp_path):
+    moto = pytest.importorskip('moto')
+    import boto3
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='outputs')
+        yield storage.S3Storage('outputs', prefix='renders', client=client, scratch_dir=str(tmp_path / 'scratch'))
+
+def test_s3_round_trip(s3):
+    local_path = s3.writable_path('job.mp3')
+    with open(local_path, 'wb') as f:
+        f.write(b'abc')
+
+    location = output_index.store(s3, 'job', 'job.mp3', local_path)
+
+    assert location == f"s3://outputs/renders/{storage.shard('job.mp3')}"
+    assert not os.path.exists(local_path)
+    assert output_index.get('job')['size'] == 3
+    assert s3.exists(location)
+    fetched = s3.fetch(location)
+    with open(fetched, 'rb') as f:
+        assert f.read() == b'abc'
+    assert 'renders/' in s3.url(location)
+
+    assert output_index.sweep(before=1e12, delete=s3.delete) == 1
+    assert not s3.exists(location)
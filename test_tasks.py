@@ -5,9 +5,11 @@ from unittest.mock import MagicMock
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from tasks import adjust_task
+import output_index
+import spans
+from tasks import adjust_task, slushify_task, cleanup_old_files, route_task
 
-def test_adjust_task(mocker):
+def test_adjust_task(mocker, output_storage):
     """
     Tests the adjust_task to ensure it calls the correct effect function.
     """
@@ -25,7 +27,7 @@ def test_adjust_task(mocker):
     result = adjust_task(base_file, effect_name, effect_params, new_file_id)
 
     # 4. Assert that the correct effect function was called
-    expected_output_path = f'/path/to/{new_file_id}.mp3'
+    expected_output_path = output_storage.location(f'{new_file_id}.mp3')
     mock_effects_module.apply_reverb.assert_called_once_with(
         base_file,
         expected_output_path,
@@ -35,3 +37,200 @@ def test_adjust_task(mocker):
     # 5. Assert the task result
     assert result['status'] == 'SUCCESS'
     assert result['result'] == expected_output_path
+
+def test_adjust_task_rerenders_from_session(mocker, output_storage):
+    """With a cached render session, the adjustment re-renders instead of stacking effects."""
+    mock_effects_module = MagicMock()
+    mocker.patch('tasks.effects', mock_effects_module)
+    mock_adjust = mocker.patch('tasks.adjust_audio', side_effect=lambda file_id, output_path, *args, **kwargs: output_path)
+
+    result = adjust_task('/path/to/base.mp3', 'lowpass', {'cutoff': 2000}, 'new_id')
+
+    expected_output_path = output_storage.location('new_id.mp3')
+    mock_adjust.assert_called_once_with('base', expected_output_path, 'lowpass', {'cutoff': 2000}, new_file_id='new_id')
+    mock_effects_module.apply_lowpass.assert_not_called()
+    assert result['result'] == expected_output_path
+
+def test_slushify_task_stores_result_in_cache(mocker):
+    """A finished job is added to the result cache under its key."""
+    mocker.patch('tasks.process_audio', side_effect=lambda i, o, *args, **kwargs: o)
+    mocker.patch('tasks.progress.publish')
+    mock_store = mocker.patch('tasks.result_cache.store')
+    mocker.patch.object(slushify_task, 'update_state')
+
+    result = slushify_task.apply(args=('/nonexistent/in.mp3', 'song.mp3', {'preset': 'lofi'}), kwargs={'cache_key': 'k'}).get()
+
+    mock_store.assert_called_once_with('k', '.mp3', result['result'])
+
+def test_slushify_task_publishes_stage_progress(mocker):
+    """Stage reports from process_audio are pushed to subscribers, ending with SUCCESS."""
+    def fake_process(input_path, output_path, options=None, reference_path=None, progress=None, session_id=None,
+                     content_hash=None):
+        progress('effects', 'Applying effects...', 0.5)
+        return output_path
+    mocker.patch('tasks.process_audio', side_effect=fake_process)
+    mocker.patch('tasks.result_cache.store')
+    mocker.patch.object(slushify_task, 'update_state')
+    mock_publish = mocker.patch('tasks.progress.publish')
+
+    result = slushify_task.apply(args=('/nonexistent/in.mp3', 'song.mp3', {'preset': 'lofi'})).get()
+
+    events = [call.args[1] for call in mock_publish.call_args_list]
+    assert {'state': 'PROGRESS', 'status': 'Applying effects...', 'stage': 'effects', 'progress': 0.5} in events
+    assert events[-1] == {'state': 'SUCCESS', 'status': 'Task completed!', 'result': result['result']}
+
+def test_slushify_task_returns_stage_spans(mocker):
+    def fake_process(input_path, output_path, *args, **kwargs):
+        with spans.span('effects'):
+            pass
+        return output_path
+    mocker.patch('tasks.process_audio', side_effect=fake_process)
+    mocker.patch.object(slushify_task, 'update_state')
+    mocker.patch('tasks.progress.publish')
+
+    result = slushify_task.apply(args=('/nonexistent/in.mp3', 'song.mp3', {'preset': 'lofi'})).get()
+
+    stages = {(span['stage'], span['parent']) for span in result['stages']}
+    assert stages == {
+        ('effects', 'process_audio'), ('process_audio', 'slushify'), ('store', 'slushify'),
+        ('cleanup', 'slushify'), ('slushify', None),
+    }
+    assert all(span['wall_seconds'] >= 0 and span['peak_rss_bytes'] > 0 for span in result['stages'])
+
+def test_cleanup_old_files_evicts_cache(mocker):
+    """The hourly cleanup also runs the result cache eviction."""
+    mocker.patch('os.path.isdir', return_value=True)
+    mocker.patch('os.listdir', return_value=[])
+    mock_evict = mocker.patch('tasks.result_cache.evict', return_value=0)
+    mock_stage_evict = mocker.patch('tasks.stage_cache.evict', return_value=0)
+
+    assert cleanup_old_files(now=1000) == 0
+    mock_evict.assert_called_once_with(now=1000)
+    mock_stage_evict.assert_called_once_with(now=1000)
+
+def test_finished_tasks_are_indexed(mocker, output_storage):
+    mocker.patch('tasks.process_audio', side_effect=lambda i, o, *args, **kwargs: o)
+    mocker.patch('tasks.progress.publish')
+    mocker.patch.object(slushify_task, 'update_state')
+    mocker.patch('tasks.adjust_audio', side_effect=lambda file_id, output_path, *args, **kwargs: output_path)
+
+    result = slushify_task.apply(args=('/nonexistent/in.mp3', 'song.mp3', {'preset': 'lofi'}), task_id='job').get()
+    entry = output_index.get('job')
+    assert entry['path'] == result['result']
+    assert entry['options']['preset'] == 'lofi' and 'lowpass_cutoff' in entry['options']
+
+    adjust_task('/path/to/job.mp3', 'lowpass', {'cutoff': 2000}, 'new_id')
+    entry = output_index.get('new_id')
+    assert entry['path'] == output_storage.location('new_id.mp3')
+    assert entry['options'] == {'adjusts': 'job', 'effect_name': 'lowpass', 'effect_params': {'cutoff': 2000}}
+
+def test_cleanup_sweeps_the_index(mocker, tmp_path):
+    """The hourly run deletes expired indexed outputs without listing the folder."""
+    old, fresh = tmp_path / 'old.mp3', tmp_path / 'fresh.mp3'
+    old.write_bytes(b'x')
+    fresh.write_bytes(b'x')
+    output_index.record('old', str(old), created_at=0)
+    output_index.record('fresh', str(fresh), created_at=5000)
+    mocker.patch('tasks.result_cache.evict', return_value=0)
+    mocker.patch('tasks.stage_cache.evict', return_value=0)
+    mock_listdir = mocker.spy(os, 'listdir')
+
+    assert cleanup_old_files(now=5000) == 1
+
+    assert not old.exists() and fresh.exists()
+    assert output_index.get('old') is None
+    mock_listdir.assert_not_called()
+
+def test_full_scan_removes_unindexed_batch_manifests(mocker, tmp_path):
+    manifest = tmp_path / 'batch_b1.json'
+    manifest.write_text('{}')
+    os.utime(manifest, (0, 0))
+    mocker.patch('tasks.storage.OUTPUT_DIR', str(tmp_path))
+    mocker.patch('tasks.result_cache.evict', return_value=0)
+    mocker.patch('tasks.stage_cache.evict', return_value=0)
+
+    assert cleanup_old_files(now=5000) == 0
+    assert cleanup_old_files(now=5000, full_scan=True) == 1
+    assert not manifest.exists()
+
+def test_slushify_task_encodes_each_format(mocker, output_storage):
+    """The render is encoded to every requested format, with a preview published before the job finishes."""
+    import numpy as np
+    import soundfile as sf
+
+    def fake_process(input_path, output_path, *args, **kwargs):
+        sf.write(output_path, np.zeros((4410, 2)), 44100)
+        return output_path
+    mocker.patch('tasks.process_audio', side_effect=fake_process)
+    mocker.patch.object(slushify_task, 'update_state')
+    mock_publish = mocker.patch('tasks.progress.publish')
+
+    result = slushify_task.apply(
+        args=('/nonexistent/in.wav', 'song.wav', {'preset': 'lofi', 'formats': ['flac', 'mp3:128']}), task_id='job'
+    ).get()
+
+    assert result['result'] == output_storage.location('job.flac')
+    assert [(output['format'], output['result']) for output in result['outputs']] == [
+        ('flac', output_storage.location('job.flac')), ('mp3:128', output_storage.location('job.mp3'))
+    ]
+    assert all(output['bytes'] > 0 for output in result['outputs'])
+    assert result['preview'] == output_storage.location('job.preview.opus')
+    assert os.path.exists(result['preview'])
+    assert output_index.get('job')['path'] == result['result']
+    assert output_index.get('job.mp3')['path'] == output_storage.location('job.mp3')
+
+    events = [call.args[1] for call in mock_publish.call_args_list]
+    preview_event = next(event for event in events if event.get('stage') == 'preview')
+    assert preview_event['preview'] == result['preview']
+    assert events.index(preview_event) < len(events) - 1
+
+def test_preview_job_encodes_no_separate_preview(mocker, output_storage):
+    import numpy as np
+    import soundfile as sf
+
+    def fake_process(input_path, output_path, *args, **kwargs):
+        sf.write(output_path, np.zeros(2205), 22050)
+        return output_path
+    mocker.patch('tasks.process_audio', side_effect=fake_process)
+    mocker.patch.object(slushify_task, 'update_state')
+    mocker.patch('tasks.progress.publish')
+
+    result = slushify_task.apply(
+        args=('/nonexistent/in.wav', 'song.wav', {'preset': 'lofi', 'preview': True, 'formats': ['opus:48']}),
+        task_id='job'
+    ).get()
+
+    assert result['result'] == output_storage.location('job.opus')
+    assert result['preview'] is None
+    assert not os.path.exists(output_storage.location('job.preview.opus'))
+
+def test_route_task_queues(mocker):
+    """Adjustments and previews take the fast lane; style-transfer jobs get their own queue."""
+    mocker.patch('tasks.cost_model.estimate_job', return_value=5.0)
+
+    assert route_task('tasks.adjust_task', ('base.mp3', 'phaser', {}, 'id'), {}, {})['queue'] == 'adjust'
+    assert route_task('tasks.cleanup_old_files', (), {}, {})['queue'] == 'adjust'
+    assert route_task('tasks.slushify_task', ('in.mp3', 'in.mp3', {'preset': 'lofi'}), {}, {})['queue'] == 'slushify'
+    assert route_task('tasks.slushify_task', ('in.mp3', 'in.mp3', {}, 'ref.mp3'), {}, {})['queue'] == 'style_transfer'
+    assert route_task('tasks.slushify_task', ('in.mp3', 'in.mp3'), {'reference_path': 'ref.mp3'}, {})['queue'] == 'style_transfer'
+    assert route_task('tasks.slushify_task', ('in.mp3', 'in.mp3', {'preview': True}, 'ref.mp3'), {}, {})['queue'] == 'adjust'
+
+def test_route_task_priority_follows_cost(mocker):
+    """Cheaper jobs get lower (earlier) Redis priorities."""
+    costs = {'short.mp3': 2.0, 'long.mp3': 400.0}
+    mocker.patch('tasks.cost_model.estimate_job', side_effect=lambda path, options, reference: costs[path])
+
+    short = route_task('tasks.slushify_task', ('short.mp3', 'short.mp3', {}), {}, {})
+    long = route_task('tasks.slushify_task', ('long.mp3', 'long.mp3', {}), {}, {})
+    assert short['priority'] < long['priority']
+
+def test_route_task_without_estimate(mocker):
+    mocker.patch('tasks.cost_model.estimate_job', side_effect=FileNotFoundError)
+    assert route_task('tasks.slushify_task', ('missing.mp3', 'missing.mp3', {}), {}, {}) == {'queue': 'slushify'}
+
+def test_late_acks_outlast_the_longest_job():
+    """An unacknowledged job is only redelivered once it can no longer be running."""
+    from tasks import celery_app
+    conf = celery_app.conf
+    assert conf.task_acks_late
+    assert conf.broker_transport_options['visibility_timeout'] > conf.task_time_limit
@@ -0,0 +1,121 @@
+import hashlib
+import os
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import result_cache
+import uploads
+
+@pytest.fixture
+def upload_dir(upload_folder):
+    return upload_folder
+
+def _wav_bytes(frames=4410):
+    buffer = BytesIO()
+    sf.write(buffer, np.zeros(frames), 44100, format='WAV')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('header, expected', [
+    (b'RIFF\x00\x00\x00\x00WAVE', 'wav'),
+    (b'FORM\x00\x00\x00\x00AIFF', 'aiff'),
+    (b'fLaC\x00\x00\x00\x22\x10\x00\x10\x00', 'flac'),
+    (b'OggS\x00\x02\x00\x00\x00\x00\x00\x00', 'ogg'),
+    (b'ID3\x04\x00\x00\x00\x00\x00\x00\x00\x00', 'mp3'),
+    (b'\xff\xfb\x90\xc4\x00\x00\x00\x00\x00\x00\x00\x00', 'mp3'),
+    (b'\xff\xf1\x50\x80\x02\x1f\xfc\x00\x00\x00\x00\x00', 'aac'),
+    (b'\xff\xf9\x50\x80\x02\x1f\xfc\x00\x00\x00\x00\x00', 'aac'),
+    (b'\x00\x00\x00\x20ftypM4A ', 'mp4'),
+    (b'\x1aE\xdf\xa3\x00\x00\x00\x00\x00\x00\x00\x00', 'webm'),
+    (b'%PDF-1.7\n%\xe2\xe3\xcf\xd3', None),
+    (b'my file cont', None),
+])
+def test_sniff_format(header, expected):
+    assert uploads.sniff_format(header) == expected
+
+def test_upload_is_streamed_into_place_and_hashed(client, upload_dir, mocker):
+    """The task gets the streamed file itself, and the cache key uses the hash taken while streaming."""
+    data = _wav_bytes()
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+    mock_hash_file = mocker.spy(result_cache, 'hash_file')
+    mock_make_key = mocker.spy(result_cache, 'make_key')
+
+    response = client.post('/api/slushify', data={'file': (BytesIO(data), 'song.wav')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    input_path = mock_delay.call_args[0][0]
+    assert os.path.dirname(input_path) == upload_dir
+    with open(input_path, 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(upload_dir) == [os.path.basename(input_path)]
+    assert mock_make_key.call_args[0][0] == hashlib.sha256(data).hexdigest()
+    mock_hash_file.assert_not_called()
+
+def test_non_audio_upload_rejected(client, upload_dir, mocker):
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+
+    response = client.post(
+        '/api/slushify', data={'file': (BytesIO(b'%PDF-1.7\n' * 1000), 'song.mp3')}, content_type='multipart/form-data'
+    )
+
+    assert response.status_code == 415
+    assert response.json['error'] == 'song.mp3 is not a supported audio file.'
+    assert os.listdir(upload_dir) == []
+    mock_delay.assert_not_called()
+
+def test_adts_aac_upload_accepted(client, upload_dir, mocker):
+    """Raw AAC isn't checked with libsndfile, which can't read it; it is decoded like m4a."""
+    mock_delay = mocker.patch('tasks.slushify_task.delay', return_value=MagicMock(id='t1'))
+    frame = b'\xff\xf1\x50\x80\x02\x1f\xfc' + b'\x00' * 9
+
+    response = client.post('/api/slushify', data={'file': (BytesIO(frame * 100), 'song.aac')}, content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    mock_delay.assert_called_once()
+
+def test_corrupt_audio_upload_rejected(client, upload_dir, mocker):
+    """A valid signature isn't enough; libsndfile has to be able to read the header."""
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+    corrupt = b'RIFF\x00\x00\x00\x00WAVE' + b'\x00' * 1000
+
+    response = client.post('/api/slushify', data={'file': (BytesIO(corrupt), 'song.wav')}, content_type='multipart/form-data')
+
+    assert response.status_code == 415
+    assert 'corrupt' in response.json['error']
+    assert os.listdir(upload_dir) == []
+    mock_delay.assert_not_called()
+
+def test_bad_reference_removes_the_input(client, upload_dir, mocker):
+    mocker.patch('tasks.slushify_task.delay')
+    form_data = {
+        'file': (BytesIO(_wav_bytes()), 'song.wav'),
+        'reference_file': (BytesIO(b'RIFF\x00\x00\x00\x00WAVE' + b'\x00' * 100), 'ref.wav'),
+    }
+
+    response = client.post('/api/slushify', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 415
+    assert os.listdir(upload_dir) == []
+
+def test_oversized_upload_cut_off(app, client, upload_dir, mocker):
+    mocker.patch.dict(app.config, {'MAX_UPLOAD_BYTES': 1000})
+    mock_delay = mocker.patch('tasks.slushify_task.delay')
+
+    response = client.post('/api/slushify', data={'file': (BytesIO(_wav_bytes()), 'song.wav')}, content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert os.listdir(upload_dir) == []
+    mock_delay.assert_not_called()
+
+def test_batch_with_bad_file_rejected(client, upload_dir, mocker):
+    mock_group = mocker.patch('app.group')
+    form_data = {'files': [(BytesIO(_wav_bytes()), 'a.wav'), (BytesIO(b'not audio at all'), 'b.mp3')]}
+
+    response = client.post('/api/batch', data=form_data, content_type='multipart/form-data')
+
+    assert response.status_code == 415
+    assert os.listdir(upload_dir) == []
+    mock_group.assert_not_called()
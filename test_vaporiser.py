@@ -0,0 +1,23 @@
+import pytest
+
+import vaporiser
+
+def test_batch_outputs_keep_extensions_apart_for_shared_stems(tmp_path):
+    inputs = [str(tmp_path / name) for name in ('intro.mp3', 'track.flac', 'track.wav')]
+
+    assert vaporiser.batch_outputs(inputs) == [
+        str(tmp_path / 'intro_vaporised.mp3'),
+        str(tmp_path / 'track.flac_vaporised.mp3'),
+        str(tmp_path / 'track.wav_vaporised.mp3'),
+    ]
+    # The outputs aren't picked up as inputs on the next run.
+    for name in ('track.wav', 'track.wav_vaporised.mp3'):
+        (tmp_path / name).write_bytes(b'')
+    assert vaporiser.find_audio_files(str(tmp_path)) == [str(tmp_path / 'track.wav')]
+
+def test_batch_outputs_reject_inputs_that_still_collide(tmp_path):
+    inputs = [str(tmp_path / 'a' / 'track.wav'), str(tmp_path / 'b' / 'track.wav')]
+
+    assert len(set(vaporiser.batch_outputs(inputs))) == 2
+    with pytest.raises(ValueError):
+        vaporiser.batch_outputs(inputs, output_dir=str(tmp_path / 'out'))
@@ -0,0 +1,172 @@
+# uploads.py
+"""
+Streamed, validated uploads.
+
+Werkzeug's multipart parser normally spools each file part to a temporary
+file, which the view then copies into the upload folder with file.save().
+UploadRequest hands the parser an UploadSpool instead. The spool writes the
+parser's chunks directly into the upload folder and hashes them as they arrive.
+It enforces MAX_UPLOAD_BYTES and checks the first bytes against known audio
+containers. Oversized and non-audio parts are rejected while the request is
+still being read. save() then checks that libsndfile can read the header and
+moves the spool into place, without copying.
+
+Spools are deleted when the request closes, unless save() has claimed them.
+"""
+import hashlib
+import os
+import uuid
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+import result_cache
+
+# Enough for every signature below.
+SNIFF_BYTES = 12
+
+# Containers libsndfile decodes, so their headers are also checked with sf.info.
+# MP4/M4A, raw AAC (ADTS) and WebM are decoded through audioread/ffmpeg, so only their signature is checked.
+SOUNDFILE_FORMATS = {'wav', 'aiff', 'flac', 'ogg', 'mp3'}
+
+def sniff_format(header):
+    """Returns the audio container identified by a file's first bytes, or None."""
+    if header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xF6 == 0xF0:
+        # An ADTS frame sync: 12 set bits, then layer 0, which MPEG audio reserves.
+        return 'aac'
+    if header[:3] == b'ID3' or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        # An ID3 tag or an MPEG audio frame sync.
+        return 'mp3'
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    if header[:4] == b'\x1aE\xdf\xa3':
+        return 'webm'
+    return None
+
+def validate(path, filename, audio_format=None):
+    """
+    Raises UnsupportedMediaType unless path holds a readable audio file.
+    Returns the container format.
+    """
+    import soundfile as sf
+    if audio_format is None:
+        with open(path, 'rb') as f:
+            audio_format = sniff_format(f.read(SNIFF_BYTES))
+    if audio_format is None:
+        raise UnsupportedMediaType(f"{filename} is not a supported audio file.")
+    if audio_format in SOUNDFILE_FORMATS:
+        try:
+            info = sf.info(path)
+        except RuntimeError:
+            raise UnsupportedMediaType(f"{filename} is corrupt or unreadable.")
+        if info.frames == 0:
+            raise UnsupportedMediaType(f"{filename} contains no audio.")
+    return audio_format
+
+class UploadSpool:
+    """Writable, readable file part that lives in the upload folder from its first byte."""
+
+    def __init__(self, upload_dir, max_bytes, filename=None):
+        os.makedirs(upload_dir, exist_ok=True)
+        self.path = os.path.join(upload_dir, f".part_{uuid.uuid4()}")
+        self.filename = filename or 'upload'
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.format = None
+        self._file = open(self.path, 'w+b')
+        self._digest = hashlib.sha256()
+        self._header = b''
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.discard()
+            raise RequestEntityTooLarge(f"{self.filename} is larger than {self.max_bytes} bytes.")
+        if len(self._header) < SNIFF_BYTES:
+            self._header += data[:SNIFF_BYTES - len(self._header)]
+            if len(self._header) == SNIFF_BYTES:
+                self._sniff()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def _sniff(self):
+        self.format = sniff_format(self._header)
+        if self.format is None:
+            self.discard()
+            raise UnsupportedMediaType(f"{self.filename} is not a supported audio file.")
+
+    def hexdigest(self):
+        """SHA-256 of everything written, as result_cache.hash_file() would compute it."""
+        return self._digest.hexdigest()
+
+    def save(self, dest_path):
+        """Validates the complete file and moves it to dest_path."""
+        if self.format is None:
+            # Shorter than the signatures; no audio file is.
+            self._sniff()
+        self._file.close()
+        try:
+            validate(self.path, self.filename, self.format)
+        except UnsupportedMediaType:
+            self.discard()
+            raise
+        os.replace(self.path, dest_path)
+        self.path = None
+
+    def discard(self):
+        self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def close(self):
+        self.discard()
+
+    def __getattr__(self, name):
+        # read/seek/tell/etc., as the parser and FileStorage expect of a file.
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Streams file parts into the app's UPLOAD_FOLDER, capped at MAX_UPLOAD_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool(
+            current_app.config['UPLOAD_FOLDER'], current_app.config['MAX_UPLOAD_BYTES'], filename
+        )
+        self.__dict__.setdefault('_upload_spools', []).append(spool)
+        return spool
+
+    def close(self):
+        super().close()
+        # Also covers parts left behind when a later part was rejected mid-parse.
+        for spool in self.__dict__.get('_upload_spools', ()):
+            spool.discard()
+
+def save(file_storage, dest_path):
+    """
+    Moves an uploaded file to dest_path after validating it. Returns its
+    SHA-256, which was computed while the upload was streamed.
+    """
+    spool = file_storage.stream
+    if isinstance(spool, UploadSpool):
+        spool.save(dest_path)
+        return spool.hexdigest()
+    # Parsed by a plain Request: copy, then validate and hash from disk.
+    file_storage.save(dest_path)
+    try:
+        validate(dest_path, file_storage.filename)
+    except UnsupportedMediaType:
+        os.remove(dest_path)
+        raise
+    return result_cache.hash_file(dest_path)
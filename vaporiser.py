@@ -1,13 +1,224 @@
 #!/usr/bin/env python
 
-# Loading modules
+# Loading modules. moviepy and skimage are imported by the video functions
+# that use them, so audio-only runs don't pay for them.
 from pysndfx import AudioEffectsChain
-from skimage.filters import sobel
-import moviepy.editor as movedit
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import argparse
 import datetime
+import json
+import os
 import sys
 import re
+import subprocess
+import time
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg")
+
+
+def build_fx(args):
+    """Builds the audio effects chain selected by the command line arguments."""
+    # Creating an audio effects chain, beginning with...
+    if args.bass_boost:
+        # ...bass boost effect
+        bass_boost = f'{"bass "}{args.bass_boost}'
+        fx = AudioEffectsChain().custom(bass_boost)
+        fx = fx.pitch(args.pitch_shift)
+    else:
+        # ...pitch shift
+        fx = AudioEffectsChain().pitch(args.pitch_shift)
+
+    # Adding OOPS to audio effects chain
+    if args.oops:
+        fx = fx.custom("oops")
+
+    # Adding tremolo effect to the audio effects chain
+    if args.tremolo:
+        fx = fx.tremolo(freq=500, depth=50)
+
+    # Adding phaser to the audio effects chain
+    if args.phaser:
+        # fx.phaser(gain_in, gain_out, delay, decay, speed)
+        fx = fx.phaser(0.9, 0.8, 2, 0.2, 0.5)
+
+    # Adding gain to the audio effects chain
+    if args.gain_db is not None:
+        fx = fx.gain(db=args.gain_db)
+
+    # Adding compand to the audio effects chain
+    if args.compand:
+        fx = fx.compand()
+
+    # Adding lowpass filter, speed alteration to audio effects chain
+    fx = fx.speed(args.speed_ratio).lowpass(args.lowpass_cutoff)
+
+    if args.no_reverb is False:
+        # Adding reverb to audio effects chain
+        fx = fx.reverb()
+    return fx
+
+
+def vaporise_file(fx, audio_input, audio_output):
+    """Applies the effects chain to one file. Returns a manifest entry."""
+    start = time.perf_counter()
+    entry = {"input": audio_input, "output": audio_output}
+    try:
+        fx(audio_input, audio_output)
+        entry["status"] = "ok"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e)
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def find_audio_files(directory):
+    """Lists the audio files directly inside directory."""
+    paths = (os.path.join(directory, name) for name in os.listdir(directory))
+    return sorted(
+        p for p in paths if os.path.isfile(p) and p.lower().endswith(AUDIO_EXTENSIONS)
+        and not os.path.splitext(p)[0].endswith("_vaporised")
+    )
+
+
+def batch_outputs(inputs, output_dir=None):
+    """
+    Output path for each input: <stem>_vaporised.mp3, or <name>_vaporised.mp3
+    (keeping the extension) when inputs like track.wav and track.flac would
+    otherwise share it. Raises ValueError if two inputs still map to one output.
+    """
+    def target_dir(audio_input):
+        return output_dir or os.path.dirname(audio_input)
+
+    stems = Counter(
+        (target_dir(p), os.path.splitext(os.path.basename(p))[0]) for p in inputs
+    )
+    outputs = {}
+    for audio_input in inputs:
+        name = os.path.basename(audio_input)
+        stem = os.path.splitext(name)[0]
+        if stems[(target_dir(audio_input), stem)] == 1:
+            name = stem
+        audio_output = os.path.join(target_dir(audio_input), name + "_vaporised.mp3")
+        if audio_output in outputs:
+            raise ValueError(f"{outputs[audio_output]} and {audio_input} would both be written to {audio_output}")
+        outputs[audio_output] = audio_input
+    return list(outputs)
+
+
+def vaporise_batch(fx, inputs, output_dir=None, jobs=None):
+    """
+    Vaporises many files on a process pool, so the interpreter and imports are
+    paid once per worker rather than once per file. Prints aggregate progress
+    and returns the manifest entries in input order.
+    """
+    tasks = list(zip(inputs, batch_outputs(inputs, output_dir)))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    entries = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(vaporise_file, fx, audio_input, audio_output): audio_input
+            for audio_input, audio_output in tasks
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            entries[futures[future]] = entry
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{done}/{len(tasks)}] {entry['status']}: {entry['input']}"
+                f" ({done / elapsed * 60:.1f} files/min)"
+            )
+    return [entries[audio_input] for audio_input, _output in tasks]
+
+
+def sobel_frame(frame):
+    """Sobel-filtered frame, as the uint8 the video encoder would receive."""
+    from skimage.filters import sobel
+    return sobel(frame.astype(float)).astype(np.uint8)
+
+
+def precompute_sobel_frames(gif_clip, jobs=None):
+    """
+    Applies the Sobel filter once per unique GIF frame, in parallel, and returns
+    the filtered frames as one compact uint8 array of shape (frames, h, w, 3).
+    """
+    frames = list(gif_clip.iter_frames(dtype="uint8"))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        filtered = list(pool.map(sobel_frame, frames, chunksize=max(1, len(frames) // 32)))
+    return np.stack(filtered)
+
+
+def looped_frames_clip(frames, fps, duration):
+    """A clip that replays precomputed frames in a loop for the given duration."""
+    import moviepy.editor as movedit
+    cycle = len(frames) / fps
+
+    def make_frame(t):
+        # Same frame lookup as the GIF reader, wrapped like clip.loop().
+        return frames[int(fps * (t % cycle) + 0.00001) % len(frames)]
+
+    return movedit.VideoClip(make_frame, duration=duration).set_fps(fps)
+
+
+def mux_looped_video(cycle_video, audio_file, video_output):
+    """
+    Stream-loops an encoded video cycle to the audio length and muxes in the
+    audio, copying both streams instead of re-encoding them.
+    """
+    from moviepy.config import get_setting
+    command = [
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-stream_loop", "-1", "-i", cycle_video,
+        "-i", audio_file,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy", "-shortest",
+        video_output,
+    ]
+    subprocess.run(command, check=True)
+
+
+def render_video(
+    audio_output, gif_file, video_output, sobel_filter=False, jobs=None,
+    fast=False, threads=None, preset="medium",
+):
+    """
+    Loops the GIF for the length of the vaporised audio and writes the MP4.
+    In fast mode only one cycle of the GIF is encoded; it is then looped by
+    the muxer, so export time no longer grows with the track length.
+    """
+    import moviepy.editor as movedit
+    mp3_movedit = movedit.AudioFileClip(audio_output)
+    gif_movedit = movedit.VideoFileClip(gif_file)
+    duration = gif_movedit.duration if fast else mp3_movedit.duration
+    if sobel_filter:
+        # Filter each unique GIF frame once, then replay the cached frames.
+        frames = precompute_sobel_frames(gif_movedit, jobs)
+        gif_looped = looped_frames_clip(frames, gif_movedit.fps, duration)
+    elif fast:
+        gif_looped = gif_movedit
+    else:
+        number_of_loops = float(mp3_movedit.duration / gif_movedit.duration)
+        gif_looped = gif_movedit.loop(number_of_loops)
+
+    if not fast:
+        gif_looped_with_audio = gif_looped.set_audio(mp3_movedit)
+        gif_looped_with_audio.write_videofile(video_output, threads=threads, preset=preset)
+        return
+
+    cycle_video = os.path.splitext(video_output)[0] + "_cycle.mp4"
+    try:
+        gif_looped.write_videofile(
+            cycle_video, fps=gif_movedit.fps, audio=False, threads=threads, preset=preset
+        )
+        mux_looped_video(cycle_video, audio_output, video_output)
+    finally:
+        if os.path.exists(cycle_video):
+            os.remove(cycle_video)
 
 
 def main():
@@ -34,13 +245,50 @@ def main():
 
     required_arguments = parser.add_argument_group("required arguments")
 
-    required_arguments.add_argument(
+    input_arguments = required_arguments.add_mutually_exclusive_group(required=True)
+
+    input_arguments.add_argument(
         "-a",
         "--audio",
         dest="audio_input",
         help="Input audio file to vaporise (.mp3)",
         type=str,
-        required=True,
+    )
+
+    input_arguments.add_argument(
+        "-d",
+        "--directory",
+        dest="audio_directory",
+        help=(
+            "Batch mode: vaporise every audio file in this directory. Outputs go to"
+            " the --output directory if given, otherwise next to the inputs."
+        ),
+        type=str,
+    )
+
+    batch_arguments = parser.add_argument_group(
+        "batch arguments", "these arguments apply to batch mode (--directory)"
+    )
+
+    batch_arguments.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        help=(
+            "Number of worker processes, for files in batch mode or GIF frames with"
+            " --sobel (default: number of CPUs)."
+        ),
+        type=int,
+        default=None,
+    )
+
+    batch_arguments.add_argument(
+        "-m",
+        "--manifest",
+        dest="manifest",
+        help="Where to write the JSON manifest of outputs (default: manifest.json in the output directory).",
+        type=str,
+        default=None,
     )
 
     audio_arguments = parser.add_argument_group(
@@ -166,8 +414,57 @@ def main():
         action="store_true",
     )
 
+    video_arguments.add_argument(
+        "-fv",
+        "--fast-video",
+        dest="fast_video",
+        help=(
+            "Encodes one cycle of the GIF and loops it while muxing in the audio,"
+            " instead of re-encoding every frame of the full-length video."
+        ),
+        action="store_true",
+    )
+
+    video_arguments.add_argument(
+        "--threads",
+        dest="threads",
+        help="Number of encoder threads (default: chosen by ffmpeg).",
+        type=int,
+        default=None,
+    )
+
+    video_arguments.add_argument(
+        "--preset",
+        dest="preset",
+        help="x264 encoder preset, from 'ultrafast' to 'placebo'; faster presets give bigger files.",
+        type=str,
+        default="medium",
+    )
+
     args = parser.parse_args()
 
+    fx = build_fx(args)
+
+    if args.audio_directory is not None:
+        if args.gif_file is not None:
+            print("ERROR: Batch mode only creates audio; --gif is not supported")
+            sys.exit(1)
+        inputs = find_audio_files(args.audio_directory)
+        try:
+            manifest = vaporise_batch(fx, inputs, args.output_name, args.jobs)
+        except ValueError as e:
+            print("ERROR:", e)
+            sys.exit(1)
+        manifest_path = args.manifest or os.path.join(
+            args.output_name or args.audio_directory, "manifest.json"
+        )
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        failed = sum(entry["status"] != "ok" for entry in manifest)
+        print("Script finished at", datetime.datetime.now().strftime("%H:%M:%S"))
+        print(f"Vaporised {len(manifest) - failed} of {len(manifest)} files, manifest:", manifest_path)
+        sys.exit(1 if failed else 0)
+
     # Setting name of output file
     if args.output_name is None:
         # If no output name is given, add "_vaporised" to input audio file name
@@ -184,51 +481,9 @@ def main():
             print("ERROR: Input and output name are identical")
             sys.exit()
 
-    # Creating an audio effects chain, beginning with...
-    if args.bass_boost:
-        # ...bass boost effect
-        bass_boost = f'{"bass "}{args.bass_boost}'
-        fx = AudioEffectsChain().custom(bass_boost)
-        fx = fx.pitch(args.pitch_shift)
-    else:
-        # ...pitch shift
-        fx = AudioEffectsChain().pitch(args.pitch_shift)
-
-    # Adding OOPS to audio effects chain
-    if args.oops:
-        fx = fx.custom("oops")
-
-    # Adding tremolo effect to the audio effects chain
-    if args.tremolo:
-        fx = fx.tremolo(freq=500, depth=50)
-
-    # Adding phaser to the audio effects chain
-    if args.phaser:
-        # fx.phaser(gain_in, gain_out, delay, decay, speed)
-        fx = fx.phaser(0.9, 0.8, 2, 0.2, 0.5)
-
-    # Adding gain to the audio effects chain
-    if args.gain_db is not None:
-        fx = fx.gain(db=args.gain_db)
-
-    # Adding compand to the audio effects chain
-    if args.compand:
-        fx = fx.compand()
-
-    # Adding lowpass filter, speed alteration to audio effects chain
-    fx = fx.speed(args.speed_ratio).lowpass(args.lowpass_cutoff)
-
-    if args.no_reverb is False:
-        # Adding reverb to audio effects chain
-        fx = fx.reverb()
-
     # Applying audio effects
     fx(args.audio_input, audio_output)
 
-    def apply_sobel(image):
-        # returns image with Sobel filter applied
-        return sobel(image.astype(float))
-
     # Create video if a GIF file is provided
     if args.gif_file is None:
         # If no GIF is provided, exit here
@@ -236,16 +491,12 @@ def main():
         print("Vaporised MP3 file (audio):", audio_output)
         sys.exit()
     else:
-        # If a GIF is provided, loop it for the length of the vaporised audio file
-        mp3_movedit = movedit.AudioFileClip(audio_output)
-        gif_movedit = movedit.VideoFileClip(args.gif_file)
-        number_of_loops = float(mp3_movedit.duration / gif_movedit.duration)
-        gif_looped = gif_movedit.loop(number_of_loops)
-        # Applies Sobel filter to looped GIF, if --sobel is used
-        if args.sobel_filter:
-            gif_looped = gif_looped.fl_image(apply_sobel)
-        gif_looped_with_audio = gif_looped.set_audio(mp3_movedit)
-        gif_looped_with_audio.write_videofile(video_output)
+        # If a GIF is provided, loop it for the length of the vaporised audio file,
+        # applying a Sobel filter if --sobel is used
+        render_video(
+            audio_output, args.gif_file, video_output, args.sobel_filter, args.jobs,
+            fast=args.fast_video, threads=args.threads, preset=args.preset,
+        )
         print("Script finished at", datetime.datetime.now().strftime("%H:%M:%S"))
         print("Vaporised MP3 file (audio):", audio_output)
         print("Vaporised MP4 file (video):", video_output)